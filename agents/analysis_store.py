@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+from config import settings
+from models import VisionAnalysisResult, MedicalAssessment, NutritionPlan
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    vision TEXT NOT NULL,
+    medical TEXT,
+    user_notes TEXT,
+    nutrition TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_updated ON analyses (updated_at);
+"""
+
+class AnalysisNotFound(Exception):
+    """Raised when an analysis id is unknown or has expired"""
+    pass
+
+class StoredAnalysis:
+    """Pipeline results for one image, filled in as stages complete"""
+
+    __slots__ = ("analysis_id", "vision", "medical", "user_notes", "nutrition", "updated_at")
+
+    def __init__(self, analysis_id: str, vision: VisionAnalysisResult,
+                 medical: Optional[MedicalAssessment] = None, user_notes: Optional[str] = None,
+                 nutrition: Optional[NutritionPlan] = None, updated_at: float = None):
+        self.analysis_id = analysis_id
+        self.vision = vision
+        self.medical = medical
+        # Notes the medical assessment was made with; other notes need a fresh assessment
+        self.user_notes = user_notes
+        self.nutrition = nutrition
+        self.updated_at = updated_at or time.time()
+
+    def medical_for(self, user_notes: Optional[str]) -> Optional[MedicalAssessment]:
+        """Stored assessment if it was made with the same notes (no notes reuses any)"""
+        if self.medical is None or (user_notes is not None and user_notes != self.user_notes):
+            return None
+        return self.medical
+
+class AnalysisStore:
+    """LRU + TTL store of analysis results keyed by the id /analyze and /vision/analyze return.
+
+    Lets /medical/assess and /nutrition/plan start from an earlier vision
+    result (and medical assessment) instead of re-running the pipeline.
+    With ``analysis_store_path`` set, results live in SQLite instead of
+    memory, so ids survive restarts and every worker on the same disk reads
+    the latest row; later stages only write their own columns.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, path: Optional[str] = None):
+        self.max_entries = max_entries or settings.analysis_store_max_entries
+        self.ttl_seconds = ttl_seconds or settings.analysis_store_ttl_seconds
+        self.path = path or settings.analysis_store_path
+
+        self._entries: "OrderedDict[str, StoredAnalysis]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def _dump(model) -> Optional[str]:
+        return model.model_dump_json() if model is not None else None
+
+    def _insert(self, entry: StoredAnalysis):
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO analyses (id, vision, medical, user_notes, nutrition, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (entry.analysis_id, self._dump(entry.vision), self._dump(entry.medical), entry.user_notes,
+             self._dump(entry.nutrition), entry.updated_at)
+        )
+        # Same limits as in memory: drop expired rows and the least recently updated beyond max_entries
+        expired = conn.execute("DELETE FROM analyses WHERE updated_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+        evicted = conn.execute(
+            "DELETE FROM analyses WHERE id IN (SELECT id FROM analyses ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        self.evictions += expired + evicted
+
+    def _load(self, analysis_id: str) -> Optional[StoredAnalysis]:
+        row = self._connect().execute(
+            "SELECT vision, medical, user_notes, nutrition, updated_at FROM analyses WHERE id = ?",
+            (analysis_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        vision, medical, user_notes, nutrition, updated_at = row
+        return StoredAnalysis(
+            analysis_id,
+            VisionAnalysisResult.model_validate_json(vision),
+            MedicalAssessment.model_validate_json(medical) if medical else None,
+            user_notes,
+            NutritionPlan.model_validate_json(nutrition) if nutrition else None,
+            updated_at
+        )
+
+    def create(self, vision: VisionAnalysisResult, medical: Optional[MedicalAssessment] = None,
+               user_notes: Optional[str] = None, nutrition: Optional[NutritionPlan] = None) -> str:
+        """Store the results of a run and return its new analysis id"""
+        entry = StoredAnalysis(uuid.uuid4().hex, vision, medical, user_notes, nutrition)
+        if self.path:
+            self._insert(entry)
+            return entry.analysis_id
+
+        self._entries[entry.analysis_id] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry.analysis_id
+
+    def get(self, analysis_id: str) -> StoredAnalysis:
+        """Stored results for an id; raises AnalysisNotFound if unknown or expired"""
+        entry = self._load(analysis_id) if self.path else self._entries.get(analysis_id)
+        if entry is None or time.time() - entry.updated_at > self.ttl_seconds:
+            self.discard(analysis_id)
+            self.misses += 1
+            raise AnalysisNotFound(analysis_id)
+
+        if not self.path:
+            self._entries.move_to_end(analysis_id)
+        self.hits += 1
+        return entry
+
+    def update(self, entry: StoredAnalysis, medical: Optional[MedicalAssessment] = None,
+               user_notes: Optional[str] = None, nutrition: Optional[NutritionPlan] = None):
+        """Record a later stage's result; a different medical assessment invalidates the old plan.
+
+        A plan is only kept if the stored assessment is still the one it was
+        made from, so a worker cannot attach it to another worker's newer one.
+        """
+        based_on = self._dump(entry.medical)
+        entry.updated_at = time.time()
+        if medical is not None:
+            if medical != entry.medical:
+                entry.nutrition = None
+            entry.medical = medical
+            entry.user_notes = user_notes
+        if nutrition is not None:
+            entry.nutrition = nutrition
+
+        if not self.path:
+            return
+        conn = self._connect()
+        if medical is not None:
+            conn.execute(
+                "UPDATE analyses SET nutrition = CASE WHEN medical IS ? THEN nutrition ELSE NULL END, "
+                "medical = ?, user_notes = ?, updated_at = ? WHERE id = ?",
+                (self._dump(medical), self._dump(medical), user_notes, entry.updated_at, entry.analysis_id)
+            )
+            based_on = self._dump(medical)
+        if nutrition is not None:
+            conn.execute(
+                "UPDATE analyses SET nutrition = ?, updated_at = ? WHERE id = ? AND medical IS ?",
+                (self._dump(nutrition), entry.updated_at, entry.analysis_id, based_on)
+            )
+
+    def discard(self, analysis_id: str):
+        if self.path:
+            self._connect().execute("DELETE FROM analyses WHERE id = ?", (analysis_id,))
+        else:
+            self._entries.pop(analysis_id, None)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        if self.path:
+            entries = self._connect().execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        else:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "persistent": bool(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+# Singleton instance
+analysis_store = AnalysisStore()
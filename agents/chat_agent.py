@@ -1,13 +1,26 @@
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, AsyncIterator, NamedTuple, Tuple
 from models import ChatMessage, ChatRequest, ChatResponse
 from config import settings
+from llm_client import llm_client
+from llm_scheduler import Priority
+from chat_prompt import ChatPromptBuilder
+from chat_sessions import chat_session_store, SessionNotFound
+from keyword_matcher import keyword_matcher
+from knowledge_base import knowledge_base
+
+class ChatTurn(NamedTuple):
+    prompt: str
+    llm_context: Optional[List[int]]  # Ollama token state from the previous turn
+    message_count: int  # Messages in the conversation before this turn
+    user_message: str
+    session_id: Optional[str]  # Routes the conversation to the same LLM backend
 
 class PetWhispererAgent:
     def __init__(self):
         self.llm_provider = settings.llm_provider
         self.ollama_base_url = settings.ollama_base_url
         self.ollama_model = settings.ollama_model
+        self.prompt_builder = ChatPromptBuilder(knowledge=knowledge_base if settings.knowledge_enabled else None)
         
         self.system_prompt = """You are the Pet Whisperer, a compassionate and knowledgeable AI assistant specializing in animal psychology, behavior, and emotional wellbeing. You help people understand their pets and stray animals better.
 
@@ -43,27 +56,27 @@ Always prioritize the animal's welfare and emotional health. Give voice to those
         """Generate follow-up suggestions based on the conversation"""
         suggestions = []
         
-        message_lower = message.lower()
+        hits = keyword_matcher.match(message)
         
-        if any(word in message_lower for word in ['scared', 'afraid', 'fear', 'anxious']):
+        if "suggest.fear" in hits:
             suggestions = [
                 "How can I help my pet feel safer?",
                 "What are signs of anxiety in animals?",
                 "How long does it take for a scared animal to calm down?"
             ]
-        elif any(word in message_lower for word in ['aggressive', 'biting', 'attacking']):
+        elif "suggest.aggression" in hits:
             suggestions = [
                 "Is this aggression or fear-based behavior?",
                 "How should I approach an aggressive animal?",
                 "What triggers aggressive behavior?"
             ]
-        elif any(word in message_lower for word in ['stray', 'rescue', 'trust']):
+        elif "suggest.stray" in hits:
             suggestions = [
                 "What food should I offer to a stray?",
                 "How do I approach a stray animal safely?",
                 "What are the signs a stray is starting to trust me?"
             ]
-        elif any(word in message_lower for word in ['barking', 'meowing', 'noise', 'vocal']):
+        elif "suggest.vocal" in hits:
             suggestions = [
                 "What is my pet trying to communicate?",
                 "How can I reduce excessive vocalization?",
@@ -78,70 +91,110 @@ Always prioritize the animal's welfare and emotional health. Give voice to those
         
         return suggestions[:3]
     
-    async def get_llm_response(self, messages: List[Dict[str, str]], context: Optional[Dict[str, Any]] = None) -> str:
-        """Get response from Ollama (free local LLM) with RAG context"""
+    def build_prompt(self, messages: List[Dict[str, str]], context: Optional[Dict[str, Any]] = None) -> str:
+        """Format conversation for Ollama with RAG context, bounded by the prompt token budget"""
+        return self.prompt_builder.build(self.system_prompt, messages, context)
+    
+    def prepare_turn(self, request: ChatRequest) -> ChatTurn:
+        """Decide what to send to Ollama for this turn.
+        
+        With a live session only the new user message is sent together with the
+        stored Ollama context; otherwise the full conversation is rebuilt.
+        """
+        session = chat_session_store.get(request.session_id) if request.session_id else None
+        
+        # A session is only reused if it has seen exactly the history the caller has
+        if session is not None and (request.history_omitted or len(request.history) == session.message_count):
+            return ChatTurn(
+                prompt=f"{self.prompt_builder.build_knowledge_block(request.message)}USER: {request.message}\nASSISTANT:",
+                llm_context=list(session.context),
+                message_count=session.message_count,
+                user_message=request.message,
+                session_id=request.session_id
+            )
+        
+        if request.history_omitted:
+            raise SessionNotFound(request.session_id)
+        
+        messages = self.build_messages(request)
+        return ChatTurn(
+            prompt=self.build_prompt(messages, request.context),
+            llm_context=None,
+            message_count=len(request.history),
+            user_message=request.message,
+            session_id=request.session_id
+        )
+    
+    def remember_turn(self, session_id: Optional[str], turn: ChatTurn, llm_context: Optional[List[int]]):
+        """Store Ollama's context after a turn, or drop the session if the LLM failed"""
+        if not session_id:
+            return
+        if llm_context:
+            chat_session_store.save(session_id, llm_context, turn.message_count + 2)
+        else:
+            chat_session_store.discard(session_id)
+    
+    async def get_llm_response(self, turn: ChatTurn) -> Tuple[str, Optional[List[int]]]:
+        """Get response from Ollama (free local LLM) plus its updated context"""
         try:
-            # Format conversation for Ollama with RAG context
-            full_prompt = f"{self.system_prompt}\n\n"
-            
-            # Add RAG context if provided
-            if context:
-                full_prompt += "=== ANALYSIS CONTEXT (Use this to provide specific, personalized advice) ===\n"
-                if 'species' in context:
-                    full_prompt += f"Animal Species: {context['species']}\n"
-                if 'emotionalState' in context:
-                    full_prompt += f"Current Emotional State: {context['emotionalState']}\n"
-                if 'severity' in context:
-                    full_prompt += f"Medical Severity: {context['severity']}\n"
-                if 'conditionSummary' in context:
-                    full_prompt += f"Health Summary: {context['conditionSummary']}\n"
-                if 'healthIssues' in context and context['healthIssues']:
-                    full_prompt += f"Detected Health Issues: {', '.join(context['healthIssues'])}\n"
-                if 'immediateActions' in context and context['immediateActions']:
-                    full_prompt += f"Recommended Actions: {'; '.join(context['immediateActions'][:3])}\n"
-                if 'nutritionPlan' in context and context['nutritionPlan']:
-                    nutrition = context['nutritionPlan']
-                    if 'recommendedFoods' in nutrition:
-                        full_prompt += f"Safe Foods: {', '.join(nutrition['recommendedFoods'][:5])}\n"
-                    if 'dangerousFoods' in nutrition:
-                        full_prompt += f"Dangerous Foods: {', '.join(nutrition['dangerousFoods'][:5])}\n"
-                full_prompt += "=== END CONTEXT ===\n\n"
-                full_prompt += "IMPORTANT: Reference the above analysis when answering. Be specific to THIS animal's condition.\n\n"
-            
-            for msg in messages:
-                full_prompt += f"{msg['role'].upper()}: {msg['content']}\n"
-            full_prompt += "ASSISTANT:"
+            payload = {"context": turn.llm_context} if turn.llm_context else {}
             
             # Call Ollama API
-            response = requests.post(
-                f"{self.ollama_base_url}/api/generate",
-                json={
-                    "model": self.ollama_model,
-                    "prompt": full_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.8,
-                        "num_predict": 800
-                    }
+            result = await llm_client.generate(
+                turn.prompt,
+                options={
+                    "temperature": 0.8,
+                    "num_predict": 800
                 },
-                timeout=60
+                priority=Priority.CHAT,
+                sticky_key=turn.session_id,
+                **payload
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "")
+            if result is not None:
+                return result.get("response", ""), result.get("context")
             else:
-                return self.generate_fallback_response(messages[-1]['content'])
+                return self.generate_fallback_response(turn.user_message), None
         
         except Exception as e:
             print(f"Chat LLM Error: {e}")
-            return self.generate_fallback_response(messages[-1]['content'])
+            return self.generate_fallback_response(turn.user_message), None
+    
+    async def stream_llm_response(self, turn: ChatTurn, final: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream response tokens from Ollama as they are generated.
+        
+        The context from Ollama's final chunk is placed in ``final["context"]``.
+        """
+        payload = {"context": turn.llm_context} if turn.llm_context else {}
+        produced = False
+        
+        async for chunk in llm_client.stream_generate(
+            turn.prompt,
+            options={
+                "temperature": 0.8,
+                "num_predict": 800
+            },
+            priority=Priority.CHAT,
+            sticky_key=turn.session_id,
+            **payload
+        ):
+            token = chunk.get("response", "")
+            if token:
+                produced = True
+                yield token
+            if chunk.get("done"):
+                final["context"] = chunk.get("context")
+        
+        # Nothing came back from Ollama: send the fallback as a single chunk
+        if not produced:
+            final["context"] = None
+            yield self.generate_fallback_response(turn.user_message)
     
     def generate_fallback_response(self, user_message: str) -> str:
         """Generate a helpful fallback response"""
-        message_lower = user_message.lower()
+        hits = keyword_matcher.match(user_message)
         
-        if 'scared' in message_lower or 'afraid' in message_lower:
+        if "fallback.scared" in hits:
             return """When an animal is scared, it's usually due to past trauma, unfamiliar situations, or feeling threatened. Here's what you can do:
 
 1. **Create a safe space**: Give them a quiet area where they can retreat
@@ -152,7 +205,7 @@ Always prioritize the animal's welfare and emotional health. Give voice to those
 
 Remember, patience is key. Some animals need weeks or months to fully overcome their fears. Never punish a scared animal - it will only make things worse."""
         
-        elif 'trust' in message_lower and 'stray' in message_lower:
+        elif "fallback.trust" in hits and "fallback.stray" in hits:
             return """Building trust with a stray animal takes patience and consistency:
 
 1. **Start at a distance**: Don't approach directly at first
@@ -165,7 +218,7 @@ Remember, patience is key. Some animals need weeks or months to fully overcome t
 
 Signs they're warming up: relaxed body language, eating while you're near, approaching voluntarily. Every animal is different - respect their pace."""
         
-        elif 'barking' in message_lower or 'bark' in message_lower:
+        elif "fallback.bark" in hits:
             return """Dogs bark at night for several reasons:
 
 1. **Alert barking**: They hear something outside
@@ -193,39 +246,38 @@ Each species has unique ways of expressing themselves:
 
 What specific behavior or concern would you like to discuss? I can help you decode what your pet might be trying to tell you."""
     
+    def build_messages(self, request: ChatRequest) -> List[Dict[str, str]]:
+        """Build message history including the current user message"""
+        messages = []
+        for msg in request.history:
+            messages.append({
+                "role": msg.role,
+                "content": msg.content
+            })
+        
+        # Add current message (analysis context is added once, trimmed, by the prompt builder)
+        messages.append({
+            "role": "user",
+            "content": request.message
+        })
+        
+        return messages
+    
     async def chat(self, request: ChatRequest) -> ChatResponse:
         """Process chat conversation"""
+        turn = self.prepare_turn(request)
         try:
-            # Build message history
-            messages = []
-            for msg in request.history:
-                messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-            
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": request.message
-            })
-            
-            # Add context if provided
-            if request.context:
-                context_str = "\n\nCONTEXT (from recent analysis):\n"
-                for key, value in request.context.items():
-                    context_str += f"- {key}: {value}\n"
-                messages[-1]["content"] += context_str
-            
             # Get response with RAG context
-            response_text = await self.get_llm_response(messages, request.context)
+            response_text, llm_context = await self.get_llm_response(turn)
+            self.remember_turn(request.session_id, turn, llm_context)
             
             # Generate suggestions
             suggestions = self.create_suggestions(request.message)
             
             return ChatResponse(
                 response=response_text,
-                suggestions=suggestions
+                suggestions=suggestions,
+                session_id=request.session_id
             )
         
         except Exception as e:
@@ -238,6 +290,20 @@ What specific behavior or concern would you like to discuss? I can help you deco
                     "What does my pet's body language mean?"
                 ]
             )
+    
+    async def chat_stream(self, request: ChatRequest, turn: ChatTurn) -> AsyncIterator[Dict[str, Any]]:
+        """Process a prepared chat turn, yielding token events then a final suggestions event"""
+        try:
+            final: Dict[str, Any] = {}
+            async for token in self.stream_llm_response(turn, final):
+                yield {"type": "token", "content": token}
+            self.remember_turn(request.session_id, turn, final.get("context"))
+            
+            yield {"type": "done", "suggestions": self.create_suggestions(request.message), "session_id": request.session_id}
+        
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield {"type": "error", "content": "I apologize, but I'm having trouble processing your question right now. Please try again or rephrase your question."}
 
 # Singleton instance
 pet_whisperer_agent = PetWhispererAgent()
@@ -0,0 +1,160 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from config import settings
+from keyword_matcher import keyword_matcher
+from knowledge_base import KnowledgeBase
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+class ChatPromptBuilder:
+    """Builds Pet Whisperer prompts that stay within a fixed token budget.
+
+    The most recent turns are kept verbatim, older turns are folded into a
+    rolling extractive summary (cached per conversation prefix), the
+    analysis context is trimmed to the fields the question is about, and
+    the few knowledge-base passages most relevant to the question are added
+    under their own token budget.
+    """
+
+    def __init__(self, token_budget: int = None, recent_messages: int = None,
+                 summary_tokens: int = None, cache_size: int = 1024,
+                 knowledge: Optional[KnowledgeBase] = None, knowledge_tokens: int = None):
+        self.token_budget = token_budget or settings.chat_prompt_token_budget
+        self.recent_messages = recent_messages or settings.chat_recent_messages
+        self.summary_tokens = summary_tokens or settings.chat_summary_tokens
+        self.cache_size = cache_size
+        self.knowledge = knowledge
+        self.knowledge_tokens = knowledge_tokens or settings.knowledge_token_budget
+
+        # Prefix hash -> summary lines for messages up to that prefix
+        self._summary_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    def summarize_turn(self, message: Dict[str, str]) -> str:
+        """Reduce one turn to its first sentence"""
+        text = " ".join(message['content'].split())
+        for end in ('. ', '? ', '! ', '\n'):
+            index = text.find(end)
+            if 0 < index < 160:
+                text = text[:index + 1]
+                break
+        if len(text) > 160:
+            text = text[:157] + "..."
+        speaker = "User asked" if message['role'] == 'user' else "Pet Whisperer advised"
+        return f"- {speaker}: {text}"
+
+    def summarize(self, messages: List[Dict[str, str]]) -> str:
+        """Rolling summary of older turns, reusing the summary of the previous prefix"""
+        if not messages:
+            return ""
+
+        digest = hashlib.sha1()
+        prefix_keys = []
+        for message in messages:
+            digest.update(f"{message['role']}:{message['content']}\x00".encode("utf-8"))
+            prefix_keys.append(digest.hexdigest())
+
+        # Find the longest prefix already summarized
+        lines: List[str] = []
+        start = 0
+        for i in range(len(prefix_keys) - 1, -1, -1):
+            cached = self._summary_cache.get(prefix_keys[i])
+            if cached is not None:
+                self._summary_cache.move_to_end(prefix_keys[i])
+                lines = list(cached)
+                start = i + 1
+                break
+
+        for i in range(start, len(messages)):
+            lines.append(self.summarize_turn(messages[i]))
+            # Keep the newest lines when the summary outgrows its budget
+            while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_tokens:
+                lines.pop(0)
+            self._summary_cache[prefix_keys[i]] = list(lines)
+
+        while len(self._summary_cache) > self.cache_size:
+            self._summary_cache.popitem(last=False)
+
+        return "\n".join(lines)
+
+    def build_context_block(self, context: Dict[str, Any], question: str) -> str:
+        """Analysis context trimmed to the fields relevant to the question"""
+        hits = keyword_matcher.match(question)
+        wants_health = "context.health" in hits
+        wants_food = "context.food" in hits
+
+        block = "=== ANALYSIS CONTEXT (Use this to provide specific, personalized advice) ===\n"
+        if 'species' in context:
+            block += f"Animal Species: {context['species']}\n"
+        if 'emotionalState' in context:
+            block += f"Current Emotional State: {context['emotionalState']}\n"
+        if 'severity' in context:
+            block += f"Medical Severity: {context['severity']}\n"
+        if 'conditionSummary' in context:
+            block += f"Health Summary: {context['conditionSummary']}\n"
+        if wants_health:
+            if context.get('healthIssues'):
+                block += f"Detected Health Issues: {', '.join(context['healthIssues'])}\n"
+            if context.get('immediateActions'):
+                block += f"Recommended Actions: {'; '.join(context['immediateActions'][:3])}\n"
+        if wants_food and context.get('nutritionPlan'):
+            nutrition = context['nutritionPlan']
+            if 'recommendedFoods' in nutrition:
+                block += f"Safe Foods: {', '.join(nutrition['recommendedFoods'][:5])}\n"
+            if 'dangerousFoods' in nutrition:
+                block += f"Dangerous Foods: {', '.join(nutrition['dangerousFoods'][:5])}\n"
+        block += "=== END CONTEXT ===\n\n"
+        block += "IMPORTANT: Reference the above analysis when answering. Be specific to THIS animal's condition.\n\n"
+        return block
+
+    def build_knowledge_block(self, question: str) -> str:
+        """Best-matching reference passages that fit within the knowledge token budget"""
+        if self.knowledge is None or not question.strip():
+            return ""
+
+        notes = ""
+        remaining = self.knowledge_tokens
+        for passage, _ in self.knowledge.search(question):
+            note = f"- {passage.title}: {passage.text}\n"
+            cost = estimate_tokens(note)
+            if cost > remaining:
+                continue
+            notes += note
+            remaining -= cost
+
+        if not notes:
+            return ""
+        return f"=== REFERENCE NOTES (veterinary guidance; use if relevant) ===\n{notes}=== END NOTES ===\n\n"
+
+    def build(self, system_prompt: str, messages: List[Dict[str, str]],
+              context: Optional[Dict[str, Any]] = None) -> str:
+        """Assemble the prompt: system, trimmed context, reference notes, summary, recent turns"""
+        question = messages[-1]['content'] if messages else ""
+        header = f"{system_prompt}\n\n"
+        if context:
+            header += self.build_context_block(context, question)
+        header += self.build_knowledge_block(question)
+
+        # Take recent turns newest-first until the count or token budget runs out
+        remaining = self.token_budget - estimate_tokens(header) - self.summary_tokens
+        recent: List[str] = []
+        split = len(messages)
+        for message in reversed(messages):
+            line = f"{message['role'].upper()}: {message['content']}\n"
+            cost = estimate_tokens(line)
+            # The current question is always kept
+            if recent and (len(recent) >= self.recent_messages or cost > remaining):
+                break
+            recent.insert(0, line)
+            remaining -= cost
+            split -= 1
+
+        prompt = header
+        summary = self.summarize(messages[:split])
+        if summary:
+            prompt += f"=== EARLIER CONVERSATION (summary) ===\n{summary}\n=== END SUMMARY ===\n\n"
+        prompt += "".join(recent)
+        prompt += "ASSISTANT:"
+        return prompt
@@ -0,0 +1,89 @@
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any
+from config import settings
+
+class SessionNotFound(Exception):
+    """Raised when a request omits history for a session the server no longer holds"""
+    pass
+
+class ChatSession:
+    """Ollama token state for one conversation"""
+
+    __slots__ = ("session_id", "context", "message_count", "updated_at")
+
+    def __init__(self, session_id: str, context: List[int], message_count: int):
+        self.session_id = session_id
+        # 4 bytes per token instead of a Python int object each
+        self.context = array("I", context)
+        self.message_count = message_count
+        self.updated_at = time.time()
+
+class ChatSessionStore:
+    """LRU store of chat sessions capped by session count and total context tokens"""
+
+    def __init__(self, max_sessions: int = None, max_total_tokens: int = None,
+                 max_session_tokens: int = None, ttl_seconds: float = None):
+        self.max_sessions = max_sessions or settings.chat_session_max
+        self.max_total_tokens = max_total_tokens or settings.chat_session_max_total_tokens
+        self.max_session_tokens = max_session_tokens or settings.chat_session_max_context_tokens
+        self.ttl_seconds = ttl_seconds or settings.chat_session_ttl_seconds
+
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.total_tokens = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            self.misses += 1
+            return None
+
+        if time.time() - session.updated_at > self.ttl_seconds:
+            self.discard(session_id)
+            self.misses += 1
+            return None
+
+        self._sessions.move_to_end(session_id)
+        self.hits += 1
+        return session
+
+    def save(self, session_id: str, context: List[int], message_count: int):
+        """Store the context Ollama returned after a turn"""
+        self.discard(session_id)
+
+        # Past the model window Ollama would truncate anyway; rebuild from a summary instead
+        if not context or len(context) > self.max_session_tokens:
+            return
+
+        session = ChatSession(session_id, context, message_count)
+        self._sessions[session_id] = session
+        self.total_tokens += len(session.context)
+
+        while self._sessions and (len(self._sessions) > self.max_sessions or self.total_tokens > self.max_total_tokens):
+            _, evicted = self._sessions.popitem(last=False)
+            self.total_tokens -= len(evicted.context)
+            self.evictions += 1
+
+    def discard(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self.total_tokens -= len(session.context)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "total_tokens": self.total_tokens,
+            "max_total_tokens": self.max_total_tokens,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+# Singleton instance
+chat_session_store = ChatSessionStore()
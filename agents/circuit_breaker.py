@@ -0,0 +1,106 @@
+import time
+from typing import Dict, Any
+from config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Fails LLM calls fast while Ollama is down or too slow to be useful.
+
+    Closed: calls pass through; consecutive failures (errors, timeouts or
+    calls slower than ``slow_call_seconds``) are counted. Open: calls are
+    refused immediately so the agents go straight to their deterministic
+    fallbacks. After ``open_seconds`` the breaker turns half-open and lets a
+    limited number of probe calls through; a good probe closes it again, a
+    bad one re-opens it for another period.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, slow_call_seconds: float = None,
+                 open_seconds: float = None, half_open_probes: int = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.llm_breaker_failure_threshold
+        self.slow_call_seconds = slow_call_seconds or settings.llm_breaker_slow_call_seconds
+        self.open_seconds = open_seconds or settings.llm_breaker_open_seconds
+        self.half_open_probes = half_open_probes or settings.llm_breaker_half_open_probes
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+
+        self.short_circuited = 0
+        self.slow_calls = 0
+        self.times_opened = 0
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to the LLM; False means use the fallback now"""
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.short_circuited += 1
+                return False
+            self._transition(HALF_OPEN)
+
+        if self.probes_in_flight >= self.half_open_probes:
+            self.short_circuited += 1
+            return False
+        self.probes_in_flight += 1
+        return True
+
+    def record_success(self, elapsed_seconds: float):
+        if elapsed_seconds > self.slow_call_seconds:
+            # Answering after the caller has given up is as bad as not answering
+            self.slow_calls += 1
+            self.record_failure()
+            return
+
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            self._transition(CLOSED)
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            self._open()
+            return
+
+        self.consecutive_failures += 1
+        if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def release(self):
+        """Give back a probe slot for a call that ended without a verdict (shed or cancelled)"""
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state != self.state:
+            print(f"Circuit breaker '{self.name}': {self.state} -> {state}")
+        self.state = state
+        if state != HALF_OPEN:
+            self.probes_in_flight = 0
+        if state == CLOSED:
+            self.consecutive_failures = 0
+
+    def get_status(self) -> Dict[str, Any]:
+        retry_in = 0.0
+        if self.state == OPEN:
+            retry_in = max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_seconds": round(retry_in, 1),
+            "short_circuited": self.short_circuited,
+            "slow_calls": self.slow_calls,
+            "times_opened": self.times_opened
+        }
@@ -5,11 +5,31 @@ from typing import Optional
 class Settings(BaseSettings):
     # Ollama Configuration (FREE local LLM)
     ollama_base_url: str = "http://localhost:11434"
+    ollama_base_urls: str = ""  # Comma-separated list of Ollama servers; overrides ollama_base_url
     ollama_model: str = "llama2"
     
     # OpenStreetMap/Nominatim (FREE)
     nominatim_base_url: str = "https://nominatim.openstreetmap.org"
     nominatim_email: str = "user@example.com"
+    geocoder_enabled: bool = True  # Reverse-geocode SOS locations and centers without an address
+    geocoder_cache_path: str = "cache/geocoder.db"
+    geocoder_cache_precision: int = 4  # Decimal places of the cache key (~11 m)
+    geocoder_cache_ttl_seconds: float = 2592000.0  # 30 days
+    geocoder_negative_ttl_seconds: float = 86400.0  # Points Nominatim had no address for
+    geocoder_rate_per_second: float = 1.0  # Nominatim usage policy: at most 1 request/second
+    geocoder_timeout_seconds: float = 10.0
+    geocoder_queue_timeout_seconds: float = 30.0  # Drop lookups that would wait longer for the rate limit
+    geocoder_sos_budget_seconds: float = 1.5  # Slower lookups finish in the background and fill the cache
+    geocoder_max_centers: int = 5  # Centers shown in the SOS message
+    overpass_url: str = "http://overpass-api.de/api/interpreter"
+    overpass_urls: str = ""  # Comma-separated Overpass mirrors, raced in order; overrides overpass_url
+    overpass_timeout_seconds: float = 30.0
+    overpass_hedge_delay_seconds: float = 2.0  # Ask the next mirror if no answer by then
+    overpass_rate_per_second: float = 1.0  # Shared by all requests to all mirrors
+    overpass_burst: int = 4
+    overpass_pool_size: int = 8
+    overpass_cooldown_after_failures: int = 3
+    overpass_cooldown_seconds: float = 60.0
     
     # Model Configuration
     yolo_model_path: str = "yolov8n.pt"
@@ -20,6 +40,115 @@ class Settings(BaseSettings):
     llm_temperature: float = 0.7
     max_tokens: int = 1000
     
+    # Request deadlines (the Node backend gives up after 60s)
+    request_deadline_seconds: float = 55.0
+    request_deadline_max_seconds: float = 120.0
+    llm_min_budget_seconds: float = 3.0  # Use deterministic fallbacks below this
+    
+    # Shared LLM client (pooled keep-alive session to Ollama)
+    llm_timeout_seconds: float = 60.0
+    llm_max_concurrency: int = 4  # Match OLLAMA_NUM_PARALLEL
+    llm_pool_size: int = 16
+    llm_keepalive_seconds: float = 30.0
+    
+    # LLM backend pool health checks and ejection
+    llm_backend_eject_after_failures: int = 3
+    llm_backend_eject_seconds: float = 30.0
+    llm_backend_health_interval_seconds: float = 10.0
+    llm_backend_health_timeout_seconds: float = 2.0
+    
+    # LLM circuit breaker
+    llm_breaker_failure_threshold: int = 5  # Consecutive failed or slow calls before opening
+    llm_breaker_slow_call_seconds: float = 30.0
+    llm_breaker_open_seconds: float = 15.0
+    llm_breaker_half_open_probes: int = 1
+    
+    # LLM scheduler queues (fail fast instead of piling up behind Ollama)
+    llm_queue_limit_critical: int = 64
+    llm_queue_limit_analyze: int = 32
+    llm_queue_limit_chat: int = 16
+    llm_queue_max_wait_seconds: float = 20.0
+    
+    # Offline rescue-center index (build with: python rescue_index.py import <extract>)
+    rescue_index_path: str = "cache/rescue_index"
+    rescue_index_cell_degrees: float = 0.05
+    
+    # Rescue-center tile cache for areas the index does not cover (Overpass results per geohash tile)
+    rescue_tile_precision: int = 5  # ~4.9 x 4.9 km tiles
+    rescue_tile_ttl_seconds: float = 86400.0
+    rescue_tile_stale_seconds: float = 604800.0  # Served while refreshing in the background
+    rescue_tile_max_tiles: int = 20000
+    
+    # Bulk SOS (/sos/batch): reports in the same region share one rescue-center lookup
+    sos_batch_region_precision: int = 4  # ~39 x 20 km regions
+    sos_batch_max_reports: int = 500
+    sos_batch_routing_budget_ms: float = 1000.0  # Shared by the whole batch; reports routed after it keep distance order
+    
+    # Optional road graph for travel-time ranking (build with: python road_routing.py import <extract>)
+    routing_graph_path: str = "cache/road_graph"
+    routing_landmarks: int = 8
+    routing_candidates: int = 20  # Nearest centers by distance that get a travel time
+    routing_budget_ms: float = 100.0  # Centers not reached by then keep their distance order
+    routing_max_travel_seconds: float = 3600.0
+    routing_max_snap_km: float = 0.5
+    routing_snap_cell_degrees: float = 0.01
+    routing_tile_precision: int = 7  # ~150 m origin tiles share cached travel times
+    routing_cache_tiles: int = 4096
+    
+    # Ollama simulator (python ollama_simulator.py, then point OLLAMA_BASE_URL at it)
+    simulator_port: int = 11500
+    simulator_ttft_ms: float = 300.0
+    simulator_tokens_per_second: float = 40.0
+    simulator_prompt_tokens_per_second: float = 800.0  # 0 disables prompt evaluation time
+    simulator_ttft_jitter: float = 0.0  # e.g. 0.2 for +/-20%
+    simulator_error_rate: float = 0.0
+    simulator_parallel: int = 1  # Generations run at once, like OLLAMA_NUM_PARALLEL
+    simulator_seed: int = 42
+    simulator_responses_path: Optional[str] = None  # JSON file overriding the canned outputs
+    
+    # Chat knowledge base (retrieval over knowledge/corpus.json)
+    knowledge_enabled: bool = True
+    knowledge_corpus_path: str = "knowledge/corpus.json"
+    knowledge_index_dir: str = "cache/knowledge"
+    knowledge_embedding_dim: int = 8192
+    knowledge_top_k: int = 3
+    knowledge_min_score: float = 0.12
+    knowledge_token_budget: int = 300  # Taken out of chat_prompt_token_budget
+    knowledge_query_cache_size: int = 2048
+    
+    # SOS notification outbox (SQLite, delivered by background workers)
+    notification_outbox_path: str = "cache/notification_outbox.db"
+    notification_workers: int = 4
+    notification_max_attempts: int = 5
+    notification_retry_base_seconds: float = 2.0
+    notification_retry_max_seconds: float = 300.0
+    notification_send_timeout_seconds: float = 30.0
+    notification_poll_seconds: float = 5.0
+    
+    # Medical assessment response cache
+    medical_cache_enabled: bool = True
+    medical_cache_max_entries: int = 512
+    medical_cache_ttl_seconds: float = 86400.0
+    medical_cache_path: Optional[str] = None  # e.g. "cache/medical_cache.json" to persist across restarts
+    medical_cache_confidence_bucket: float = 0.1
+    medical_cache_save_delay_seconds: float = 5.0  # Persisted changes are batched into one write per interval
+    
+    # Analysis store (lets /medical/assess and /nutrition/plan reuse an earlier run by analysis_id)
+    analysis_store_max_entries: int = 2048
+    analysis_store_ttl_seconds: float = 86400.0
+    analysis_store_path: Optional[str] = None  # e.g. "cache/analysis_store.db" to persist across restarts and share ids between workers
+    
+    # Chat prompt budget (older turns are folded into a rolling summary)
+    chat_prompt_token_budget: int = 1500
+    chat_recent_messages: int = 6
+    chat_summary_tokens: int = 250
+    
+    # Server-side chat sessions (Ollama context reuse)
+    chat_session_max: int = 1000
+    chat_session_max_total_tokens: int = 4_000_000  # ~16 MB of token state
+    chat_session_max_context_tokens: int = 3500  # Rebuild from summary past the model window
+    chat_session_ttl_seconds: float = 3600.0
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,46 @@
+import time
+from typing import Optional
+from config import settings
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage starts after the request budget has run out"""
+    pass
+
+class Deadline:
+    """Absolute request deadline passed down through the analyze pipeline"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    @classmethod
+    def from_header(cls, budget_ms: Optional[int]) -> "Deadline":
+        """Build from the X-Request-Deadline-Ms header, falling back to Settings"""
+        if budget_ms is not None and budget_ms > 0:
+            return cls(min(budget_ms / 1000, settings.request_deadline_max_seconds))
+        return cls(settings.request_deadline_seconds)
+
+    def extend_to(self, other: "Deadline"):
+        """Push the deadline out to ``other``'s if that is later (a coalesced request with more budget)"""
+        if other.expires_at > self.expires_at:
+            self.budget_seconds += other.expires_at - self.expires_at
+            self.expires_at = other.expires_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """Stage timeout: its usual limit, shrunk to what is left of the budget"""
+        return min(cap, self.remaining())
+
+    def allows(self, seconds: float) -> bool:
+        """Whether at least ``seconds`` of budget remain"""
+        return self.remaining() >= seconds
+
+    def check(self, stage: str):
+        if self.expired:
+            raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
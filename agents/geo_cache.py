@@ -0,0 +1,206 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Callable, Awaitable, Set
+from config import settings
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+KM_PER_DEGREE = 111.32
+
+# (lat, lon, osm_id, tags) as returned by overpass_client.fetch_pois
+POI = Tuple[float, float, str, Dict[str, str]]
+FetchBBox = Callable[[float, float, float, float], Awaitable[List[POI]]]
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        value_range, value = (lon_range, lon) if even else (lat_range, lat)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+def geohash_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(lat degrees, lon degrees) of a cell at this precision"""
+    lon_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+def geohash_cover(lat: float, lon: float, radius_km: float, precision: int) -> List[str]:
+    """Cells overlapping the bounding box of a circle"""
+    lat_step, lon_step = geohash_cell_size(precision)
+    delta_lat = radius_km / KM_PER_DEGREE
+    delta_lon = min(radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)), 180.0)
+    south, north = max(lat - delta_lat, -89.999999), min(lat + delta_lat, 89.999999)
+
+    cells = []
+    seen: Set[str] = set()
+    rows = int(math.floor((north + 90) / lat_step)) - int(math.floor((south + 90) / lat_step)) + 1
+    columns = int(math.floor((lon + delta_lon + 180) / lon_step)) - int(math.floor((lon - delta_lon + 180) / lon_step)) + 1
+    for row in range(rows):
+        cell_lat = min(south + row * lat_step, north)
+        for column in range(min(columns, int(round(360 / lon_step)))):
+            cell_lon = (lon - delta_lon + column * lon_step + 180) % 360 - 180
+            cell = geohash_encode(cell_lat, cell_lon, precision)
+            if cell not in seen:
+                seen.add(cell)
+                cells.append(cell)
+    return cells
+
+class GeoTileCache:
+    """POI sets cached per geohash tile, with TTL and stale-while-revalidate.
+
+    A lookup covers the circle with tiles; fresh tiles are served from
+    memory, stale ones are served immediately while one background refresh
+    runs, and missing or expired ones are fetched together with a single
+    bounding-box query. Concurrent lookups share in-flight fetches per tile.
+    """
+
+    def __init__(self, precision: int = None, ttl_seconds: float = None,
+                 stale_seconds: float = None, max_tiles: int = None):
+        self.precision = precision or settings.rescue_tile_precision
+        self.ttl_seconds = ttl_seconds or settings.rescue_tile_ttl_seconds
+        self.stale_seconds = stale_seconds if stale_seconds is not None else settings.rescue_tile_stale_seconds
+        self.max_tiles = max_tiles or settings.rescue_tile_max_tiles
+
+        # tile -> (fetched_at, POIs whose point lies in the tile)
+        self._tiles: "OrderedDict[str, Tuple[float, List[POI]]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def _store(self, tiles: List[str], pois: List[POI]):
+        now = time.time()
+        by_tile: Dict[str, List[POI]] = {tile: [] for tile in tiles}
+        for poi in pois:
+            tile = geohash_encode(poi[0], poi[1], self.precision)
+            if tile in by_tile:
+                by_tile[tile].append(poi)
+        for tile, tile_pois in by_tile.items():
+            self._tiles[tile] = (now, tile_pois)
+            self._tiles.move_to_end(tile)
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+
+    @staticmethod
+    def _groups(tiles: List[str]) -> List[List[str]]:
+        """Split tiles on either side of the antimeridian so no bbox wraps the globe"""
+        if not tiles:
+            return []
+        boxes = [geohash_bbox(tile) for tile in tiles]
+        if max(box[3] for box in boxes) - min(box[1] for box in boxes) <= 180:
+            return [tiles]
+        east = [tile for tile, box in zip(tiles, boxes) if box[1] >= 0]
+        west = [tile for tile, box in zip(tiles, boxes) if box[1] < 0]
+        return [group for group in (east, west) if group]
+
+    def _fetch(self, tiles: List[str], fetch: FetchBBox) -> asyncio.Task:
+        """Start one bbox query for a group of tiles and register it as pending for each"""
+        boxes = [geohash_bbox(tile) for tile in tiles]
+        south = min(box[0] for box in boxes)
+        west = min(box[1] for box in boxes)
+        north = max(box[2] for box in boxes)
+        east = max(box[3] for box in boxes)
+
+        async def run():
+            self.fetches += 1
+            try:
+                self._store(tiles, await fetch(south, west, north, east))
+            except Exception:
+                self.fetch_errors += 1
+                raise
+            finally:
+                for tile in tiles:
+                    if self._pending.get(tile) is task:
+                        del self._pending[tile]
+
+        task = asyncio.ensure_future(run())
+        for tile in tiles:
+            self._pending[tile] = task
+        return task
+
+    async def get_pois(self, lat: float, lon: float, radius_km: float, fetch: FetchBBox) -> List[POI]:
+        """Every cached or freshly fetched POI in the tiles covering the circle (unfiltered)"""
+        now = time.time()
+        cover = geohash_cover(lat, lon, radius_km, self.precision)
+        missing, stale = [], []
+        for tile in cover:
+            entry = self._tiles.get(tile)
+            age = now - entry[0] if entry else None
+            if entry is None or age > self.ttl_seconds + self.stale_seconds:
+                missing.append(tile)
+            elif age > self.ttl_seconds:
+                stale.append(tile)
+
+        # Stale tiles: answer now, refresh once in the background
+        refresh = [tile for tile in stale if tile not in self._pending]
+        for group in self._groups(refresh):
+            self._fetch(group, fetch).add_done_callback(lambda task: task.cancelled() or task.exception())
+        self.stale_hits += len(stale)
+
+        waits = {self._pending[tile] for tile in missing if tile in self._pending}
+        to_fetch = [tile for tile in missing if tile not in self._pending]
+        for group in self._groups(to_fetch):
+            waits.add(self._fetch(group, fetch))
+        self.misses += len(missing)
+        self.hits += len(cover) - len(missing) - len(stale)
+
+        if waits:
+            # Shield so one caller giving up does not cancel a fetch others are waiting on
+            results = await asyncio.gather(*(asyncio.shield(task) for task in waits), return_exceptions=True)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors and not any(tile in self._tiles for tile in cover):
+                raise errors[0]
+
+        pois: List[POI] = []
+        for tile in cover:
+            entry = self._tiles.get(tile)
+            if entry is not None:
+                self._tiles.move_to_end(tile)
+                pois.extend(entry[1])
+        return pois
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "tiles": len(self._tiles),
+            "max_tiles": self.max_tiles,
+            "precision": self.precision,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+            "pending": len(set(self._pending.values()))
+        }
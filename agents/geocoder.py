@@ -0,0 +1,186 @@
+import asyncio
+import os
+import sqlite3
+import time
+from typing import List, Optional, Dict, Any, Tuple
+import aiohttp
+from config import settings
+from rate_limiter import TokenBucket
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS addresses (
+    key TEXT PRIMARY KEY,
+    address TEXT,
+    fetched_at REAL NOT NULL
+);
+"""
+
+def format_address(result: Dict[str, Any]) -> Optional[str]:
+    """Short street-level address from a Nominatim reverse result"""
+    parts = result.get("address") or {}
+    street = parts.get("road") or parts.get("pedestrian") or parts.get("footway")
+    if street and parts.get("house_number"):
+        street = f"{parts['house_number']} {street}"
+    area = parts.get("suburb") or parts.get("neighbourhood") or parts.get("quarter")
+    place = parts.get("city") or parts.get("town") or parts.get("village") or parts.get("county")
+    fields = [field for field in (street, area, place) if field]
+    if fields:
+        return ", ".join(dict.fromkeys(fields))
+    return result.get("display_name")
+
+class ReverseGeocoder:
+    """Nominatim reverse geocoding behind a persistent cache and a shared rate limiter.
+
+    Addresses are cached in SQLite by coordinates rounded to
+    ``geocoder_cache_precision`` decimals (~11 m at 4), including misses, so
+    repeat areas cost nothing. Live lookups share one token bucket at
+    Nominatim's 1 request/second policy, and concurrent lookups of the same
+    key share a single request.
+    """
+
+    def __init__(self, path: str = None, rate_limiter: TokenBucket = None):
+        self.path = path or settings.geocoder_cache_path
+        self.base_url = settings.nominatim_base_url.rstrip("/")
+        self.precision = settings.geocoder_cache_precision
+        self.rate_limiter = rate_limiter or TokenBucket("nominatim", settings.geocoder_rate_per_second, 1)
+
+        self._conn: Optional[sqlite3.Connection] = None
+        # Session is created lazily so it binds to the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._pending: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled keep-alive session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"User-Agent": f"hope-ai-agents ({settings.nominatim_email})"}
+            )
+        return self._session
+
+    def cache_key(self, lat: float, lon: float) -> str:
+        return f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+    def cached(self, key: str) -> Tuple[bool, Optional[str]]:
+        """(found, address); entries past their TTL count as not found"""
+        row = self._connect().execute("SELECT address, fetched_at FROM addresses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False, None
+        address, fetched_at = row
+        ttl = settings.geocoder_cache_ttl_seconds if address is not None else settings.geocoder_negative_ttl_seconds
+        if time.time() - fetched_at > ttl:
+            return False, None
+        return True, address
+
+    async def _fetch(self, key: str, lat: float, lon: float) -> Optional[str]:
+        try:
+            if not await self.rate_limiter.acquire(timeout=settings.geocoder_queue_timeout_seconds):
+                # Too many lookups queued; leave it uncached so a later request can try again
+                self.rate_limited += 1
+                return None
+
+            session = await self.get_session()
+            params = {
+                "format": "jsonv2",
+                "lat": f"{lat:.6f}",
+                "lon": f"{lon:.6f}",
+                "zoom": 18,
+                "addressdetails": 1,
+                "email": settings.nominatim_email
+            }
+            timeout = aiohttp.ClientTimeout(total=settings.geocoder_timeout_seconds)
+            async with session.get(f"{self.base_url}/reverse", params=params, timeout=timeout) as response:
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+
+            address = None if "error" in result else format_address(result)
+            self._connect().execute(
+                "INSERT OR REPLACE INTO addresses (key, address, fetched_at) VALUES (?, ?, ?)",
+                (key, address, time.time())
+            )
+            return address
+        except Exception as e:
+            self.errors += 1
+            print(f"Reverse geocoding error for {key}: {e}")
+            return None
+        finally:
+            self._pending.pop(key, None)
+
+    def lookup(self, lat: float, lon: float) -> asyncio.Future:
+        """Future address for a point (None if unknown).
+
+        Resolved at once on a cache hit; otherwise the live lookup starts
+        immediately, so lookups take rate-limit tokens in the order they are
+        requested, and concurrent lookups of the same key share one request.
+        """
+        key = self.cache_key(lat, lon)
+        found, address = self.cached(key)
+        if found:
+            self.hits += 1
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(address)
+            return future
+
+        self.misses += 1
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._fetch(key, lat, lon))
+        return task
+
+    async def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """Address near a point, or None if unknown"""
+        # Shield so a caller that stops waiting does not cancel a lookup others share
+        return await asyncio.shield(self.lookup(lat, lon))
+
+    async def resolve(self, lookups: List[asyncio.Future], timeout: float) -> List[Optional[str]]:
+        """Results of several lookups, with whatever is known after ``timeout`` seconds.
+
+        Lookups still running at the deadline keep going in the background
+        and land in the cache for the next request from the area.
+        """
+        running = [lookup for lookup in lookups if not lookup.done()]
+        if running:
+            await asyncio.wait(running, timeout=timeout)
+        return [
+            lookup.result() if lookup.done() and not lookup.cancelled() and lookup.exception() is None else None
+            for lookup in lookups
+        ]
+
+    async def close(self):
+        """Close the pooled session and cache (call on application shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "pending": len(self._pending),
+            "rate_limiter": self.rate_limiter.get_metrics()
+        }
+
+# Singleton instance
+reverse_geocoder = ReverseGeocoder()
@@ -0,0 +1,52 @@
+from typing import List, Optional
+
+class JSONObjectScanner:
+    """Incremental scanner that detects when the first top-level JSON object is closed.
+
+    Text is fed chunk by chunk as the LLM streams it; only brace depth and
+    string/escape state are tracked, so each character is visited once.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.complete: Optional[str] = None
+
+    def feed(self, text: str) -> Optional[str]:
+        """Consume a chunk; return the full object text once its closing brace arrives"""
+        if self.complete is not None:
+            return self.complete
+
+        start = 0
+        for i, char in enumerate(text):
+            if not self.started:
+                # Skip any preamble before the opening brace
+                if char != '{':
+                    continue
+                self.started = True
+                start = i
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.parts.append(text[start:i + 1])
+                    self.complete = "".join(self.parts)
+                    return self.complete
+
+        if self.started:
+            self.parts.append(text[start:])
+        return None
@@ -0,0 +1,146 @@
+import re
+from collections import deque
+from typing import Dict, List, Sequence, Tuple
+
+# Every keyword table used by the agents' rule-based and fallback paths.
+# Matching is by substring, like the ``word in text`` checks these replace.
+KEYWORD_TABLES: Dict[str, List[str]] = {
+    # PetWhispererAgent.create_suggestions
+    "suggest.fear": ['scared', 'afraid', 'fear', 'anxious'],
+    "suggest.aggression": ['aggressive', 'biting', 'attacking'],
+    "suggest.stray": ['stray', 'rescue', 'trust'],
+    "suggest.vocal": ['barking', 'meowing', 'noise', 'vocal'],
+    # PetWhispererAgent.generate_fallback_response
+    "fallback.scared": ['scared', 'afraid'],
+    "fallback.trust": ['trust'],
+    "fallback.stray": ['stray'],
+    "fallback.bark": ['barking', 'bark'],
+    # MedicalReasoningAgent.generate_fallback_response
+    "medical.critical": ['severe', 'critical', 'bleeding', 'emaciated'],
+    "medical.urgent": ['infection', 'wound', 'injury', 'severe malnutrition'],
+    "medical.moderate": ['mange', 'dermatitis', 'dehydration', 'possible'],
+    # ChatPromptBuilder.build_context_block
+    "context.health": ['health', 'sick', 'ill', 'wound', 'injur', 'pain', 'vet', 'medic', 'treat',
+                       'infection', 'skin', 'eye', 'symptom', 'severity', 'condition', 'hurt', 'heal'],
+    "context.food": ['food', 'feed', 'eat', 'diet', 'nutrition', 'treat', 'water', 'drink', 'hungry', 'meal']
+}
+
+class KeywordHits:
+    """Categories found in one text; supports ``"medical.urgent" in hits``"""
+
+    __slots__ = ("mask", "_bits")
+
+    def __init__(self, mask: int, bits: Dict[str, int]):
+        self.mask = mask
+        self._bits = bits
+
+    def __contains__(self, category: str) -> bool:
+        return bool(self.mask & self._bits[category])
+
+    def __bool__(self) -> bool:
+        return bool(self.mask)
+
+    def categories(self) -> List[str]:
+        return [category for category, bit in self._bits.items() if self.mask & bit]
+
+class KeywordMatcher:
+    """Finds every keyword category present in a text in one left-to-right pass.
+
+    The keywords are compiled into a trie-shaped regex, so the scan for the
+    next candidate runs inside the regex engine. Aho-Corasick failure links
+    are computed once up front and give, for each keyword, the categories of
+    all keywords it contains and how far to advance after it, so overlapping
+    matches ("severe" inside "severe malnutrition", "eat" inside "treat")
+    are never missed and no position is examined twice.
+    """
+
+    def __init__(self, tables: Dict[str, Sequence[str]]):
+        self._bits = {category: 1 << index for index, category in enumerate(tables)}
+
+        keyword_masks: Dict[str, int] = {}
+        for category, keywords in tables.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                keyword_masks[keyword] = keyword_masks.get(keyword, 0) | self._bits[category]
+
+        self._steps = self._compile_steps(keyword_masks)
+        self._pattern = re.compile(self._trie_pattern(keyword_masks))
+
+    @staticmethod
+    def _compile_steps(keyword_masks: Dict[str, int]) -> Dict[str, Tuple[int, int]]:
+        """keyword -> (mask of every keyword inside it, characters to advance after a match)"""
+        children: List[Dict[str, int]] = [{}]
+        output = [0]
+        for keyword, mask in keyword_masks.items():
+            node = 0
+            for char in keyword:
+                if char not in children[node]:
+                    children.append({})
+                    output.append(0)
+                    children[node][char] = len(children) - 1
+                node = children[node][char]
+            output[node] |= mask
+
+        # Breadth-first failure links; each node inherits the output of its suffix
+        fail = [0] * len(children)
+        depth = [0] * len(children)
+        queue = deque(children[0].values())
+        for node in queue:
+            depth[node] = 1
+        while queue:
+            node = queue.popleft()
+            for char, child in children[node].items():
+                depth[child] = depth[node] + 1
+                suffix = fail[node]
+                while suffix and char not in children[suffix]:
+                    suffix = fail[suffix]
+                fail[child] = children[suffix].get(char, 0)
+                output[child] |= output[fail[child]]
+                queue.append(child)
+
+        steps = {}
+        for keyword in keyword_masks:
+            node = 0
+            contained = 0
+            for char in keyword:
+                node = children[node][char]
+                contained |= output[node]
+            # The next match can start no earlier than the longest suffix that begins a keyword
+            steps[keyword] = (contained, len(keyword) - depth[fail[node]])
+        return steps
+
+    @staticmethod
+    def _trie_pattern(keywords) -> str:
+        """Regex equivalent of the keyword trie; greedy, so it takes the longest keyword at a position"""
+        trie: Dict = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def build(node: Dict) -> str:
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            return f"(?:{pattern})?" if "" in node else pattern
+
+        return build(trie)
+
+    def match(self, text: str) -> KeywordHits:
+        text = text.lower()
+        search = self._pattern.search
+        steps = self._steps
+        mask = 0
+        position = 0
+        while True:
+            found = search(text, position)
+            if found is None:
+                return KeywordHits(mask, self._bits)
+            contained, step = steps[found.group()]
+            mask |= contained
+            position = found.start() + step
+
+# Singleton instance
+keyword_matcher = KeywordMatcher(KEYWORD_TABLES)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, NamedTuple, Tuple
+import numpy as np
+from config import settings
+
+# Bump when tokenization or feature hashing changes so stale indexes are rebuilt
+EMBEDDER_VERSION = "hashed-tfidf-v1"
+
+STOPWORDS = frozenset("""
+a about all also an and any are as at be been being but by can could did do does
+for from get got had has have he her him his how i if in into is it its just me
+more much my no not of on one or our out she should so some than that the their
+them then there these they this to too up very was we were what when where which
+who why will with would you your
+""".split())
+
+class Passage(NamedTuple):
+    id: str
+    title: str
+    text: str
+
+class HashingEmbedder:
+    """Offline text embedding by feature hashing of unigrams and bigrams.
+
+    Needs no model download and gives the same vector on every machine
+    (blake2b, not Python's salted hash), so the index can be built once and
+    shipped or cached on disk.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        tokens = []
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if word in STOPWORDS or len(word) < 2:
+                continue
+            # Light stemming so "barking"/"barks"/"bark" share a feature
+            for suffix in ("ing", "ed", "es", "s"):
+                if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                    word = word[:-len(suffix)]
+                    break
+            tokens.append(word)
+        return tokens
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        return value % self.dim, (1.0 if value >> 63 else -1.0)
+
+    def term_counts(self, text: str) -> np.ndarray:
+        """Signed, sublinear term frequencies per hash bucket (not normalized)"""
+        tokens = self.tokenize(text)
+        counts: Dict[str, float] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0.0) + 1.0
+        for first, second in zip(tokens, tokens[1:]):
+            bigram = f"{first} {second}"
+            counts[bigram] = counts.get(bigram, 0.0) + 0.5
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in counts.items():
+            bucket, sign = self._bucket(feature)
+            vector[bucket] += sign * (1.0 + math.log(count) if count > 1 else count)
+        return vector
+
+class KnowledgeBase:
+    """Top-k retrieval over the bundled veterinary/behaviour corpus.
+
+    Passage embeddings are built once and saved as .npy files, then opened
+    memory-mapped so every worker process shares the same pages. The index
+    is rebuilt automatically when the corpus or the embedder changes.
+    """
+
+    def __init__(self, corpus_path: str = None, index_dir: str = None, dim: int = None,
+                 top_k: int = None, min_score: float = None, cache_size: int = None):
+        self.corpus_path = corpus_path or settings.knowledge_corpus_path
+        self.index_dir = index_dir or settings.knowledge_index_dir
+        self.top_k = top_k or settings.knowledge_top_k
+        self.min_score = min_score if min_score is not None else settings.knowledge_min_score
+        self.cache_size = cache_size or settings.knowledge_query_cache_size
+        self.embedder = HashingEmbedder(dim or settings.knowledge_embedding_dim)
+
+        self.passages: List[Passage] = []
+        self._embeddings: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        self._loaded = False
+
+        # Normalized query text -> query embedding
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.queries = 0
+        self.cache_hits = 0
+
+    def load(self):
+        """Open the index, (re)building it first if it is missing or stale"""
+        self._loaded = True
+        try:
+            with open(self.corpus_path, "rb") as f:
+                raw = f.read()
+            self.passages = [Passage(item["id"], item["title"], item["text"]) for item in json.loads(raw)]
+        except Exception as e:
+            print(f"Knowledge base unavailable: {e}")
+            self.passages = []
+            return
+
+        manifest = {
+            "version": EMBEDDER_VERSION,
+            "dim": self.embedder.dim,
+            "corpus_sha256": hashlib.sha256(raw).hexdigest(),
+            "passages": len(self.passages)
+        }
+        embeddings_path = os.path.join(self.index_dir, "embeddings.npy")
+        idf_path = os.path.join(self.index_dir, "idf.npy")
+        manifest_path = os.path.join(self.index_dir, "manifest.json")
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                current = json.load(f) == manifest
+        except (FileNotFoundError, ValueError):
+            current = False
+
+        if not current:
+            print(f"Building knowledge index for {len(self.passages)} passages")
+            embeddings, idf = self.build_index()
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                self._save_array(embeddings_path, embeddings)
+                self._save_array(idf_path, idf)
+                with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+                os.replace(f"{manifest_path}.tmp", manifest_path)
+            except OSError as e:
+                # Read-only filesystem: serve from memory instead
+                print(f"Failed to save knowledge index: {e}")
+                self._embeddings, self._idf = embeddings, idf
+                return
+
+        self._embeddings = np.load(embeddings_path, mmap_mode="r")
+        self._idf = np.load(idf_path)
+
+    @staticmethod
+    def _save_array(path: str, array: np.ndarray):
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+    def build_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Embed every passage; returns (L2-normalized embeddings, per-bucket idf)"""
+        # Titles are repeated so the topic words outweigh incidental mentions in the body
+        counts = np.stack([self.embedder.term_counts(f"{p.title}. {p.title}. {p.text}") for p in self.passages])
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = (np.log((1 + len(self.passages)) / (1 + document_frequency)) + 1.0).astype(np.float32)
+        embeddings = counts * idf
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return (embeddings / np.maximum(norms, 1e-9)).astype(np.float32), idf
+
+    def embed_query(self, query: str) -> Optional[np.ndarray]:
+        key = " ".join(query.lower().split())
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached
+
+        vector = self.embedder.term_counts(key) * self._idf
+        norm = float(np.linalg.norm(vector))
+        vector = vector / norm if norm > 0 else None
+
+        self._query_cache[key] = vector
+        while len(self._query_cache) > self.cache_size:
+            self._query_cache.popitem(last=False)
+        return vector
+
+    def search(self, query: str, k: int = None) -> List[Tuple[Passage, float]]:
+        """Most similar passages above min_score, best first"""
+        if not self._loaded:
+            self.load()
+        if self._embeddings is None or not self.passages:
+            return []
+
+        self.queries += 1
+        vector = self.embed_query(query)
+        if vector is None:
+            return []
+
+        k = min(k or self.top_k, len(self.passages))
+        scores = self._embeddings @ vector
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(self.passages[i], float(scores[i])) for i in top if scores[i] >= self.min_score]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "passages": len(self.passages),
+            "dim": self.embedder.dim,
+            "queries": self.queries,
+            "query_cache_hits": self.cache_hits,
+            "query_cache_size": len(self._query_cache)
+        }
+
+# Singleton instance
+knowledge_base = KnowledgeBase()
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import time
+from typing import List, Optional, Dict, Any, Callable, Awaitable
+import aiohttp
+from config import settings
+
+class LLMBackend:
+    """One Ollama server and its load/health state"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "available": self.available,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.consecutive_failures,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections
+        }
+
+class LLMBackendPool:
+    """Least-outstanding-requests balancing over several Ollama servers.
+
+    Backends that fail repeatedly (requests or active health checks) are
+    ejected for a cool-down period and readmitted by the first health check
+    after it that finds the configured model. Requests with a sticky key (chat sessions) use rendezvous
+    hashing, so the same conversation keeps landing on the same server and
+    its prompt cache stays warm; only sessions of an ejected node move.
+
+    Several local stub servers can be used for testing, e.g.
+    OLLAMA_BASE_URLS=http://localhost:11501,http://localhost:11502
+    """
+
+    def __init__(self, urls: List[str], eject_after_failures: int = None,
+                 eject_seconds: float = None, health_interval_seconds: float = None, model: str = None):
+        self.backends = [LLMBackend(url) for url in urls]
+        self.model = model or settings.ollama_model
+        self.eject_after_failures = eject_after_failures or settings.llm_backend_eject_after_failures
+        self.eject_seconds = eject_seconds or settings.llm_backend_eject_seconds
+        self.health_interval_seconds = health_interval_seconds or settings.llm_backend_health_interval_seconds
+        self._health_task: Optional[asyncio.Task] = None
+        self._next = 0
+
+    @classmethod
+    def from_settings(cls) -> "LLMBackendPool":
+        urls = [url.strip() for url in settings.ollama_base_urls.split(",") if url.strip()]
+        return cls(urls or [settings.ollama_base_url])
+
+    @staticmethod
+    def _score(key: str, backend: LLMBackend) -> int:
+        return int.from_bytes(hashlib.blake2b(f"{key}|{backend.url}".encode("utf-8"), digest_size=8).digest(), "big")
+
+    def choose(self, sticky_key: Optional[str] = None) -> LLMBackend:
+        candidates = [backend for backend in self.backends if backend.available]
+        if not candidates:
+            # Everything is ejected: try the node that comes back soonest rather than failing outright
+            return min(self.backends, key=lambda backend: backend.ejected_until)
+
+        if sticky_key:
+            return max(candidates, key=lambda backend: self._score(sticky_key, backend))
+
+        # Rotate the starting point so ties do not always pick the first node
+        self._next = (self._next + 1) % len(candidates)
+        rotated = candidates[self._next:] + candidates[:self._next]
+        return min(rotated, key=lambda backend: backend.outstanding)
+
+    def record_success(self, backend: LLMBackend):
+        backend.requests += 1
+        backend.consecutive_failures = 0
+
+    def record_failure(self, backend: LLMBackend):
+        backend.requests += 1
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.eject_after_failures and backend.available:
+            self.eject(backend)
+
+    def eject(self, backend: LLMBackend):
+        print(f"Ejecting LLM backend {backend.url} for {self.eject_seconds:.0f}s")
+        backend.ejected_until = time.monotonic() + self.eject_seconds
+        backend.ejections += 1
+
+    def serves_model(self, tags: Dict[str, Any]) -> bool:
+        """Whether an /api/tags body lists the configured model ("llama2" matches "llama2:latest")"""
+        wanted = self.model if ":" in self.model else f"{self.model}:latest"
+        for entry in tags.get("models") or []:
+            name = entry.get("name") or entry.get("model") or ""
+            if name == self.model or name == wanted:
+                return True
+        return False
+
+    async def check_health(self, session: aiohttp.ClientSession):
+        """Probe every backend once; readmit recovered ones and eject unreachable ones.
+
+        A backend is healthy only if it lists the configured model, since
+        /api/tags answers fine on a server that would 404 every generation.
+        A passing probe neither cuts an ejection short nor clears the
+        request failures of a backend that was never ejected.
+        """
+        async def probe(backend: LLMBackend):
+            try:
+                async with session.get(f"{backend.url}/api/tags", timeout=aiohttp.ClientTimeout(total=settings.llm_backend_health_timeout_seconds)) as response:
+                    healthy = response.status == 200 and self.serves_model(await response.json(content_type=None))
+            except Exception:
+                healthy = False
+
+            if healthy:
+                if backend.ejected_until and backend.available:
+                    print(f"Readmitting LLM backend {backend.url}")
+                    backend.ejected_until = 0.0
+                    backend.consecutive_failures = 0
+            elif backend.available:
+                self.eject(backend)
+
+        await asyncio.gather(*(probe(backend) for backend in self.backends))
+
+    async def _health_loop(self, get_session: Callable[[], Awaitable[aiohttp.ClientSession]]):
+        while True:
+            try:
+                await self.check_health(await get_session())
+            except Exception as e:
+                print(f"LLM backend health check error: {e}")
+            await asyncio.sleep(self.health_interval_seconds)
+
+    def start(self, get_session: Callable[[], Awaitable[aiohttp.ClientSession]]):
+        # A single backend has nowhere else to route, so active checks add nothing
+        if self._health_task is None and len(self.backends) > 1:
+            self._health_task = asyncio.create_task(self._health_loop(get_session))
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def get_metrics(self) -> List[Dict[str, Any]]:
+        return [backend.get_status() for backend in self.backends]
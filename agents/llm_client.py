@@ -0,0 +1,319 @@
+import asyncio
+import json
+import time
+from contextlib import aclosing
+from typing import Optional, Dict, Any, AsyncIterator, Callable, TypeVar
+import aiohttp
+from config import settings
+from json_stream import JSONObjectScanner
+from llm_scheduler import llm_scheduler, Priority, SchedulerOverloaded
+from llm_backends import LLMBackendPool, LLMBackend
+from circuit_breaker import CircuitBreaker
+
+T = TypeVar("T")
+
+# 404: model not pulled, 429: backend overloaded; both fail every request until fixed
+PERSISTENT_CLIENT_ERRORS = {404, 429}
+
+class OllamaClient:
+    """Shared async client for Ollama's /api/generate used by all LLM agents"""
+
+    def __init__(self):
+        self.pool = LLMBackendPool.from_settings()
+        self.breaker = CircuitBreaker("ollama")
+        self.model = settings.ollama_model
+        self.timeout = settings.llm_timeout_seconds
+        self.pool_size = settings.llm_pool_size
+
+        # Session is created lazily so it binds to the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.metrics = {
+            "requests": 0,
+            "successes": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "short_circuited": 0,
+            "in_flight": 0,
+            "total_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "streams": 0,
+            "total_ttft_ms": 0.0,
+            "json_calls": 0,
+            "json_chunks": 0,
+            "json_early_stops": 0,
+            "json_failures": 0
+        }
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled keep-alive session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=settings.llm_keepalive_seconds
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def acquire_slot(self, priority: Priority, timeout: Optional[float]) -> Optional[float]:
+        """Wait for a scheduler slot; returns the budget left for the HTTP call, or None if shed.
+
+        While the circuit breaker is open this returns None at once, without
+        queueing, so callers fall back immediately.
+        """
+        if not self.breaker.allow_request():
+            self.metrics["short_circuited"] += 1
+            return None
+
+        budget = timeout or self.timeout
+        started = time.perf_counter()
+        try:
+            await llm_scheduler.acquire(priority, budget)
+        except SchedulerOverloaded as e:
+            print(f"LLM request rejected: {e}")
+            self.metrics["rejected"] += 1
+            self.breaker.release()
+            return None
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        # Time spent queueing counts against the caller's budget
+        remaining = budget - (time.perf_counter() - started)
+        if remaining <= 0:
+            llm_scheduler.release()
+            self.breaker.release()
+            self.metrics["timeouts"] += 1
+            return None
+        return remaining
+
+    def record_status(self, backend: LLMBackend, status: int, elapsed_seconds: float):
+        """Server-side errors count against backend and breaker health, and so do 404 (model
+        not pulled) and 429 (overloaded), which persist until the backend is fixed; other
+        client errors are the request's fault and count as neither"""
+        if status >= 500 or status in PERSISTENT_CLIENT_ERRORS:
+            self.pool.record_failure(backend)
+            self.breaker.record_failure()
+        elif status < 400:
+            self.pool.record_success(backend)
+            self.breaker.record_success(elapsed_seconds)
+        else:
+            # Neither outcome says anything about the backend; just give back the probe slot
+            self.breaker.release()
+
+    async def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       timeout: Optional[float] = None, priority: Priority = Priority.ANALYZE,
+                       sticky_key: Optional[str] = None, **payload: Any) -> Optional[Dict[str, Any]]:
+        """Run a non-streaming generation and return Ollama's JSON body, or None on failure"""
+        body = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options or {}
+        }
+        body.update(payload)
+
+        self.metrics["requests"] += 1
+        remaining = await self.acquire_slot(priority, timeout)
+        if remaining is None:
+            return None
+
+        backend = self.pool.choose(sticky_key)
+        backend.outstanding += 1
+        self.metrics["in_flight"] += 1
+        started = time.perf_counter()
+        judged = False
+        try:
+            session = await self.get_session()
+            async with session.post(
+                f"{backend.url}/api/generate",
+                json=body,
+                timeout=aiohttp.ClientTimeout(total=remaining)
+            ) as response:
+                if response.status != 200:
+                    print(f"Ollama Error from {backend.url}: {response.status}")
+                    judged = True
+                    self.record_status(backend, response.status, time.perf_counter() - started)
+                    self.metrics["errors"] += 1
+                    return None
+                result = await response.json(content_type=None)
+                judged = True
+                self.pool.record_success(backend)
+                self.breaker.record_success(time.perf_counter() - started)
+                self.metrics["successes"] += 1
+                return result
+
+        except asyncio.TimeoutError:
+            print(f"Ollama request timed out on {backend.url}")
+            judged = True
+            self.pool.record_failure(backend)
+            self.breaker.record_failure()
+            self.metrics["timeouts"] += 1
+            return None
+        except Exception as e:
+            print(f"Ollama request error on {backend.url}: {e}")
+            judged = True
+            self.pool.record_failure(backend)
+            self.breaker.record_failure()
+            self.metrics["errors"] += 1
+            return None
+        finally:
+            if not judged:
+                self.breaker.release()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.metrics["total_latency_ms"] += elapsed_ms
+            self.metrics["max_latency_ms"] = max(self.metrics["max_latency_ms"], elapsed_ms)
+            self.metrics["in_flight"] -= 1
+            backend.outstanding -= 1
+            llm_scheduler.release()
+
+    async def stream_generate(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                              timeout: Optional[float] = None, priority: Priority = Priority.ANALYZE,
+                              sticky_key: Optional[str] = None, **payload: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Run a streaming generation, yielding each NDJSON chunk Ollama produces.
+
+        Stops silently on failure; callers check for a chunk with ``done`` set.
+        """
+        body = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": options or {}
+        }
+        body.update(payload)
+
+        self.metrics["requests"] += 1
+        self.metrics["streams"] += 1
+        remaining = await self.acquire_slot(priority, timeout)
+        if remaining is None:
+            return
+
+        backend = self.pool.choose(sticky_key)
+        backend.outstanding += 1
+        self.metrics["in_flight"] += 1
+        started = time.perf_counter()
+        first_token = True
+        judged = False
+        try:
+            session = await self.get_session()
+            async with session.post(
+                f"{backend.url}/api/generate",
+                json=body,
+                timeout=aiohttp.ClientTimeout(total=remaining)
+            ) as response:
+                if response.status != 200:
+                    print(f"Ollama Error from {backend.url}: {response.status}")
+                    judged = True
+                    self.record_status(backend, response.status, time.perf_counter() - started)
+                    self.metrics["errors"] += 1
+                    return
+
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if first_token:
+                        first_token = False
+                        ttft = time.perf_counter() - started
+                        self.metrics["total_ttft_ms"] += ttft * 1000
+                        # A stream is judged by its first token; long answers are not slow calls
+                        judged = True
+                        self.breaker.record_success(ttft)
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+                self.pool.record_success(backend)
+                self.metrics["successes"] += 1
+
+        except asyncio.TimeoutError:
+            print(f"Ollama stream timed out on {backend.url}")
+            self.pool.record_failure(backend)
+            if not judged:
+                judged = True
+                self.breaker.record_failure()
+            self.metrics["timeouts"] += 1
+        except Exception as e:
+            print(f"Ollama stream error on {backend.url}: {e}")
+            self.pool.record_failure(backend)
+            if not judged:
+                judged = True
+                self.breaker.record_failure()
+            self.metrics["errors"] += 1
+        finally:
+            if not judged:
+                self.breaker.release()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.metrics["total_latency_ms"] += elapsed_ms
+            self.metrics["max_latency_ms"] = max(self.metrics["max_latency_ms"], elapsed_ms)
+            self.metrics["in_flight"] -= 1
+            backend.outstanding -= 1
+            llm_scheduler.release()
+
+    async def generate_json(self, prompt: str, parse: Callable[[Dict[str, Any]], T],
+                            options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                            priority: Priority = Priority.ANALYZE, sticky_key: Optional[str] = None,
+                            **payload: Any) -> Optional[T]:
+        """Generate in Ollama's JSON mode and stop as soon as the top-level object closes.
+
+        ``parse`` turns the decoded object into a validated model and raises on
+        invalid data; None is returned when generation or validation fails.
+        """
+        self.metrics["json_calls"] += 1
+        scanner = JSONObjectScanner()
+        object_text = None
+        finished = False
+
+        # aclosing() makes breaking out close the HTTP response, which cancels generation
+        async with aclosing(self.stream_generate(prompt, options, timeout, priority, sticky_key, format="json", **payload)) as stream:
+            async for chunk in stream:
+                self.metrics["json_chunks"] += 1
+                object_text = scanner.feed(chunk.get("response", ""))
+                if object_text is not None:
+                    finished = chunk.get("done", False)
+                    break
+
+        if object_text is None:
+            self.metrics["json_failures"] += 1
+            return None
+
+        try:
+            result = parse(json.loads(object_text))
+        except Exception as e:
+            print(f"Structured output failed validation: {e}")
+            self.metrics["json_failures"] += 1
+            return None
+
+        if not finished:
+            self.metrics["json_early_stops"] += 1
+        return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Snapshot of client metrics for the /metrics endpoint"""
+        completed = self.metrics["successes"] + self.metrics["errors"] + self.metrics["timeouts"]
+        avg_latency = self.metrics["total_latency_ms"] / completed if completed else 0.0
+        streams = self.metrics["streams"]
+        avg_ttft = self.metrics["total_ttft_ms"] / streams if streams else 0.0
+        json_calls = self.metrics["json_calls"]
+        return {
+            **self.metrics,
+            "avg_latency_ms": round(avg_latency, 2),
+            "avg_ttft_ms": round(avg_ttft, 2),
+            "avg_json_chunks": round(self.metrics["json_chunks"] / json_calls, 1) if json_calls else 0.0,
+            "pool_size": self.pool_size,
+            "circuit_breaker": self.breaker.get_status()
+        }
+
+    def start(self):
+        """Start background health checks of the LLM backends"""
+        self.pool.start(self.get_session)
+
+    async def close(self):
+        await self.pool.stop()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+# Singleton instance
+llm_client = OllamaClient()
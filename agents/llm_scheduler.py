@@ -0,0 +1,117 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Optional, Dict, Any, List, Tuple
+from config import settings
+
+class Priority(IntEnum):
+    """LLM request classes; lower values are served first"""
+    CRITICAL = 0  # Medical assessments that may set requires_sos
+    ANALYZE = 1   # Regular /analyze work (medical, nutrition)
+    CHAT = 2      # Pet Whisperer conversations
+
+class SchedulerOverloaded(Exception):
+    """Raised when a priority queue is full or the wait exceeds its limit"""
+    pass
+
+class LLMScheduler:
+    """Priority scheduler in front of the LLM with a concurrency cap and bounded queues"""
+
+    def __init__(self, max_concurrency: int = None, queue_limits: Dict[Priority, int] = None,
+                 max_wait_seconds: float = None):
+        self.max_concurrency = max_concurrency or settings.llm_max_concurrency
+        self.queue_limits = queue_limits or {
+            Priority.CRITICAL: settings.llm_queue_limit_critical,
+            Priority.ANALYZE: settings.llm_queue_limit_analyze,
+            Priority.CHAT: settings.llm_queue_limit_chat
+        }
+        self.max_wait_seconds = max_wait_seconds or settings.llm_queue_max_wait_seconds
+
+        self.active = 0
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+        self.queued = {priority: 0 for priority in Priority}
+        self.admitted = {priority: 0 for priority in Priority}
+        self.rejected = {priority: 0 for priority in Priority}
+        self.total_wait_ms = {priority: 0.0 for priority in Priority}
+
+    async def acquire(self, priority: Priority, timeout: Optional[float] = None):
+        """Wait for a slot; raises SchedulerOverloaded instead of queueing without bound"""
+        if self.active < self.max_concurrency and not self._heap:
+            self.active += 1
+            self.admitted[priority] += 1
+            return
+
+        if self.queued[priority] >= self.queue_limits[priority]:
+            self.rejected[priority] += 1
+            raise SchedulerOverloaded(f"{priority.name} queue full ({self.queued[priority]} waiting)")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._heap, entry)
+        self.queued[priority] += 1
+        started = time.perf_counter()
+        wait = min(timeout, self.max_wait_seconds) if timeout is not None else self.max_wait_seconds
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as the wait expired; keep it
+                pass
+            else:
+                self.discard(entry)
+                self.rejected[priority] += 1
+                raise SchedulerOverloaded(f"{priority.name} request waited more than {wait:.1f}s")
+        except asyncio.CancelledError:
+            # Caller went away; give back a slot that was already handed over
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self.discard(entry)
+            raise
+        finally:
+            self.queued[priority] -= 1
+
+        self.admitted[priority] += 1
+        self.total_wait_ms[priority] += (time.perf_counter() - started) * 1000
+
+    def discard(self, entry: Tuple[int, int, asyncio.Future]):
+        """Drop an abandoned waiter so it never blocks the fast path"""
+        entry[2].cancel()
+        try:
+            self._heap.remove(entry)
+            heapq.heapify(self._heap)
+        except ValueError:
+            pass
+
+    def release(self):
+        """Free a slot, handing it directly to the highest-priority live waiter"""
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queues": {
+                priority.name.lower(): {
+                    "queued": self.queued[priority],
+                    "limit": self.queue_limits[priority],
+                    "admitted": self.admitted[priority],
+                    "rejected": self.rejected[priority],
+                    "avg_wait_ms": round(self.total_wait_ms[priority] / self.admitted[priority], 2) if self.admitted[priority] else 0.0
+                }
+                for priority in Priority
+            }
+        }
+
+# Singleton instance
+llm_scheduler = LLMScheduler()
@@ -1,14 +1,29 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from models import (
-    AnalyzeRequest, AnalyzeResponse, ChatRequest, ChatResponse,
-    SOSRequest, SOSResponse, Severity
+    AnalyzeRequest, AnalyzeResponse, StoredVisionAnalysis, VisionAnalysisResult,
+    ChatRequest, ChatResponse, SOSRequest, SOSResponse, SOSBatchRequest, SOSStatusResponse, Severity
 )
 from vision_agent import vision_agent
 from medical_agent import medical_agent
 from chat_agent import pet_whisperer_agent
 from nutrition_agent import nutrition_agent
 from sos_agent import sos_agent
+from llm_client import llm_client
+from overpass_client import overpass_client
+from notification_outbox import notification_outbox
+from geocoder import reverse_geocoder
+from llm_scheduler import llm_scheduler
+from knowledge_base import knowledge_base
+from chat_sessions import chat_session_store, SessionNotFound
+from analysis_store import analysis_store, AnalysisNotFound, StoredAnalysis
+from request_coalescer import SingleFlight
+from deadline import Deadline, DeadlineExceeded
+from config import settings
+from typing import Optional, Tuple
 import uvicorn
 
 # Create FastAPI app
@@ -18,6 +33,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Coalesces identical in-flight /analyze requests
+analyze_flights = SingleFlight("analyze")
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +45,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_event():
+    """Start background health checks of the LLM backends, the notification workers and open the knowledge index"""
+    llm_client.start()
+    notification_outbox.start()
+    if pet_whisperer_agent.prompt_builder.knowledge is not None:
+        knowledge_base.load()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled connections and write pending cache changes on shutdown"""
+    await llm_client.close()
+    await overpass_client.close()
+    await notification_outbox.stop()
+    await reverse_geocoder.close()
+    analysis_store.close()
+    if medical_agent.cache is not None:
+        await medical_agent.cache.flush()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -45,8 +82,11 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
+    breaker = llm_client.breaker.get_status()
     return {
-        "status": "healthy",
+        # LLM agents still answer from their fallbacks while the breaker is open
+        "status": "healthy" if breaker["state"] == "closed" else "degraded",
+        "llm": breaker,
         "agents": {
             "vision": "ready",
             "medical": "ready",
@@ -56,40 +96,122 @@ async def health_check():
         }
     }
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_animal(request: AnalyzeRequest):
+@app.get("/metrics")
+async def metrics():
+    """LLM client, scheduler and cache metrics (pool usage, queues, latency, hit rates)"""
+    return {
+        "llm": llm_client.get_metrics(),
+        "llm_scheduler": llm_scheduler.get_metrics(),
+        "llm_backends": llm_client.pool.get_metrics(),
+        "medical_cache": medical_agent.cache.get_metrics() if medical_agent.cache else None,
+        "medical_paths": medical_agent.path_counts,
+        "chat_sessions": chat_session_store.get_metrics(),
+        "knowledge_base": knowledge_base.get_metrics(),
+        "analyze_coalescing": analyze_flights.get_metrics(),
+        "analysis_store": analysis_store.get_metrics(),
+        "rescue_tiles": sos_agent.tile_cache.get_metrics(),
+        "road_graph": sos_agent.road_graph.get_metrics(),
+        "overpass": overpass_client.get_metrics(),
+        "notifications": notification_outbox.get_metrics(),
+        "geocoder": reverse_geocoder.get_metrics()
+    }
+
+async def run_analysis(request: AnalyzeRequest, deadline: Deadline) -> AnalyzeResponse:
     """
     Complete animal analysis pipeline:
     1. Vision analysis (species, emotion, health issues)
     2. Medical assessment (severity, care instructions)
-    3. Nutrition planning
+    3. Nutrition planning (started speculatively alongside step 2)
+    Each stage sizes its timeouts to what is left of the request deadline.
+    The results are stored under the returned analysis_id for follow-up calls.
     """
+    # Step 1: Vision Analysis
+    vision_result = await vision_agent.analyze(request.image_url, deadline)
+    
+    # Step 2: Speculatively start nutrition planning from a provisional
+    # assessment so both LLM generations run at the same time
+    provisional_assessment = medical_agent.estimate_assessment(vision_result)
+    nutrition_task = asyncio.create_task(
+        nutrition_agent.create_plan(vision_result, provisional_assessment, deadline)
+    )
+    
+    # Step 3: Medical Assessment
     try:
-        # Step 1: Vision Analysis
-        vision_result = await vision_agent.analyze(request.image_url)
-        
-        # Step 2: Medical Assessment
         medical_assessment = await medical_agent.assess(
             vision_result,
-            request.user_notes
+            request.user_notes,
+            deadline
         )
-        
-        # Step 3: Nutrition Planning
+    except BaseException:
+        # Covers client disconnects (CancelledError) as well as failures
+        nutrition_task.cancel()
+        raise
+    
+    # Step 4: Keep the speculative plan unless the severity changed its basis
+    if nutrition_agent.is_plan_reusable(provisional_assessment, medical_assessment):
+        nutrition_plan = await nutrition_task
+    else:
+        print(f"Regenerating nutrition plan: severity {provisional_assessment.severity.value} -> {medical_assessment.severity.value}")
+        nutrition_task.cancel()
         nutrition_plan = await nutrition_agent.create_plan(
             vision_result,
-            medical_assessment
+            medical_assessment,
+            deadline
         )
-        
-        # Determine if SOS is required
-        requires_sos = medical_assessment.severity == Severity.CRITICAL
-        
-        return AnalyzeResponse(
-            vision_analysis=vision_result,
-            medical_assessment=medical_assessment,
-            nutrition_plan=nutrition_plan,
-            requires_sos=requires_sos
+    
+    # Determine if SOS is required
+    requires_sos = medical_assessment.severity == Severity.CRITICAL
+    
+    analysis_id = analysis_store.create(vision_result, medical_assessment, request.user_notes, nutrition_plan)
+    
+    return AnalyzeResponse(
+        vision_analysis=vision_result,
+        medical_assessment=medical_assessment,
+        nutrition_plan=nutrition_plan,
+        requires_sos=requires_sos,
+        analysis_id=analysis_id
+    )
+
+def require_image_url(request: AnalyzeRequest):
+    if not request.image_url:
+        raise HTTPException(status_code=422, detail="image_url is required")
+
+def require_vision_source(request: AnalyzeRequest):
+    if not (request.analysis_id or request.vision_analysis or request.image_url):
+        raise HTTPException(status_code=422, detail="Provide analysis_id, vision_analysis or image_url")
+
+async def resolve_vision(request: AnalyzeRequest, deadline: Deadline) -> Tuple[VisionAnalysisResult, Optional[StoredAnalysis]]:
+    """
+    Vision result for a single-stage endpoint, cheapest source first:
+    a stored run (analysis_id), an inline result, or a fresh image analysis.
+    Also returns the stored run so later stages can reuse and extend it.
+    """
+    if request.analysis_id:
+        stored = analysis_store.get(request.analysis_id)
+        return stored.vision, stored
+    if request.vision_analysis is not None:
+        return request.vision_analysis, None
+    return await vision_agent.analyze(request.image_url, deadline), None
+
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_animal(request: AnalyzeRequest, x_request_deadline_ms: Optional[int] = Header(None)):
+    """
+    Complete animal analysis. Identical concurrent requests (retries,
+    double submits) share one pipeline run and all receive its result.
+    The X-Request-Deadline-Ms header sets the time budget for the run.
+    """
+    require_image_url(request)
+    deadline = Deadline.from_header(x_request_deadline_ms)
+    try:
+        key = SingleFlight.make_key(request.image_url, request.user_notes, request.user_location)
+        # Past the deadline nobody reads the result, so stop the work
+        return await asyncio.wait_for(
+            analyze_flights.run(key, lambda: run_analysis(request, deadline), deadline),
+            deadline.remaining()
         )
     
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        raise HTTPException(status_code=504, detail="Analysis exceeded the request deadline")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
@@ -102,16 +224,37 @@ async def chat_with_pet_whisperer(request: ChatRequest):
         response = await pet_whisperer_agent.chat(request)
         return response
     
+    except SessionNotFound:
+        raise HTTPException(status_code=409, detail="session_not_found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_stream_with_pet_whisperer(request: ChatRequest):
+    """
+    Streaming chat with the Pet Whisperer agent.
+    Returns NDJSON: one {"type": "token"} event per generated chunk,
+    then a final {"type": "done"} event carrying suggestions.
+    """
+    # Resolve the session before streaming starts so a miss can still return 409
+    try:
+        turn = pet_whisperer_agent.prepare_turn(request)
+    except SessionNotFound:
+        raise HTTPException(status_code=409, detail="session_not_found")
+    
+    async def event_stream():
+        async for event in pet_whisperer_agent.chat_stream(request, turn):
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @app.post("/sos", response_model=SOSResponse)
 async def activate_sos_rescue(request: SOSRequest):
     """
     Activate SOS rescue protocol:
     1. Find nearby veterinary clinics and rescue centers
     2. Generate SOS message
-    3. Send notifications via WhatsApp/Email
+    3. Queue notifications via WhatsApp/Email (delivered in the background)
     """
     try:
         response = await sos_agent.activate_sos(request)
@@ -120,33 +263,93 @@ async def activate_sos_rescue(request: SOSRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"SOS activation failed: {str(e)}")
 
-@app.post("/vision/analyze")
+@app.post("/sos/batch")
+async def activate_sos_batch(request: SOSBatchRequest):
+    """
+    Bulk SOS for mass incidents (floods, heatwaves). Reports in the same
+    region share one rescue-center lookup. Returns NDJSON: one
+    {"type": "result", "index", "response"} event per report as its region
+    completes, then a final {"type": "done"} event.
+    """
+    if len(request.reports) > settings.sos_batch_max_reports:
+        raise HTTPException(status_code=413, detail=f"At most {settings.sos_batch_max_reports} reports per batch")
+    
+    async def event_stream():
+        async for index, response in sos_agent.activate_sos_batch(request.reports):
+            yield json.dumps({"type": "result", "index": index, "response": response.model_dump()}) + "\n"
+        yield json.dumps({"type": "done", "count": len(request.reports)}) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.get("/sos/{sos_id}/status", response_model=SOSStatusResponse)
+async def sos_notification_status(sos_id: str):
+    """Delivery status of the notifications queued by an SOS"""
+    notifications = notification_outbox.status(sos_id)
+    if not notifications:
+        raise HTTPException(status_code=404, detail="SOS not found")
+    return SOSStatusResponse(
+        sos_id=sos_id,
+        notifications=notifications,
+        delivered=all(notification["status"] == "delivered" for notification in notifications)
+    )
+
+@app.post("/vision/analyze", response_model=StoredVisionAnalysis)
 async def vision_only_analysis(request: AnalyzeRequest):
-    """Vision analysis only (for testing)"""
+    """Vision analysis only; the returned analysis_id lets the medical and nutrition endpoints skip it"""
+    require_image_url(request)
     try:
         result = await vision_agent.analyze(request.image_url)
-        return result
+        analysis_id = analysis_store.create(result)
+        return StoredVisionAnalysis(**result.model_dump(), analysis_id=analysis_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Vision analysis failed: {str(e)}")
 
 @app.post("/medical/assess")
-async def medical_only_assessment(request: AnalyzeRequest):
-    """Medical assessment only (requires vision analysis first)"""
+async def medical_only_assessment(request: AnalyzeRequest, x_request_deadline_ms: Optional[int] = Header(None)):
+    """
+    Medical assessment only. Pass the analysis_id from /analyze or
+    /vision/analyze (or an inline vision_analysis) to skip vision; a stored
+    assessment made with the same notes is returned as is.
+    """
+    require_vision_source(request)
+    deadline = Deadline.from_header(x_request_deadline_ms)
     try:
-        vision_result = await vision_agent.analyze(request.image_url)
-        medical_assessment = await medical_agent.assess(vision_result, request.user_notes)
+        vision_result, stored = await resolve_vision(request, deadline)
+        if stored is not None and stored.medical_for(request.user_notes) is not None:
+            return stored.medical
+        medical_assessment = await medical_agent.assess(vision_result, request.user_notes, deadline)
+        if stored is not None:
+            analysis_store.update(stored, medical=medical_assessment, user_notes=request.user_notes)
         return medical_assessment
+    except AnalysisNotFound:
+        raise HTTPException(status_code=404, detail="analysis_not_found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Medical assessment failed: {str(e)}")
 
 @app.post("/nutrition/plan")
-async def nutrition_only_plan(request: AnalyzeRequest):
-    """Nutrition planning only"""
+async def nutrition_only_plan(request: AnalyzeRequest, x_request_deadline_ms: Optional[int] = Header(None)):
+    """
+    Nutrition planning only. With an analysis_id the stored vision result
+    and medical assessment are reused, so only the plan is generated (or
+    nothing at all if the run already has one).
+    """
+    require_vision_source(request)
+    deadline = Deadline.from_header(x_request_deadline_ms)
     try:
-        vision_result = await vision_agent.analyze(request.image_url)
-        medical_assessment = await medical_agent.assess(vision_result)
-        nutrition_plan = await nutrition_agent.create_plan(vision_result, medical_assessment)
+        vision_result, stored = await resolve_vision(request, deadline)
+        medical_assessment = stored.medical_for(request.user_notes) if stored is not None else None
+        if medical_assessment is not None and stored.nutrition is not None:
+            return stored.nutrition
+        if medical_assessment is None:
+            medical_assessment = await medical_agent.assess(vision_result, request.user_notes, deadline)
+            if stored is not None:
+                analysis_store.update(stored, medical=medical_assessment, user_notes=request.user_notes)
+        nutrition_plan = await nutrition_agent.create_plan(vision_result, medical_assessment, deadline)
+        if stored is not None:
+            analysis_store.update(stored, nutrition=nutrition_plan)
         return nutrition_plan
+    except AnalysisNotFound:
+        raise HTTPException(status_code=404, detail="analysis_not_found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Nutrition planning failed: {str(e)}")
 
@@ -1,14 +1,56 @@
 from typing import Optional
-import requests
 from models import VisionAnalysisResult, MedicalAssessment, Severity
 from config import settings
+from llm_client import llm_client
+from llm_scheduler import Priority
+from deadline import Deadline
+from response_cache import ResponseCache
+from medical_rules import medical_rule_engine
+from keyword_matcher import keyword_matcher
+import hashlib
 import json
+import re
+
+# Bump whenever create_medical_prompt changes so cached assessments are invalidated
+PROMPT_VERSION = "medical-v1"
 
 class MedicalReasoningAgent:
     def __init__(self):
         self.llm_provider = settings.llm_provider
         self.ollama_base_url = settings.ollama_base_url
         self.ollama_model = settings.ollama_model
+        
+        self.cache = ResponseCache(
+            version=f"{self.ollama_model}:{PROMPT_VERSION}",
+            max_entries=settings.medical_cache_max_entries,
+            ttl_seconds=settings.medical_cache_ttl_seconds,
+            persist_path=settings.medical_cache_path,
+            save_delay_seconds=settings.medical_cache_save_delay_seconds
+        ) if settings.medical_cache_enabled else None
+        
+        # How many assessments each path answered
+        self.path_counts = {"no_issues": 0, "rules": 0, "cache": 0, "llm": 0, "fallback": 0}
+    
+    def feature_signature(self, vision_result: VisionAnalysisResult, user_notes: Optional[str] = None) -> str:
+        """Normalized cache key covering everything create_medical_prompt depends on"""
+        bucket = settings.medical_cache_confidence_bucket
+        significant_issues = [issue for issue in vision_result.health_issues if issue.confidence > 0.55]
+        
+        # Issue names embed their confidence, e.g. "Possible Dehydration (62% confidence)"
+        issues = sorted(
+            (re.sub(r"\s*\(\d+% confidence\)", "", issue.issue).strip().lower(), int(issue.confidence / bucket))
+            for issue in significant_issues
+        )
+        notes = " ".join(user_notes.lower().split()) if user_notes else ""
+        
+        signature = {
+            "species": vision_result.species.value,
+            "emotion": vision_result.emotional_state.value,
+            "emotion_uncertain": vision_result.emotion_confidence < 0.65,
+            "issues": issues,
+            "notes": hashlib.sha1(notes.encode("utf-8")).hexdigest() if notes else None
+        }
+        return hashlib.sha256(json.dumps(signature, sort_keys=True).encode("utf-8")).hexdigest()
     
     def create_medical_prompt(self, vision_result: VisionAnalysisResult, user_notes: Optional[str] = None) -> str:
         """Create a detailed prompt for medical assessment with confidence awareness"""
@@ -79,34 +121,23 @@ Be empathetic but direct. Prioritize animal safety. If in doubt, recommend veter
         
         return prompt
     
-    async def get_llm_response(self, prompt: str) -> str:
-        """Get response from Ollama (free local LLM)"""
-        try:
-            # Call Ollama API
-            response = requests.post(
-                f"{self.ollama_base_url}/api/generate",
-                json={
-                    "model": self.ollama_model,
-                    "prompt": f"You are a veterinary expert. {prompt}",
-                    "stream": False,
-                    "options": {
-                        "temperature": settings.llm_temperature,
-                        "num_predict": settings.max_tokens
-                    }
-                },
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "")
-            else:
-                print(f"Ollama Error: {response.status_code}")
-                return self.generate_fallback_response(None)
+    async def get_llm_assessment(self, prompt: str, priority: Priority = Priority.ANALYZE,
+                                 timeout: Optional[float] = None) -> Optional[MedicalAssessment]:
+        """Get a schema-validated assessment from Ollama (free local LLM) in JSON mode.
         
-        except Exception as e:
-            print(f"LLM Error: {e}")
-            return self.generate_fallback_response(None)
+        Generation stops as soon as the JSON object is closed; None means the
+        caller should use the vision-based fallback (never cached).
+        """
+        return await llm_client.generate_json(
+            f"You are a veterinary expert. {prompt}",
+            self.assessment_from_dict,
+            options={
+                "temperature": settings.llm_temperature,
+                "num_predict": settings.max_tokens
+            },
+            timeout=timeout,
+            priority=priority
+        )
     
     def generate_fallback_response(self, vision_result: Optional[VisionAnalysisResult] = None) -> str:
         """Generate intelligent fallback response based on vision analysis"""
@@ -117,22 +148,19 @@ Be empathetic but direct. Prioritize animal safety. If in doubt, recommend veter
             summary = "No significant health issues detected. Animal appears to be in acceptable condition. Regular monitoring recommended."
         else:
             # STRICT severity assessment based on confidence and issue type
-            critical_keywords = ['severe', 'critical', 'bleeding', 'emaciated']
-            urgent_keywords = ['infection', 'wound', 'injury', 'severe malnutrition']
-            moderate_keywords = ['mange', 'dermatitis', 'dehydration', 'possible']
-            
             # Filter by confidence - only consider significant findings
             high_confidence_issues = [issue for issue in vision_result.health_issues if issue.confidence > 0.70]
             moderate_confidence_issues = [issue for issue in vision_result.health_issues if 0.60 <= issue.confidence <= 0.70]
             
             max_confidence = max([issue.confidence for issue in vision_result.health_issues])
-            issue_texts = [issue.issue.lower() + ' ' + issue.description.lower() for issue in vision_result.health_issues]
-            combined_text = ' '.join(issue_texts)
+            issue_texts = [issue.issue + ' ' + issue.description for issue in vision_result.health_issues]
+            # Critical/urgent/moderate keywords (see keyword_matcher.KEYWORD_TABLES) in one pass
+            hits = keyword_matcher.match(' '.join(issue_texts))
             
             # Determine severity with STRICT thresholds
-            has_critical = any(keyword in combined_text for keyword in critical_keywords)
-            has_urgent = any(keyword in combined_text for keyword in urgent_keywords)
-            has_moderate = any(keyword in combined_text for keyword in moderate_keywords)
+            has_critical = "medical.critical" in hits
+            has_urgent = "medical.urgent" in hits
+            has_moderate = "medical.moderate" in hits
             
             # CRITICAL: Only if multiple HIGH confidence issues or severe keywords with high confidence
             if (has_critical and max_confidence > 0.75 and len(high_confidence_issues) >= 2) or (max_confidence > 0.85 and len(high_confidence_issues) >= 3):
@@ -184,42 +212,49 @@ Be empathetic but direct. Prioritize animal safety. If in doubt, recommend veter
             "estimated_urgency_hours": urgency
         })
     
+    def estimate_assessment(self, vision_result: VisionAnalysisResult) -> MedicalAssessment:
+        """Cheap provisional assessment from vision results alone (no LLM call)"""
+        significant_issues = [issue for issue in vision_result.health_issues if issue.confidence > 0.55]
+        if not significant_issues:
+            return self.parse_assessment(self.generate_fallback_response(None))
+        return self.parse_assessment(self.generate_fallback_response(vision_result), vision_result)
+    
+    def assessment_from_dict(self, data: dict) -> MedicalAssessment:
+        """Validate decoded JSON against MedicalAssessment (raises on invalid data)"""
+        return MedicalAssessment(
+            severity=Severity(data['severity']),
+            condition_summary=data['condition_summary'],
+            immediate_actions=data['immediate_actions'],
+            care_instructions=data['care_instructions'],
+            warning_signs=data['warning_signs'],
+            estimated_urgency_hours=data.get('estimated_urgency_hours')
+        )
+    
     def parse_assessment(self, llm_response: str, vision_result: Optional[VisionAnalysisResult] = None) -> Optional[MedicalAssessment]:
-        """Parse LLM response into MedicalAssessment"""
+        """Parse a JSON response string into MedicalAssessment"""
         try:
-            # Try to extract JSON from response
-            start = llm_response.find('{')
-            end = llm_response.rfind('}') + 1
-            
-            if start >= 0 and end > start:
-                json_str = llm_response[start:end]
-                data = json.loads(json_str)
-            else:
-                data = json.loads(llm_response)
-            
-            return MedicalAssessment(
-                severity=Severity(data['severity']),
-                condition_summary=data['condition_summary'],
-                immediate_actions=data['immediate_actions'],
-                care_instructions=data['care_instructions'],
-                warning_signs=data['warning_signs'],
-                estimated_urgency_hours=data.get('estimated_urgency_hours')
-            )
+            return self.assessment_from_dict(json.loads(llm_response))
         
         except Exception as e:
             print(f"Error parsing assessment: {e}")
-            print(f"LLM Response was: {llm_response[:200] if llm_response else 'None'}...")
+            print(f"Response was: {llm_response[:200] if llm_response else 'None'}...")
             # Return None to trigger fallback in assess method
             return None
     
-    async def assess(self, vision_result: VisionAnalysisResult, user_notes: Optional[str] = None) -> MedicalAssessment:
-        """Perform complete medical assessment with confidence-based validation"""
+    async def assess(self, vision_result: VisionAnalysisResult, user_notes: Optional[str] = None,
+                     deadline: Optional[Deadline] = None) -> MedicalAssessment:
+        """Perform complete medical assessment with confidence-based validation.
+        
+        With a deadline, the LLM call is sized to the remaining budget and
+        skipped in favour of the deterministic fallback when time is short.
+        """
         try:
             # Filter health issues by confidence threshold
             significant_issues = [issue for issue in vision_result.health_issues if issue.confidence > 0.55]
             
             # If no SIGNIFICANT health issues detected, return NORMAL assessment
             if not significant_issues:
+                self.path_counts["no_issues"] += 1
                 return MedicalAssessment(
                     severity=Severity.NORMAL,
                     condition_summary="No significant health concerns detected with sufficient confidence. Animal appears to be in acceptable condition. Continue monitoring and provide routine care.",
@@ -229,18 +264,44 @@ Be empathetic but direct. Prioritize animal safety. If in doubt, recommend veter
                     estimated_urgency_hours=None
                 )
             
-            # Create prompt with confidence-aware context
-            prompt = self.create_medical_prompt(vision_result, user_notes)
+            # Common single-issue cases are answered by the compiled rule table
+            rule_assessment = medical_rule_engine.assess(vision_result, user_notes)
+            if rule_assessment is not None:
+                self.path_counts["rules"] += 1
+                return rule_assessment
             
-            # Get LLM response
-            llm_response = await self.get_llm_response(prompt)
+            # Repeat scenarios are answered from the response cache
+            cache_key = self.feature_signature(vision_result, user_notes) if self.cache else None
+            cached = self.cache.get(cache_key) if self.cache else None
             
-            # Parse and return assessment
-            assessment = self.parse_assessment(llm_response, vision_result)
+            if cached is not None:
+                self.path_counts["cache"] += 1
+                assessment = MedicalAssessment(**cached)
+            elif deadline is not None and not deadline.allows(settings.llm_min_budget_seconds):
+                print(f"Only {deadline.remaining():.1f}s left, skipping LLM assessment")
+                assessment = None
+            else:
+                # Create prompt with confidence-aware context
+                prompt = self.create_medical_prompt(vision_result, user_notes)
+                
+                # Possibly SOS-worthy cases jump ahead of routine analyze and chat traffic
+                provisional = self.estimate_assessment(vision_result)
+                priority = Priority.CRITICAL if provisional.severity in (Severity.URGENT, Severity.CRITICAL) else Priority.ANALYZE
+                
+                # Get structured LLM assessment
+                timeout = deadline.timeout(settings.llm_timeout_seconds) if deadline else None
+                assessment = await self.get_llm_assessment(prompt, priority, timeout)
+                
+                # Only genuine LLM answers are cached, never fallbacks
+                if assessment is not None:
+                    self.path_counts["llm"] += 1
+                    if self.cache:
+                        self.cache.set(cache_key, assessment.model_dump(mode="json"))
             
-            # If parsing failed, use intelligent fallback
+            # If generation or validation failed, use intelligent fallback
             if assessment is None:
-                print("LLM parsing failed, using intelligent fallback based on vision analysis")
+                print("LLM assessment unavailable, using intelligent fallback based on vision analysis")
+                self.path_counts["fallback"] += 1
                 fallback_response = self.generate_fallback_response(vision_result)
                 assessment = self.parse_assessment(fallback_response, vision_result)
             
@@ -0,0 +1,347 @@
+import re
+from bisect import bisect_right
+from typing import List, Optional, Dict, NamedTuple
+from models import VisionAnalysisResult, MedicalAssessment, Severity, HealthIssue
+
+class Band(NamedTuple):
+    """Confidence band [min_confidence, max_confidence) answered deterministically"""
+    min_confidence: float
+    max_confidence: float
+    severity: Severity
+    urgency_hours: Optional[int]
+
+class IssueRule(NamedTuple):
+    category: str
+    pattern: str
+    bands: List[Band]
+    immediate_actions: List[str]
+    care_instructions: List[str]
+    warning_signs: List[str]
+
+# Confidences between bands are deliberately left uncovered: those cases are
+# ambiguous and go to the LLM. Severities follow the same thresholds as
+# MedicalReasoningAgent.generate_fallback_response and the validation in assess():
+# URGENT needs confidence above 0.70, so no URGENT band starts at or below it.
+RULES: List[IssueRule] = [
+    IssueRule(
+        category="mange",
+        pattern=r"mange|scabies",
+        bands=[Band(0.55, 0.70, Severity.LOW, 96), Band(0.80, 1.01, Severity.URGENT, 12)],
+        immediate_actions=[
+            "Isolate the animal from other pets - mange can be highly contagious",
+            "Wear gloves when handling and wash hands thoroughly afterwards",
+            "Wash bedding in hot water and clean resting areas",
+            "Prevent scratching that can break the skin and cause infection",
+            "Schedule a veterinary skin scraping to confirm the mite type"
+        ],
+        care_instructions=[
+            "Use only vet-prescribed antiparasitic treatment; do not use home remedies",
+            "Treat all animals in contact, even without symptoms",
+            "Keep the skin clean and dry between treatments",
+            "Provide a high-quality diet to support skin recovery",
+            "Repeat cleaning of bedding and environment weekly during treatment",
+            "Attend follow-up scrapings until the vet confirms clearance"
+        ],
+        warning_signs=[
+            "Open sores, crusting or oozing skin",
+            "Spreading hair loss over large areas of the body",
+            "Foul smell from the skin (secondary infection)",
+            "Lethargy, weight loss or loss of appetite",
+            "Itching in people or other animals in the household"
+        ]
+    ),
+    IssueRule(
+        category="skin_infection",
+        pattern=r"pyoderma|bacterial dermatitis|fungal dermatitis|ringworm",
+        bands=[Band(0.55, 0.70, Severity.LOW, 96), Band(0.80, 1.01, Severity.URGENT, 24)],
+        immediate_actions=[
+            "Keep the affected area clean and dry",
+            "Prevent licking or scratching of the lesions",
+            "Wear gloves when handling - ringworm is contagious to humans",
+            "Separate from other pets until diagnosed",
+            "Book a veterinary visit for diagnosis and medication"
+        ],
+        care_instructions=[
+            "Complete the full course of prescribed antibiotics or antifungals",
+            "Use medicated shampoos only as directed by a veterinarian",
+            "Disinfect bedding, brushes and collars regularly",
+            "Trim hair around lesions only if advised by the vet",
+            "Check for underlying causes such as allergies or parasites",
+            "Monitor lesions daily and note any spread"
+        ],
+        warning_signs=[
+            "Lesions spreading or increasing in size",
+            "Pus, bleeding or foul odour from the skin",
+            "Fever, lethargy or loss of appetite",
+            "Circular lesions appearing on people in the household"
+        ]
+    ),
+    IssueRule(
+        category="dermatitis",
+        pattern=r"allergic dermatitis|seborrheic dermatitis|contact dermatitis|skin condition",
+        bands=[Band(0.55, 0.80, Severity.LOW, 120), Band(0.85, 1.01, Severity.URGENT, 24)],
+        immediate_actions=[
+            "Rinse the affected area gently with lukewarm water",
+            "Remove possible irritants such as new bedding, cleaners or foods",
+            "Prevent excessive scratching or licking",
+            "Monitor the skin for changes over the next few days"
+        ],
+        care_instructions=[
+            "Keep a record of foods and environments to identify triggers",
+            "Bathe only with mild, pet-safe shampoo",
+            "Provide a balanced diet rich in omega-3 fatty acids",
+            "Keep the coat brushed and free of debris",
+            "Schedule a veterinary checkup if there is no improvement within a week"
+        ],
+        warning_signs=[
+            "Open wounds from scratching",
+            "Swelling of the face or muzzle",
+            "Skin becoming hot, wet or smelly",
+            "Rapid spread of redness or hair loss"
+        ]
+    ),
+    IssueRule(
+        category="eye_infection",
+        pattern=r"conjunctivitis|eye infection",
+        bands=[Band(0.55, 0.70, Severity.LOW, 48), Band(0.80, 1.01, Severity.URGENT, 24)],
+        immediate_actions=[
+            "Gently wipe discharge away with a clean, damp cloth (one cloth per eye)",
+            "Prevent rubbing or pawing at the eye",
+            "Keep the animal away from dust, smoke and wind",
+            "Separate from other animals - eye infections can spread",
+            "Arrange a veterinary eye examination"
+        ],
+        care_instructions=[
+            "Use only eye drops prescribed by a veterinarian",
+            "Wash hands before and after treating the eye",
+            "Keep the face clean and dry",
+            "Complete the full course of medication even if the eye looks better",
+            "Use a cone collar if the animal keeps scratching its eye"
+        ],
+        warning_signs=[
+            "Eye kept closed or squinting constantly",
+            "Cloudiness or change in eye colour",
+            "Thick yellow or green discharge",
+            "Swelling around the eye or face",
+            "Signs of vision loss such as bumping into objects"
+        ]
+    ),
+    IssueRule(
+        category="eye_inflammation",
+        pattern=r"eye inflammation",
+        bands=[Band(0.55, 0.80, Severity.LOW, 72), Band(0.85, 1.01, Severity.URGENT, 24)],
+        immediate_actions=[
+            "Check the eye for visible debris without touching the eyeball",
+            "Rinse gently with sterile saline if debris is present",
+            "Prevent rubbing or scratching of the eye",
+            "Keep the animal in a calm, dim environment"
+        ],
+        care_instructions=[
+            "Clean around the eye daily with a soft, damp cloth",
+            "Avoid irritants such as smoke, sprays and dust",
+            "Do not use human eye drops",
+            "Monitor for discharge or squinting",
+            "Schedule a veterinary examination if redness persists beyond 48 hours"
+        ],
+        warning_signs=[
+            "Squinting or keeping the eye closed",
+            "Cloudiness of the eye surface",
+            "Discharge or excessive tearing",
+            "Bulging or visible injury to the eye"
+        ]
+    ),
+    IssueRule(
+        category="cataracts",
+        pattern=r"cataract",
+        bands=[Band(0.55, 1.01, Severity.LOW, 168)],
+        immediate_actions=[
+            "Keep the environment consistent so the animal can navigate safely",
+            "Block access to stairs and hazards if vision seems impaired",
+            "Use voice cues when approaching to avoid startling the animal",
+            "Schedule a veterinary eye examination"
+        ],
+        care_instructions=[
+            "Avoid rearranging furniture or food and water locations",
+            "Walk on a leash in unfamiliar areas",
+            "Have blood sugar checked - cataracts can be linked to diabetes",
+            "Discuss treatment or surgical options with a veterinary ophthalmologist",
+            "Monitor for changes in how the animal moves around"
+        ],
+        warning_signs=[
+            "Sudden loss of vision",
+            "Red, painful or bulging eye",
+            "Increased thirst or urination",
+            "Bumping into objects or reluctance to move"
+        ]
+    ),
+    IssueRule(
+        category="dehydration",
+        pattern=r"dehydration",
+        bands=[Band(0.55, 0.70, Severity.LOW, 24), Band(0.80, 1.01, Severity.URGENT, 6)],
+        immediate_actions=[
+            "Offer small amounts of clean, fresh water frequently",
+            "Move the animal to a cool, shaded area",
+            "Do not force water into the mouth",
+            "Check gum moisture and skin elasticity",
+            "Contact a veterinarian if the animal will not drink"
+        ],
+        care_instructions=[
+            "Provide water in several locations",
+            "Offer wet food to increase fluid intake",
+            "Avoid exercise during hot parts of the day",
+            "Monitor urination and water intake daily",
+            "Use vet-recommended oral electrolyte solutions only"
+        ],
+        warning_signs=[
+            "Sunken eyes or dry, sticky gums",
+            "Vomiting or diarrhoea",
+            "Refusal to drink for several hours",
+            "Weakness, collapse or rapid breathing"
+        ]
+    ),
+    IssueRule(
+        category="wound",
+        pattern=r"wound|injury",
+        bands=[Band(0.55, 0.65, Severity.LOW, 48), Band(0.71, 1.01, Severity.URGENT, 12)],
+        immediate_actions=[
+            "Approach calmly - injured animals may bite out of pain",
+            "Apply gentle pressure with a clean cloth if the wound is bleeding",
+            "Keep the wound clean and covered loosely",
+            "Prevent the animal from licking the wound",
+            "Contact a veterinarian for wound assessment"
+        ],
+        care_instructions=[
+            "Clean the wound with saline only - avoid alcohol or hydrogen peroxide",
+            "Change dressings daily or as advised by the vet",
+            "Restrict activity to allow healing",
+            "Use a cone collar to prevent licking or chewing",
+            "Complete any prescribed antibiotics",
+            "Check the wound twice daily for signs of infection"
+        ],
+        warning_signs=[
+            "Bleeding that does not stop with pressure",
+            "Swelling, heat, pus or foul smell from the wound",
+            "Limping or inability to bear weight",
+            "Fever, lethargy or loss of appetite",
+            "Wound edges opening up"
+        ]
+    ),
+    IssueRule(
+        category="malnutrition",
+        pattern=r"malnutrition",
+        bands=[Band(0.55, 0.70, Severity.LOW, 72), Band(0.80, 1.01, Severity.URGENT, 24)],
+        immediate_actions=[
+            "Offer small, frequent meals of easily digestible food",
+            "Provide constant access to clean water",
+            "Do not overfeed - sudden large meals can be dangerous",
+            "Keep the animal warm and sheltered",
+            "Arrange a veterinary checkup for parasites and underlying illness"
+        ],
+        care_instructions=[
+            "Increase food portions gradually over 1-2 weeks",
+            "Feed a high-quality, species-appropriate diet",
+            "Deworm only under veterinary guidance",
+            "Weigh or photograph the animal weekly to track progress",
+            "Ask the vet about vitamin and mineral supplements"
+        ],
+        warning_signs=[
+            "Vomiting or diarrhoea after eating",
+            "Continued weight loss despite feeding",
+            "Weakness or inability to stand",
+            "Refusal to eat for more than a day"
+        ]
+    ),
+    IssueRule(
+        category="infection",
+        pattern=r"infection",
+        bands=[Band(0.55, 0.65, Severity.LOW, 48), Band(0.71, 1.01, Severity.URGENT, 12)],
+        immediate_actions=[
+            "Keep the animal separated from other animals",
+            "Keep any affected area clean and dry",
+            "Provide water and a quiet place to rest",
+            "Wear gloves when handling discharge or wounds",
+            "Contact a veterinarian for diagnosis and antibiotics"
+        ],
+        care_instructions=[
+            "Give prescribed medication exactly as directed",
+            "Disinfect bedding and feeding bowls daily",
+            "Monitor body temperature if possible",
+            "Encourage eating and drinking to support recovery",
+            "Attend the follow-up visit to confirm the infection has cleared"
+        ],
+        warning_signs=[
+            "Fever, shivering or lethargy",
+            "Spreading redness, swelling or discharge",
+            "Loss of appetite for more than a day",
+            "Difficulty breathing"
+        ]
+    ),
+]
+
+class MedicalRuleEngine:
+    """Compiled decision table answering common single-issue cases without the LLM"""
+
+    def __init__(self, rules: List[IssueRule] = RULES):
+        self.rules: Dict[str, IssueRule] = {rule.category: rule for rule in rules}
+
+        # One alternation with a named group per category; rule order decides ties
+        self.pattern = re.compile(
+            "|".join(f"(?P<{rule.category}>{rule.pattern})" for rule in rules),
+            re.IGNORECASE
+        )
+
+        # Band lower bounds per category for bisect lookups
+        self.band_starts: Dict[str, List[float]] = {
+            rule.category: [band.min_confidence for band in rule.bands] for rule in rules
+        }
+
+    def categorize(self, issue: HealthIssue) -> Optional[str]:
+        match = self.pattern.search(issue.issue)
+        return match.lastgroup if match else None
+
+    def find_band(self, category: str, confidence: float) -> Optional[Band]:
+        rule = self.rules[category]
+        index = bisect_right(self.band_starts[category], confidence) - 1
+        if index < 0:
+            return None
+        band = rule.bands[index]
+        return band if confidence < band.max_confidence else None
+
+    def assess(self, vision_result: VisionAnalysisResult, user_notes: Optional[str] = None) -> Optional[MedicalAssessment]:
+        """Return a deterministic assessment, or None when the case needs the LLM"""
+        # User notes can change severity in ways the table cannot see
+        if user_notes and user_notes.strip():
+            return None
+
+        significant_issues = [issue for issue in vision_result.health_issues if issue.confidence > 0.55]
+        if len(significant_issues) != 1:
+            return None
+
+        issue = significant_issues[0]
+        category = self.categorize(issue)
+        if category is None:
+            return None
+
+        band = self.find_band(category, issue.confidence)
+        if band is None:
+            return None
+
+        rule = self.rules[category]
+        issue_name = issue.issue.split(" (")[0]
+        summary = f"Vision analysis flagged {issue_name} ({issue.confidence:.0%} confidence) in this {vision_result.species.value}. {issue.description}"
+        if band.severity == Severity.URGENT:
+            summary += f" Veterinary care is recommended within {band.urgency_hours} hours."
+        else:
+            summary += " Schedule a veterinary checkup and monitor closely."
+
+        return MedicalAssessment(
+            severity=band.severity,
+            condition_summary=summary,
+            immediate_actions=list(rule.immediate_actions),
+            care_instructions=list(rule.care_instructions),
+            warning_signs=list(rule.warning_signs),
+            estimated_urgency_hours=band.urgency_hours
+        )
+
+# Singleton instance
+medical_rule_engine = MedicalRuleEngine()
@@ -61,6 +61,7 @@ class RescueCenter(BaseModel):
     place_id: str
     rating: Optional[float]
     type: str  # vet, ngo, rescue_center
+    travel_time_minutes: Optional[float] = None  # By road, when a road graph is loaded
 
 class SOSResponse(BaseModel):
     message_sent: bool
@@ -68,6 +69,23 @@ class SOSResponse(BaseModel):
     sos_message: str
     recipients_contacted: List[str]
     error: Optional[str] = None
+    sos_id: Optional[str] = None  # Poll /sos/{sos_id}/status for notification delivery; None if nothing was queued
+    location_address: Optional[str] = None  # Reverse-geocoded address of the SOS location
+
+class NotificationStatus(BaseModel):
+    id: int
+    channel: str  # whatsapp, email
+    recipient: str
+    status: str  # pending, sending, delivered, failed
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+class SOSStatusResponse(BaseModel):
+    sos_id: str
+    notifications: List[NotificationStatus]
+    delivered: bool  # Every notification delivered
 
 class ChatMessage(BaseModel):
     role: str  # user or assistant
@@ -77,21 +95,30 @@ class ChatRequest(BaseModel):
     message: str
     history: List[ChatMessage] = []
     context: Optional[Dict[str, Any]] = None
+    session_id: Optional[str] = None  # Reuse server-side Ollama context across turns
+    history_omitted: bool = False  # True when history was left out because the session should exist
 
 class ChatResponse(BaseModel):
     response: str
     suggestions: List[str] = []
+    session_id: Optional[str] = None
 
 class AnalyzeRequest(BaseModel):
-    image_url: str
+    image_url: Optional[str] = None  # Required by /analyze and /vision/analyze
     user_location: Optional[Dict[str, float]] = None  # lat, lng
     user_notes: Optional[str] = None
+    analysis_id: Optional[str] = None  # Reuse a stored run instead of re-analyzing the image
+    vision_analysis: Optional[VisionAnalysisResult] = None  # Or pass a vision result inline
 
 class AnalyzeResponse(BaseModel):
     vision_analysis: VisionAnalysisResult
     medical_assessment: MedicalAssessment
     nutrition_plan: NutritionPlan
     requires_sos: bool
+    analysis_id: Optional[str] = None  # Pass to /medical/assess or /nutrition/plan to skip recomputation
+
+class StoredVisionAnalysis(VisionAnalysisResult):
+    analysis_id: str
 
 class SOSRequest(BaseModel):
     image_url: str
@@ -99,3 +126,6 @@ class SOSRequest(BaseModel):
     location: Dict[str, float]  # lat, lng
     contact_whatsapp: Optional[str] = None
     contact_email: Optional[str] = None
+
+class SOSBatchRequest(BaseModel):
+    reports: List[SOSRequest]
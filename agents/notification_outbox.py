@@ -0,0 +1,221 @@
+import asyncio
+import os
+import random
+import sqlite3
+import time
+from typing import List, Optional, Dict, Any, Callable, Awaitable
+from config import settings
+
+# sender(recipient, subject, message) -> True when delivered
+Sender = Callable[[str, Optional[str], str], Awaitable[bool]]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sos_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notifications_due ON notifications (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS notifications_sos ON notifications (sos_id);
+"""
+
+class NotificationOutbox:
+    """Durable SQLite outbox for SOS notifications, delivered by background workers.
+
+    ``enqueue`` only writes a row, so the SOS response never waits on a
+    channel. Workers claim due rows, call the channel's sender with a timeout
+    and either mark the row delivered or reschedule it with exponential
+    backoff until ``max_attempts``. Rows left 'sending' by a crash are picked
+    up again on the next start.
+    """
+
+    def __init__(self, path: str = None, workers: int = None, max_attempts: int = None):
+        self.path = path or settings.notification_outbox_path
+        self.worker_count = workers or settings.notification_workers
+        self.max_attempts = max_attempts or settings.notification_max_attempts
+        self.senders: Dict[str, Sender] = {}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.delivered = 0
+        self.retries = 0
+        self.failed = 0
+
+    def register_channel(self, channel: str, sender: Sender):
+        self.senders[channel] = sender
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # WAL keeps enqueue to a sub-millisecond append on the request path
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def enqueue(self, sos_id: str, channel: str, recipient: str, message: str,
+                subject: Optional[str] = None) -> int:
+        """Record a notification for delivery and wake a worker; returns its id"""
+        if channel not in self.senders:
+            raise ValueError(f"Unknown notification channel: {channel}")
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO notifications (sos_id, channel, recipient, subject, message, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (sos_id, channel, recipient, subject, message, now, now, now)
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    def status(self, sos_id: str) -> List[Dict[str, Any]]:
+        """Delivery state of every notification recorded for an SOS"""
+        rows = self._connect().execute(
+            "SELECT id, channel, recipient, status, attempts, last_error, created_at, updated_at "
+            "FROM notifications WHERE sos_id = ? ORDER BY id",
+            (sos_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Mark the next due row as sending (no await in between, so workers never share a row)"""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT * FROM notifications WHERE status = 'pending' AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at, id LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE notifications SET status = 'sending', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (now, row["id"])
+            )
+        return row
+
+    def _next_due_in(self) -> float:
+        due = self._connect().execute(
+            "SELECT MIN(next_attempt_at) FROM notifications WHERE status = 'pending'"
+        ).fetchone()[0]
+        if due is None:
+            return settings.notification_poll_seconds
+        return min(max(due - time.time(), 0.0), settings.notification_poll_seconds)
+
+    def backoff(self, attempts: int) -> float:
+        """Exponential backoff with full jitter, so retries of one outage do not arrive together"""
+        ceiling = min(settings.notification_retry_base_seconds * 2 ** (attempts - 1),
+                      settings.notification_retry_max_seconds)
+        return random.uniform(ceiling / 2, ceiling)
+
+    async def _deliver(self, row: sqlite3.Row):
+        attempts = row["attempts"] + 1
+        error = None
+        try:
+            sender = self.senders[row["channel"]]
+            delivered = await asyncio.wait_for(
+                sender(row["recipient"], row["subject"], row["message"]),
+                settings.notification_send_timeout_seconds
+            )
+            if not delivered:
+                error = "channel reported failure"
+        except asyncio.TimeoutError:
+            error = "timed out"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        now = time.time()
+        conn = self._connect()
+        if error is None:
+            self.delivered += 1
+            conn.execute(
+                "UPDATE notifications SET status = 'delivered', last_error = NULL, updated_at = ? WHERE id = ?",
+                (now, row["id"])
+            )
+        elif attempts >= self.max_attempts:
+            self.failed += 1
+            print(f"Notification {row['id']} ({row['channel']}) failed after {attempts} attempts: {error}")
+            conn.execute(
+                "UPDATE notifications SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                (error, now, row["id"])
+            )
+        else:
+            self.retries += 1
+            conn.execute(
+                "UPDATE notifications SET status = 'pending', last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (error, now + self.backoff(attempts), now, row["id"])
+            )
+
+    async def _worker(self):
+        while True:
+            row = self._claim()
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._next_due_in())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._deliver(row)
+            except asyncio.CancelledError:
+                # Shutting down mid-send: leave it for the next start
+                self._connect().execute(
+                    "UPDATE notifications SET status = 'pending', attempts = attempts - 1 WHERE id = ?",
+                    (row["id"],)
+                )
+                raise
+            except Exception as e:
+                print(f"Notification worker error: {e}")
+
+    def start(self):
+        """Requeue rows interrupted by a crash and start the workers (call from the running loop)"""
+        if self._workers:
+            return
+        self._connect().execute(
+            "UPDATE notifications SET status = 'pending', updated_at = ? WHERE status = 'sending'",
+            (time.time(),)
+        )
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        counts = dict(self._connect().execute(
+            "SELECT status, COUNT(*) FROM notifications GROUP BY status"
+        ).fetchall())
+        return {
+            "workers": len(self._workers),
+            "pending": counts.get("pending", 0),
+            "sending": counts.get("sending", 0),
+            "delivered": counts.get("delivered", 0),
+            "failed": counts.get("failed", 0),
+            "delivered_since_start": self.delivered,
+            "retries_since_start": self.retries,
+            "failed_since_start": self.failed
+        }
+
+# Singleton instance
+notification_outbox = NotificationOutbox()
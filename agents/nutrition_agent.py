@@ -1,7 +1,8 @@
 from typing import Optional
-import requests
-from models import VisionAnalysisResult, Species, NutritionPlan, MedicalAssessment
+from models import VisionAnalysisResult, Species, NutritionPlan, MedicalAssessment, Severity
 from config import settings
+from llm_client import llm_client
+from deadline import Deadline
 import json
 
 class NutritionCarePlannerAgent:
@@ -103,34 +104,21 @@ Be specific and practical. Prioritize the animal's health and recovery needs."""
         
         return prompt
     
-    async def get_llm_response(self, prompt: str) -> str:
-        """Get response from Ollama (free local LLM)"""
-        try:
-            # Call Ollama API
-            response = requests.post(
-                f"{self.ollama_base_url}/api/generate",
-                json={
-                    "model": self.ollama_model,
-                    "prompt": f"You are a veterinary nutrition expert. {prompt}",
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "num_predict": 1000
-                    }
-                },
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "")
-            else:
-                print(f"Ollama returned status {response.status_code}, using fallback")
-                return ""
+    async def get_llm_plan(self, prompt: str, timeout: Optional[float] = None) -> Optional[NutritionPlan]:
+        """Get a schema-validated plan from Ollama (free local LLM) in JSON mode"""
+        plan = await llm_client.generate_json(
+            f"You are a veterinary nutrition expert. {prompt}",
+            self.plan_from_dict,
+            options={
+                "temperature": 0.7,
+                "num_predict": 1000
+            },
+            timeout=timeout
+        )
         
-        except Exception as e:
-            print(f"Nutrition LLM Error: {e}")
-            return ""
+        if plan is None:
+            print("Ollama returned no valid plan, using fallback")
+        return plan
     
     def generate_fallback_response(self, vision_result: Optional[VisionAnalysisResult] = None) -> str:
         """Generate concise, focused nutrition plan"""
@@ -261,35 +249,41 @@ Be specific and practical. Prioritize the animal's health and recovery needs."""
                 ]
             })
     
+    def plan_from_dict(self, data: dict) -> NutritionPlan:
+        """Validate decoded JSON against NutritionPlan (raises on invalid data).
+        
+        Accepts both the snake_case keys requested from the LLM and the
+        camelCase keys used by the fallback plans.
+        """
+        def field(name: str, camel: str):
+            return data[name] if name in data else data[camel]
+        
+        return NutritionPlan(
+            recommended_foods=field('recommended_foods', 'recommendedFoods'),
+            dangerous_foods=field('dangerous_foods', 'dangerousFoods'),
+            hydration_plan=field('hydration_plan', 'hydrationPlan'),
+            feeding_schedule=field('feeding_schedule', 'feedingSchedule'),
+            special_considerations=field('special_considerations', 'specialConsiderations')
+        )
+    
     def parse_nutrition_plan(self, llm_response: str, species: Species) -> NutritionPlan:
-        """Parse LLM response into NutritionPlan"""
+        """Parse a JSON response string into NutritionPlan, falling back on failure"""
         try:
-            # Extract JSON from response
-            start = llm_response.find('{')
-            end = llm_response.rfind('}') + 1
-            
-            if start >= 0 and end > start:
-                json_str = llm_response[start:end]
-                data = json.loads(json_str)
-            else:
-                data = json.loads(llm_response)
-            
-            return NutritionPlan(
-                recommended_foods=data['recommended_foods'],
-                dangerous_foods=data['dangerous_foods'],
-                hydration_plan=data['hydration_plan'],
-                feeding_schedule=data['feeding_schedule'],
-                special_considerations=data['special_considerations']
-            )
+            return self.plan_from_dict(json.loads(llm_response))
         
         except Exception as e:
             print(f"Error parsing nutrition plan: {e}")
-            # Return fallback plan
-            fallback = self.generate_fallback_plan(species)
-            return self.parse_nutrition_plan(fallback, species)
+            # Return fallback plan (always valid, so no further retries)
+            return self.plan_from_dict(json.loads(self.generate_fallback_plan(species)))
+    
+    def is_plan_reusable(self, provisional: MedicalAssessment, actual: MedicalAssessment) -> bool:
+        """Check whether a plan built from a provisional assessment still fits the final one"""
+        recovery_levels = {Severity.URGENT, Severity.CRITICAL}
+        return (provisional.severity in recovery_levels) == (actual.severity in recovery_levels)
     
     async def create_plan(self, vision_result: VisionAnalysisResult, 
-                         medical_assessment: MedicalAssessment) -> NutritionPlan:
+                         medical_assessment: MedicalAssessment,
+                         deadline: Optional[Deadline] = None) -> NutritionPlan:
         """Create comprehensive nutrition plan with intelligent fallbacks"""
         try:
             species = vision_result.species
@@ -297,16 +291,12 @@ Be specific and practical. Prioritize the animal's health and recovery needs."""
             # Create prompt
             prompt = self.create_nutrition_prompt(species, vision_result, medical_assessment)
             
-            # Get LLM response
-            llm_response = await self.get_llm_response(prompt)
-            
-            # Parse response - if empty or invalid, use fallback
-            if llm_response and len(llm_response.strip()) > 50:
-                try:
-                    plan = self.parse_nutrition_plan(llm_response, species)
+            # Get structured LLM plan, if the request deadline leaves time for one
+            if deadline is None or deadline.allows(settings.llm_min_budget_seconds):
+                timeout = deadline.timeout(settings.llm_timeout_seconds) if deadline else None
+                plan = await self.get_llm_plan(prompt, timeout)
+                if plan is not None:
                     return plan
-                except Exception as parse_error:
-                    print(f"Failed to parse LLM nutrition response: {parse_error}")
             
             # Use intelligent fallback based on species
             print(f"Using fallback nutrition plan for {species.value}")
@@ -0,0 +1,246 @@
+"""Deterministic stand-in for Ollama's HTTP API, for load and latency testing.
+
+Implements /api/generate (streaming and non-streaming, ``context`` and
+``format: "json"``) and /api/tags with a configurable time-to-first-token,
+prompt and generation speed, parallelism and error rate. Outputs are canned,
+and every random decision is seeded from the prompt, so a run can be
+reproduced exactly without a model.
+
+    python ollama_simulator.py --port 11500 --ttft-ms 300 --tokens-per-second 40
+    OLLAMA_BASE_URL=http://localhost:11500 uvicorn main:app
+
+Several simulators on different ports can be listed in OLLAMA_BASE_URLS.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import zlib
+from typing import List, Optional, Dict, Any
+from aiohttp import web
+from config import settings
+
+# Canned outputs; the first marker found in the prompt picks the response
+CANNED_RESPONSES: Dict[str, Any] = {
+    "medical": {
+        "severity": "LOW",
+        "condition_summary": "Mild skin irritation with localized hair loss. No signs of systemic illness.",
+        "immediate_actions": [
+            "Keep the affected area clean and dry",
+            "Prevent scratching or licking of the area",
+            "Ensure access to fresh water and a quiet resting place"
+        ],
+        "care_instructions": [
+            "Monitor the skin daily for spread or open sores",
+            "Provide a balanced diet to support skin recovery",
+            "Schedule a veterinary checkup if there is no improvement within a week"
+        ],
+        "warning_signs": [
+            "Open or bleeding sores",
+            "Rapid spread of hair loss",
+            "Lethargy or loss of appetite"
+        ],
+        "estimated_urgency_hours": 96
+    },
+    "nutrition": {
+        "recommended_foods": ["Plain boiled chicken", "Cooked rice", "High-quality commercial food"],
+        "dangerous_foods": ["Chocolate", "Grapes and raisins", "Onions and garlic", "Cooked bones"],
+        "hydration_plan": "Fresh, clean water available at all times; offer small amounts frequently.",
+        "feeding_schedule": "Three small meals a day at regular times.",
+        "special_considerations": ["Introduce new foods gradually", "Monitor weight weekly"]
+    },
+    "json": {"response": "ok"},
+    "chat": (
+        "That is a great question. Animals communicate a lot through body language, so watch the ears, "
+        "tail and posture. Move slowly, speak softly and give them space to approach you. Offering food "
+        "at a distance and keeping a calm routine helps build trust over time. If you notice signs of "
+        "pain, injury or illness, please contact a veterinarian."
+    )
+}
+
+PROMPT_MARKERS = [
+    ("veterinary expert AI", "medical"),
+    ("veterinary nutrition expert", "nutrition")
+]
+
+class OllamaSimulator:
+    def __init__(self, ttft_ms: float, tokens_per_second: float, prompt_tokens_per_second: float,
+                 ttft_jitter: float, error_rate: float, parallel: int, seed: int,
+                 responses: Optional[Dict[str, Any]] = None, model: str = None):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.ttft_jitter = ttft_jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.model = model or settings.ollama_model
+        self.responses = {**CANNED_RESPONSES, **(responses or {})}
+
+        # Ollama runs a fixed number of generations at once and queues the rest
+        self.slots = asyncio.Semaphore(parallel)
+        self.parallel = parallel
+        self._occurrences: Dict[str, int] = {}
+
+        self.stats = {"requests": 0, "errors": 0, "streams": 0, "in_flight": 0, "waiting": 0, "tokens": 0}
+
+    @staticmethod
+    def split_tokens(text: str) -> List[str]:
+        """Word-level pieces including their leading whitespace, so they join back losslessly"""
+        return re.findall(r"\s*\S+|\s+$", text)
+
+    @staticmethod
+    def token_ids(pieces: List[str]) -> List[int]:
+        return [zlib.crc32(piece.encode("utf-8")) % 32000 for piece in pieces]
+
+    def rng_for(self, prompt: str) -> random.Random:
+        """Same prompt, same n-th occurrence -> same random choices, whatever the request order"""
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        occurrence = self._occurrences.get(digest, 0)
+        self._occurrences[digest] = occurrence + 1
+        return random.Random(f"{self.seed}:{digest}:{occurrence}")
+
+    def response_text(self, prompt: str, json_mode: bool) -> str:
+        key = "json" if json_mode else "chat"
+        for marker, name in PROMPT_MARKERS:
+            if marker in prompt:
+                key = name
+                break
+        response = self.responses[key]
+        if json_mode or not isinstance(response, str):
+            return json.dumps(response, indent=2)
+        return response
+
+    def first_token_delay(self, prompt_tokens: int, rng: random.Random) -> float:
+        delay = self.ttft_ms / 1000
+        if self.prompt_tokens_per_second > 0:
+            # Only tokens not already covered by a passed-in context are evaluated
+            delay += prompt_tokens / self.prompt_tokens_per_second
+        if self.ttft_jitter > 0:
+            delay *= 1 + rng.uniform(-self.ttft_jitter, self.ttft_jitter)
+        return max(0.0, delay)
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = body.get("prompt", "")
+        stream = body.get("stream", True)
+        options = body.get("options") or {}
+        context = body.get("context") or []
+        rng = self.rng_for(prompt)
+        self.stats["requests"] += 1
+
+        if rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"error": "simulated failure"}, status=500)
+
+        prompt_pieces = self.split_tokens(prompt)
+        output_pieces = self.split_tokens(self.response_text(prompt, body.get("format") == "json"))
+        num_predict = options.get("num_predict")
+        if num_predict is not None and num_predict >= 0:
+            output_pieces = output_pieces[:num_predict]
+
+        self.stats["waiting"] += 1
+        async with self.slots:
+            self.stats["waiting"] -= 1
+            self.stats["in_flight"] += 1
+            try:
+                started = time.perf_counter()
+                await asyncio.sleep(self.first_token_delay(len(prompt_pieces), rng))
+                prompt_done = time.perf_counter()
+
+                num_ctx = options.get("num_ctx", 2048)
+                new_context = (list(context) + self.token_ids(prompt_pieces) + self.token_ids(output_pieces))[-num_ctx:]
+                token_interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+                def final_chunk() -> Dict[str, Any]:
+                    finished = time.perf_counter()
+                    return {
+                        "model": self.model,
+                        "response": "",
+                        "done": True,
+                        "context": new_context,
+                        "total_duration": int((finished - started) * 1e9),
+                        "prompt_eval_count": len(prompt_pieces),
+                        "prompt_eval_duration": int((prompt_done - started) * 1e9),
+                        "eval_count": len(output_pieces),
+                        "eval_duration": int((finished - prompt_done) * 1e9)
+                    }
+
+                if not stream:
+                    await asyncio.sleep(token_interval * len(output_pieces))
+                    self.stats["tokens"] += len(output_pieces)
+                    return web.json_response({**final_chunk(), "response": "".join(output_pieces)})
+
+                self.stats["streams"] += 1
+                response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+                await response.prepare(request)
+                try:
+                    for i, piece in enumerate(output_pieces):
+                        if i:
+                            await asyncio.sleep(token_interval)
+                        chunk = {"model": self.model, "response": piece, "done": False}
+                        await response.write((json.dumps(chunk) + "\n").encode("utf-8"))
+                        self.stats["tokens"] += 1
+                    await response.write((json.dumps(final_chunk()) + "\n").encode("utf-8"))
+                except (ConnectionResetError, asyncio.CancelledError):
+                    # Client stopped reading (e.g. early stop on a closed JSON object)
+                    return response
+                await response.write_eof()
+                return response
+            finally:
+                self.stats["in_flight"] -= 1
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": self.model, "model": self.model, "size": 0}]})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "parallel": self.parallel})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/generate", self.generate)
+        app.router.add_get("/api/tags", self.tags)
+        app.router.add_get("/simulator/stats", self.get_stats)
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic Ollama simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=settings.simulator_port)
+    parser.add_argument("--ttft-ms", type=float, default=settings.simulator_ttft_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=settings.simulator_tokens_per_second)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=settings.simulator_prompt_tokens_per_second)
+    parser.add_argument("--ttft-jitter", type=float, default=settings.simulator_ttft_jitter)
+    parser.add_argument("--error-rate", type=float, default=settings.simulator_error_rate)
+    parser.add_argument("--parallel", type=int, default=settings.simulator_parallel)
+    parser.add_argument("--seed", type=int, default=settings.simulator_seed)
+    parser.add_argument("--responses", default=settings.simulator_responses_path,
+                        help="JSON file overriding the canned 'medical', 'nutrition', 'json' or 'chat' outputs")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+
+    async def create_app() -> web.Application:
+        # The semaphore must be created inside the server's event loop
+        simulator = OllamaSimulator(
+            ttft_ms=args.ttft_ms,
+            tokens_per_second=args.tokens_per_second,
+            prompt_tokens_per_second=args.prompt_tokens_per_second,
+            ttft_jitter=args.ttft_jitter,
+            error_rate=args.error_rate,
+            parallel=args.parallel,
+            seed=args.seed,
+            responses=responses
+        )
+        return simulator.create_app()
+
+    print(f"Ollama simulator listening on http://{args.host}:{args.port}")
+    web.run_app(create_app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
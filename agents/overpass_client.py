@@ -0,0 +1,239 @@
+import asyncio
+import time
+from typing import List, Optional, Dict, Any
+import aiohttp
+from config import settings
+from geo_cache import POI
+from rate_limiter import TokenBucket
+
+class OverpassError(Exception):
+    """No Overpass endpoint answered successfully within the deadline"""
+
+class OverpassEndpoint:
+    """One Overpass mirror with the latency and failure history used to rank it"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.ewma_latency_ms: Optional[float] = None
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.wins = 0
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def record_success(self, latency_ms: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        if self.ewma_latency_ms is None:
+            self.ewma_latency_ms = latency_ms
+        else:
+            self.ewma_latency_ms = 0.7 * self.ewma_latency_ms + 0.3 * latency_ms
+
+    def record_cancelled(self, elapsed_ms: float):
+        """A raced attempt that lost: its latency is at least ``elapsed_ms``, so only ever raise the estimate"""
+        if self.ewma_latency_ms is not None and elapsed_ms > self.ewma_latency_ms:
+            self.ewma_latency_ms = 0.7 * self.ewma_latency_ms + 0.3 * elapsed_ms
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.overpass_cooldown_after_failures:
+            self.cooldown_until = time.monotonic() + settings.overpass_cooldown_seconds
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "wins": self.wins,
+            "ewma_latency_ms": round(self.ewma_latency_ms, 2) if self.ewma_latency_ms is not None else None,
+            "cooling_down": self.cooling_down
+        }
+
+class OverpassClient:
+    """Async Overpass API client that hedges across mirrors.
+
+    The fastest known mirror is asked first; if it has not answered after
+    ``hedge_delay`` seconds the next one is raced against it, and a mirror
+    that fails hands over to the next at once. The first good answer wins
+    and the losers are cancelled, so one slow mirror no longer sets SOS
+    latency. Every attempt takes a token from a shared bucket so bursts of
+    SOS calls stay within the public servers' usage policy.
+    """
+
+    def __init__(self, urls: List[str] = None, timeout: float = None, hedge_delay: float = None,
+                 rate_limiter: TokenBucket = None):
+        if urls is None:
+            urls = [url.strip() for url in settings.overpass_urls.split(",") if url.strip()] or [settings.overpass_url]
+        self.endpoints = [OverpassEndpoint(url) for url in urls]
+        self.timeout = timeout or settings.overpass_timeout_seconds
+        self.hedge_delay = hedge_delay if hedge_delay is not None else settings.overpass_hedge_delay_seconds
+        self.rate_limiter = rate_limiter or TokenBucket(
+            "overpass", settings.overpass_rate_per_second, settings.overpass_burst
+        )
+
+        # Session is created lazily so it binds to the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.metrics = {
+            "queries": 0,
+            "successes": 0,
+            "failures": 0,
+            "hedged": 0,
+            "total_latency_ms": 0.0
+        }
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled keep-alive session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=settings.overpass_pool_size)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"User-Agent": f"hope-ai-agents ({settings.nominatim_email})"}
+            )
+        return self._session
+
+    def ranked_endpoints(self) -> List[OverpassEndpoint]:
+        """Healthy mirrors first, fastest first; mirrors that never answered keep their configured order"""
+        return sorted(
+            self.endpoints,
+            key=lambda endpoint: (
+                endpoint.cooling_down,
+                endpoint.ewma_latency_ms is None,
+                endpoint.ewma_latency_ms or 0.0
+            )
+        )
+
+    async def _attempt(self, endpoint: OverpassEndpoint, query: str, deadline: float) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        if not await self.rate_limiter.acquire(timeout=deadline - loop.time()):
+            raise OverpassError("Overpass rate limit leaves no time before the deadline")
+
+        endpoint.requests += 1
+        started = time.perf_counter()
+        try:
+            session = await self.get_session()
+            timeout = aiohttp.ClientTimeout(total=max(deadline - loop.time(), 0.1))
+            async with session.post(endpoint.url, data={"data": query}, timeout=timeout) as response:
+                # 429 (rate limited) and 504 (server busy) are how Overpass sheds load
+                if response.status != 200:
+                    raise OverpassError(f"{endpoint.url} returned {response.status}")
+                result = await response.json(content_type=None)
+        except asyncio.CancelledError:
+            endpoint.record_cancelled((time.perf_counter() - started) * 1000)
+            raise
+        except Exception:
+            endpoint.record_failure()
+            raise
+
+        endpoint.record_success((time.perf_counter() - started) * 1000)
+        return result
+
+    async def query(self, query: str, timeout: float = None) -> Dict[str, Any]:
+        """Run an Overpass QL query, racing mirrors as described above"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        deadline = loop.time() + (timeout or self.timeout)
+        endpoints = self.ranked_endpoints()
+        self.metrics["queries"] += 1
+
+        attempts: Dict[asyncio.Task, OverpassEndpoint] = {}
+        pending = set()
+        errors = []
+
+        def launch():
+            endpoint = endpoints[len(attempts)]
+            task = asyncio.ensure_future(self._attempt(endpoint, query, deadline))
+            attempts[task] = endpoint
+            pending.add(task)
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                can_hedge = len(attempts) < len(endpoints)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=min(self.hedge_delay, remaining) if can_hedge else remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                pending.difference_update(done)
+
+                for task in done:
+                    if task.exception() is None:
+                        attempts[task].wins += 1
+                        self.metrics["successes"] += 1
+                        self.metrics["total_latency_ms"] += (time.perf_counter() - started) * 1000
+                        return task.result()
+                    errors.append(f"{attempts[task].url}: {task.exception()}")
+
+                # Either every running attempt is slow or one just failed: bring in the next mirror
+                if can_hedge:
+                    if not done:
+                        self.metrics["hedged"] += 1
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        self.metrics["failures"] += 1
+        raise OverpassError("; ".join(errors) or "Overpass query timed out")
+
+    async def fetch_pois(self, south: float, west: float, north: float, east: float,
+                         timeout: float = None) -> List[POI]:
+        """Vets and shelters in a bounding box (SOS tile cache and index refresh)"""
+        timeout = timeout or self.timeout
+        bbox = f"{south},{west},{north},{east}"
+        query = f"""
+        [out:json][timeout:{int(timeout)}];
+        (
+          nwr["amenity"="veterinary"]({bbox});
+          nwr["healthcare"="veterinary"]({bbox});
+          nwr["amenity"="animal_shelter"]({bbox});
+        );
+        out center tags;
+        """
+        data = await self.query(query, timeout)
+
+        pois = []
+        for element in data.get("elements", []):
+            if element["type"] == "node":
+                lat, lon = element["lat"], element["lon"]
+            elif "center" in element:
+                lat, lon = element["center"]["lat"], element["center"]["lon"]
+            else:
+                continue
+            pois.append((lat, lon, f"{element['type']}/{element['id']}", element.get("tags", {})))
+        return pois
+
+    async def close(self):
+        """Close the pooled session (call on application shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        successes = self.metrics["successes"]
+        return {
+            "queries": self.metrics["queries"],
+            "successes": successes,
+            "failures": self.metrics["failures"],
+            "hedged": self.metrics["hedged"],
+            "avg_latency_ms": round(self.metrics["total_latency_ms"] / successes, 2) if successes else 0.0,
+            "rate_limiter": self.rate_limiter.get_metrics(),
+            "endpoints": [endpoint.get_metrics() for endpoint in self.endpoints]
+        }
+
+# Singleton instance
+overpass_client = OverpassClient()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import Optional, Dict, Any
+
+class TokenBucket:
+    """Async token bucket shared by every caller of a rate-limited upstream.
+
+    Tokens are reserved up front (the count may go negative), so waiters are
+    served in arrival order without a lock and each one just sleeps until
+    its token has accrued. A caller that would wait longer than its timeout
+    is refused without reserving anything.
+    """
+
+    def __init__(self, name: str, rate_per_second: float, burst: int):
+        self.name = name
+        self.rate = rate_per_second
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a token; False if it would take longer than ``timeout`` seconds"""
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if timeout is not None and wait > timeout:
+            self.rejected += 1
+            return False
+
+        self.tokens -= 1
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Give the reservation back to the callers queued behind us
+                self.tokens += 1
+                raise
+
+        self.acquired += 1
+        self.total_wait_ms += wait * 1000
+        return True
+
+    def get_metrics(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.capacity,
+            "tokens": round(self.tokens, 2),
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_ms / self.acquired, 2) if self.acquired else 0.0
+        }
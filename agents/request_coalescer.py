@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from deadline import Deadline
+
+T = TypeVar("T")
+
+class _Flight:
+    __slots__ = ("task", "waiters", "deadline")
+
+    def __init__(self, task: asyncio.Task, deadline: Optional[Deadline]):
+        self.task = task
+        self.waiters = 0
+        self.deadline = deadline
+
+class SingleFlight:
+    """Coalesces concurrent identical calls onto one running computation.
+
+    Every caller awaits the shared task through asyncio.shield, so one caller
+    disconnecting does not cancel the work for the others; the task is only
+    cancelled once no caller is left waiting for it. A caller that joins with
+    a later deadline extends the shared one, so the run works to the longest
+    budget among its waiters instead of the first caller's.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+
+        self.leaders = 0
+        self.followers = 0
+        self.abandoned = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[T]], deadline: Optional[Deadline] = None) -> T:
+        """Join or start the flight for ``key``; ``deadline`` must be the one ``factory`` runs under"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()), deadline)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            if flight.deadline is not None and deadline is not None:
+                flight.deadline.extend_to(deadline)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Everyone who wanted this result has gone away
+                flight.task.cancel()
+                self.abandoned += 1
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.followers,
+            "abandoned": self.abandoned
+        }
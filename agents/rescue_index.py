@@ -0,0 +1,361 @@
+"""Offline spatial index of veterinary clinics, shelters and animal rescues.
+
+Built from a local OpenStreetMap extract and stored as memory-mapped NumPy
+arrays sorted by grid cell, so nearest-N and radius queries touch only the
+few cells around the point and never hit the network.
+
+    python rescue_index.py import region.geojson      # or region.osm.pbf (needs pyosmium)
+    python rescue_index.py import-overpass 12.8,77.4,13.2,77.8
+    python rescue_index.py query 12.97 77.59
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+import numpy as np
+from config import settings
+
+INDEX_VERSION = 1
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+# Shown for POIs without addr:street until reverse geocoding fills it in
+ADDRESS_PLACEHOLDER = "Address available on contact"
+
+def poi_type(tags: Dict[str, str]) -> Optional[str]:
+    """RescueCenter.type for an OSM object, or None if it is not a rescue POI"""
+    if tags.get("amenity") == "veterinary" or tags.get("healthcare") == "veterinary":
+        return "vet"
+    if tags.get("amenity") == "animal_shelter" or "animal_shelter" in tags:
+        return "rescue_center"
+    return None
+
+def poi_from_tags(tags: Dict[str, str]) -> Dict[str, Any]:
+    """Display fields for a rescue POI, with the same defaults as the live Overpass lookup"""
+    kind = poi_type(tags) or "vet"
+    return {
+        "name": tags.get("name", "Veterinary Clinic" if kind == "vet" else "Animal Shelter"),
+        "address": tags.get("addr:street", ADDRESS_PLACEHOLDER),
+        "phone": tags.get("phone", tags.get("contact:phone", "Call for details")),
+        "type": kind
+    }
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances from one point to many, in km"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    delta_lat = lat2 - lat1
+    delta_lon = np.radians(lons - lon)
+    a = np.sin(delta_lat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix_km(lats: np.ndarray, lons: np.ndarray, to_lats: np.ndarray, to_lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances from each of N points to each of M points, as an N x M matrix in km"""
+    lat1 = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(to_lats, dtype=np.float64))[None, :]
+    delta_lon = np.radians(np.asarray(to_lons, dtype=np.float64)[None, :] - np.asarray(lons, dtype=np.float64)[:, None])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class RescueIndex:
+    """Grid-bucketed POI index over memory-mapped arrays.
+
+    Points are sorted by a row-major cell key (latitude row, longitude
+    column), so the cells of one latitude row within a longitude range are a
+    single contiguous slice found with ``np.searchsorted``.
+    """
+
+    def __init__(self, path: str, cell_degrees: float = None):
+        self.path = path
+        self.cell_degrees = cell_degrees or settings.rescue_index_cell_degrees
+        self.manifest: Dict[str, Any] = {}
+        self.keys: Optional[np.ndarray] = None
+        self.coords: Optional[np.ndarray] = None
+        self.offsets: Optional[np.ndarray] = None
+        self._records: Optional[np.memmap] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.keys is not None
+
+    def __len__(self) -> int:
+        return 0 if self.keys is None else len(self.keys)
+
+    # Grid
+
+    def _columns(self) -> int:
+        return int(math.ceil(360.0 / self.cell_degrees))
+
+    def _row(self, lat) -> np.ndarray:
+        rows = int(math.ceil(180.0 / self.cell_degrees))
+        return np.clip(np.floor((np.asarray(lat) + 90.0) / self.cell_degrees), 0, rows - 1).astype(np.int64)
+
+    def _column(self, lon) -> np.ndarray:
+        columns = self._columns()
+        return np.floor(((np.asarray(lon) + 180.0) % 360.0) / self.cell_degrees).astype(np.int64) % columns
+
+    def cell_keys(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        return self._row(lats) * self._columns() + self._column(lons)
+
+    # Building
+
+    def build(self, pois: Iterable[Tuple[float, float, str, Dict[str, str]]], source: str):
+        """Write the index from (lat, lon, osm_id, tags) tuples, replacing any existing one"""
+        lats, lons, records = [], [], []
+        seen = set()
+        for lat, lon, osm_id, tags in pois:
+            if osm_id in seen or poi_type(tags) is None:
+                continue
+            seen.add(osm_id)
+            lats.append(lat)
+            lons.append(lon)
+            records.append({"id": osm_id, **poi_from_tags(tags)})
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        keys = self.cell_keys(lats, lons)
+        order = np.argsort(keys, kind="stable")
+
+        encoded = [json.dumps(records[i], ensure_ascii=False).encode("utf-8") for i in order]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(blob) for blob in encoded])
+
+        manifest = {
+            "version": INDEX_VERSION,
+            "cell_degrees": self.cell_degrees,
+            "count": len(records),
+            "source": source,
+            "built_at": int(time.time()),
+            # Area the extract covers; queries outside it fall back to Overpass
+            "bbox": [float(lats.min()), float(lons.min()), float(lats.max()), float(lons.max())] if len(records) else None
+        }
+
+        # Write into a temporary directory and swap it in, so readers never see a partial index
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, "keys.npy"), keys[order])
+        np.save(os.path.join(tmp_path, "coords.npy"), np.stack([lats, lons], axis=1)[order] if len(records) else np.zeros((0, 2)))
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        with open(os.path.join(tmp_path, "records.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        if os.path.isdir(self.path):
+            old_path = f"{self.path}.old"
+            os.replace(self.path, old_path)
+            os.replace(tmp_path, self.path)
+            for name in os.listdir(old_path):
+                os.remove(os.path.join(old_path, name))
+            os.rmdir(old_path)
+        else:
+            os.replace(tmp_path, self.path)
+
+        print(f"Rescue index: {len(records)} POIs written to {self.path}")
+        self.load()
+
+    # Loading and querying
+
+    def load(self) -> bool:
+        try:
+            with open(os.path.join(self.path, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        if manifest.get("version") != INDEX_VERSION:
+            print(f"Rescue index at {self.path} has an old format; re-import it")
+            return False
+
+        self.manifest = manifest
+        self.cell_degrees = manifest["cell_degrees"]
+        self.keys = np.load(os.path.join(self.path, "keys.npy"), mmap_mode="r")
+        self.coords = np.load(os.path.join(self.path, "coords.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(self.path, "offsets.npy"), mmap_mode="r")
+        records_path = os.path.join(self.path, "records.bin")
+        self._records = np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else None
+        return True
+
+    def covers(self, lat: float, lon: float) -> bool:
+        bbox = self.manifest.get("bbox")
+        if not self.loaded or not bbox:
+            return False
+        south, west, north, east = bbox
+        return south <= lat <= north and west <= lon <= east
+
+    def record(self, position: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return json.loads(self._records[start:end].tobytes())
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Positions of every point in the cells overlapping the radius' bounding box"""
+        delta_lat = radius_km / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + delta_lat, 89.9))), 1e-6)
+        delta_lon = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+
+        columns = self._columns()
+        first_row, last_row = int(self._row(lat - delta_lat)), int(self._row(lat + delta_lat))
+        first_column = int(math.floor((lon - delta_lon + 180.0) / self.cell_degrees))
+        last_column = int(math.floor((lon + delta_lon + 180.0) / self.cell_degrees))
+
+        # Split column ranges that cross the antimeridian
+        if last_column - first_column + 1 >= columns:
+            column_ranges = [(0, columns - 1)]
+        elif first_column < 0:
+            column_ranges = [(first_column % columns, columns - 1), (0, last_column)]
+        elif last_column >= columns:
+            column_ranges = [(first_column, columns - 1), (0, last_column % columns)]
+        else:
+            column_ranges = [(first_column, last_column)]
+
+        slices = []
+        for row in range(first_row, last_row + 1):
+            for low, high in column_ranges:
+                start = np.searchsorted(self.keys, row * columns + low, side="left")
+                end = np.searchsorted(self.keys, row * columns + high, side="right")
+                if end > start:
+                    slices.append(np.arange(start, end))
+        return np.concatenate(slices) if slices else np.zeros(0, dtype=np.int64)
+
+    def radius(self, lat: float, lon: float, radius_km: float) -> List[Tuple[int, float]]:
+        """(position, distance_km) of every POI within radius_km, nearest first"""
+        if not self.loaded or len(self) == 0:
+            return []
+        positions = self._candidates(lat, lon, radius_km)
+        if len(positions) == 0:
+            return []
+        distances = haversine_km(lat, lon, self.coords[positions, 0], self.coords[positions, 1])
+        inside = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances)
+        return [(int(positions[i]), float(distances[i])) for i in order]
+
+    def nearest(self, lat: float, lon: float, count: int, max_km: float) -> List[Tuple[int, float]]:
+        """Up to ``count`` nearest POIs within max_km, growing the search area ring by ring"""
+        if not self.loaded or len(self) == 0:
+            return []
+        search_km = min(self.cell_degrees * KM_PER_DEGREE, max_km)
+        while True:
+            found = self.radius(lat, lon, search_km)
+            if len(found) >= count or search_km >= max_km:
+                return found[:count]
+            search_km = min(search_km * 2, max_km)
+
+# Importers
+
+def _centroid(coordinates) -> Optional[Tuple[float, float]]:
+    """Mean (lat, lon) of any GeoJSON coordinate nesting"""
+    points = []
+
+    def collect(value):
+        if value and isinstance(value[0], (int, float)):
+            points.append(value)
+        else:
+            for item in value:
+                collect(item)
+
+    collect(coordinates)
+    if not points:
+        return None
+    return sum(p[1] for p in points) / len(points), sum(p[0] for p in points) / len(points)
+
+def read_geojson(path: str) -> Iterable[Tuple[float, float, str, Dict[str, str]]]:
+    """POIs from a GeoJSON export (osmium export, overpass turbo, ogr2ogr)"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for feature in data.get("features", []):
+        properties = feature.get("properties") or {}
+        tags = properties.get("tags") if isinstance(properties.get("tags"), dict) else properties
+        tags = {str(k): str(v) for k, v in tags.items() if v is not None}
+        geometry = feature.get("geometry") or {}
+        centroid = _centroid(geometry.get("coordinates") or [])
+        if centroid is None:
+            continue
+        osm_id = str(feature.get("id") or properties.get("@id") or properties.get("id") or f"{centroid[0]:.6f},{centroid[1]:.6f}")
+        yield centroid[0], centroid[1], osm_id, tags
+
+def read_pbf(path: str) -> Iterable[Tuple[float, float, str, Dict[str, str]]]:
+    """POIs from an .osm.pbf extract; needs the optional pyosmium package"""
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Reading .pbf extracts requires pyosmium (pip install osmium); or convert to GeoJSON first")
+
+    pois = []
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, node):
+            tags = {tag.k: tag.v for tag in node.tags}
+            if poi_type(tags) and node.location.valid():
+                pois.append((node.location.lat, node.location.lon, f"node/{node.id}", tags))
+
+        def way(self, way):
+            tags = {tag.k: tag.v for tag in way.tags}
+            if not poi_type(tags):
+                return
+            locations = [n.location for n in way.nodes if n.location.valid()]
+            if locations:
+                pois.append((
+                    sum(l.lat for l in locations) / len(locations),
+                    sum(l.lon for l in locations) / len(locations),
+                    f"way/{way.id}",
+                    tags
+                ))
+
+    Handler().apply_file(path, locations=True)
+    return pois
+
+# Singleton instance (loaded on first use if the index exists)
+rescue_index = RescueIndex(settings.rescue_index_path)
+
+async def fetch_bbox(south: float, west: float, north: float, east: float) -> List[Tuple[float, float, str, Dict[str, str]]]:
+    """Large bbox import through the shared Overpass client (mirror failover, rate limiting)"""
+    from overpass_client import overpass_client
+    try:
+        return await overpass_client.fetch_pois(south, west, north, east, timeout=200)
+    finally:
+        await overpass_client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline rescue-center index")
+    parser.add_argument("--path", default=settings.rescue_index_path)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_file = commands.add_parser("import", help="Build the index from a .geojson or .osm.pbf extract")
+    import_file.add_argument("extract")
+
+    import_overpass = commands.add_parser("import-overpass", help="Build the index from Overpass for a bbox")
+    import_overpass.add_argument("bbox", help="south,west,north,east")
+
+    query = commands.add_parser("query", help="Nearest POIs to a point")
+    query.add_argument("lat", type=float)
+    query.add_argument("lon", type=float)
+    query.add_argument("--count", type=int, default=10)
+    query.add_argument("--max-km", type=float, default=50.0)
+
+    args = parser.parse_args()
+    index = RescueIndex(args.path)
+
+    if args.command == "import":
+        reader = read_pbf if args.extract.endswith(".pbf") else read_geojson
+        index.build(reader(args.extract), source=os.path.basename(args.extract))
+    elif args.command == "import-overpass":
+        south, west, north, east = (float(value) for value in args.bbox.split(","))
+        index.build(asyncio.run(fetch_bbox(south, west, north, east)), source=f"overpass:{args.bbox}")
+    else:
+        if not index.load():
+            sys.exit(f"No rescue index at {args.path}")
+        started = time.perf_counter()
+        found = index.nearest(args.lat, args.lon, args.count, args.max_km)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for position, distance in found:
+            record = index.record(position)
+            print(f"{distance:7.2f} km  {record['type']:<13} {record['name']}")
+        print(f"{len(found)} results in {elapsed_ms:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+class ResponseCache:
+    """LRU + TTL cache for LLM results with optional on-disk persistence.
+
+    Entries are tagged with a version string (model + prompt template); a
+    persisted file written under a different version is ignored on load.
+    Inside an event loop, changes are batched: the file is rewritten at most
+    once per ``save_delay_seconds``, in a worker thread, and ``flush()``
+    writes what is left on shutdown.
+    """
+
+    def __init__(self, version: str, max_entries: int = 512, ttl_seconds: float = 86400,
+                 persist_path: Optional[str] = None, save_delay_seconds: float = 5.0):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.save_delay_seconds = save_delay_seconds
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+        self._dirty = False
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._write: Optional[asyncio.Future] = None
+        self.saves = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.persist_path:
+            self.load()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, value = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+        if self.persist_path:
+            self.schedule_save()
+
+    def clear(self):
+        self._entries.clear()
+        if self.persist_path:
+            self.schedule_save()
+
+    def schedule_save(self):
+        """Mark the file stale; save now outside an event loop, otherwise after save_delay_seconds"""
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.save_delay_seconds, self._save_in_background)
+
+    def _save_in_background(self):
+        self._save_handle = None
+        if not self._dirty:
+            return
+        loop = asyncio.get_running_loop()
+        if self._write is not None and not self._write.done():
+            # One write at a time; pick up the newer changes afterwards
+            self._save_handle = loop.call_later(self.save_delay_seconds, self._save_in_background)
+            return
+        self._dirty = False
+        self._write = loop.run_in_executor(None, self._write_file, self._snapshot())
+
+    async def flush(self):
+        """Write pending changes now (call on application shutdown)"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._write is not None:
+            await self._write
+        if self._dirty:
+            self.save()
+
+    def load(self):
+        """Load persisted entries, skipping expired ones and other versions"""
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Failed to load response cache: {e}")
+            return
+
+        if data.get("version") != self.version:
+            print(f"Response cache version changed ({data.get('version')} -> {self.version}), starting empty")
+            return
+
+        now = time.time()
+        for key, stored_at, value in data.get("entries", []):
+            if now - stored_at <= self.ttl_seconds:
+                self._entries[key] = (stored_at, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _snapshot(self) -> List[list]:
+        # Values are not mutated after set(), so a shallow copy is safe to serialize off the loop
+        return [[key, stored_at, value] for key, (stored_at, value) in self._entries.items()]
+
+    def _write_file(self, entries: List[list]):
+        """Atomically write entries to disk"""
+        try:
+            directory = os.path.dirname(self.persist_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "entries": entries}, f)
+            os.replace(tmp_path, self.persist_path)
+            self.saves += 1
+        except Exception as e:
+            print(f"Failed to persist response cache: {e}")
+
+    def save(self):
+        """Atomically write all entries to disk now"""
+        self._dirty = False
+        self._write_file(self._snapshot())
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "saves": self.saves,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,537 @@
+"""Optional road-network travel times for ranking rescue centers.
+
+Built from a local OpenStreetMap extract into a CSR adjacency (neighbour
+ids and travel seconds per node) plus ALT landmark distances, all stored as
+memory-mapped NumPy arrays. One A* search from the user settles every
+candidate clinic at once, guided by the landmark lower bounds, and stops at
+a fixed time budget so it can sit on the SOS path. Searches are CPU-bound,
+so the SOS agent runs them in worker threads rather than on the event loop.
+
+    python road_routing.py import region-roads.geojson   # or region.osm.pbf (needs pyosmium)
+    python road_routing.py query 12.97 77.59 12.93 77.62
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+import numpy as np
+from config import settings
+from geo_cache import geohash_encode
+from rescue_index import haversine_km, EARTH_RADIUS_KM, KM_PER_DEGREE
+
+GRAPH_VERSION = 1
+# Stored instead of inf for landmark pairs with no route, so lower bounds stay finite
+UNREACHABLE_SECONDS = 1e9
+
+# Free-flow speeds (km/h) for highway=* values that carry vehicles
+SPEEDS_KMH = {
+    "motorway": 100, "motorway_link": 60,
+    "trunk": 80, "trunk_link": 50,
+    "primary": 60, "primary_link": 40,
+    "secondary": 50, "secondary_link": 35,
+    "tertiary": 40, "tertiary_link": 30,
+    "unclassified": 30, "residential": 25,
+    "living_street": 10, "service": 15,
+    "road": 30, "track": 15
+}
+
+# Ways one may only drive along in their drawing direction unless tagged otherwise
+IMPLIED_ONEWAY = {"motorway", "motorway_link"}
+
+RoadWay = Tuple[List[Tuple[float, float]], Dict[str, str]]
+
+def way_speed_kmh(tags: Dict[str, str]) -> Optional[float]:
+    """Travel speed for a way, or None if it is not drivable"""
+    highway = tags.get("highway")
+    if highway not in SPEEDS_KMH:
+        return None
+    speed = float(SPEEDS_KMH[highway])
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", tags.get("maxspeed", ""))
+    if match:
+        limit = float(match.group(1)) * (1.609 if match.group(2) else 1.0)
+        # Posted limits are rarely reached in town, so never go above the class speed
+        speed = min(speed, limit) if limit > 0 else speed
+    return speed
+
+def way_directions(tags: Dict[str, str]) -> Tuple[bool, bool]:
+    """(forward allowed, backward allowed) along the way's node order"""
+    oneway = tags.get("oneway", "")
+    if oneway == "-1":
+        return False, True
+    if oneway in ("yes", "true", "1") or tags.get("junction") == "roundabout":
+        return True, False
+    if oneway == "no":
+        return True, True
+    return True, tags.get("highway") not in IMPLIED_ONEWAY
+
+def segment_lengths_km(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle length of each consecutive pair of points along a line"""
+    lat1, lat2 = np.radians(lats[:-1]), np.radians(lats[1:])
+    delta_lon = np.radians(lons[1:] - lons[:-1])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def dijkstra_all(offsets: np.ndarray, targets: np.ndarray, weights: np.ndarray, source: int) -> np.ndarray:
+    """Seconds from ``source`` to every node (inf where unreachable); used when building landmarks"""
+    offsets, targets, weights = offsets.tolist(), targets.tolist(), weights.tolist()
+    dist = [math.inf] * (len(offsets) - 1)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > dist[node]:
+            continue
+        for i in range(offsets[node], offsets[node + 1]):
+            candidate = d + weights[i]
+            neighbour = targets[i]
+            if candidate < dist[neighbour]:
+                dist[neighbour] = candidate
+                heapq.heappush(heap, (candidate, neighbour))
+    return np.asarray(dist, dtype=np.float64)
+
+def to_csr(node_count: int, sources: np.ndarray, destinations: np.ndarray,
+           seconds: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CSR arrays (offsets, targets, weights), keeping the fastest of parallel edges"""
+    order = np.lexsort((seconds, destinations, sources))
+    sources, destinations, seconds = sources[order], destinations[order], seconds[order]
+    keep = np.ones(len(sources), dtype=bool)
+    keep[1:] = (sources[1:] != sources[:-1]) | (destinations[1:] != destinations[:-1])
+    sources, destinations, seconds = sources[keep], destinations[keep], seconds[keep]
+
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(sources, minlength=node_count))
+    return offsets, destinations.astype(np.int32), seconds.astype(np.float32)
+
+class RoadGraph:
+    """Directed road graph in CSR form with ALT (A*, landmarks, triangle inequality) data.
+
+    ``landmarks_from[v, l]`` is the travel time from landmark l to v and
+    ``landmarks_to[v, l]`` from v to l; by the triangle inequality they give
+    a lower bound on the time between any two nodes, which keeps the A*
+    search pointed at the candidates instead of flooding the whole city.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest: Dict[str, Any] = {}
+        self.offsets: Optional[np.ndarray] = None
+        self.targets: Optional[np.ndarray] = None
+        self.weights: Optional[np.ndarray] = None
+        self.coords: Optional[np.ndarray] = None
+        self.landmarks_from: Optional[np.ndarray] = None
+        self.landmarks_to: Optional[np.ndarray] = None
+        self.snap_keys: Optional[np.ndarray] = None
+        self.snap_nodes: Optional[np.ndarray] = None
+        self.snap_cell_degrees = settings.routing_snap_cell_degrees
+
+        # Origin tile -> {target node: seconds (inf if unreachable)}
+        self._cache: "OrderedDict[str, Dict[int, float]]" = OrderedDict()
+        # Guards the cache and counters; searches from several threads run unlocked
+        self._lock = threading.Lock()
+
+        self.queries = 0
+        self.cache_hits = 0
+        self.searches = 0
+        self.budget_exhausted = 0
+        self.total_search_ms = 0.0
+        self.total_settled = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.offsets is not None
+
+    def __len__(self) -> int:
+        return 0 if self.offsets is None else len(self.offsets) - 1
+
+    # Snapping
+
+    def _snap_columns(self) -> int:
+        return int(math.ceil(360.0 / self.snap_cell_degrees))
+
+    def _snap_row(self, lat) -> np.ndarray:
+        return np.floor((np.asarray(lat) + 90.0) / self.snap_cell_degrees).astype(np.int64)
+
+    def _snap_column(self, lon) -> np.ndarray:
+        return np.floor((np.asarray(lon) + 180.0) / self.snap_cell_degrees).astype(np.int64)
+
+    def _snap_keys(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        return self._snap_row(lats) * self._snap_columns() + self._snap_column(lons)
+
+    def snap(self, lat: float, lon: float) -> Optional[int]:
+        """Nearest graph node within routing_max_snap_km, or None"""
+        max_km = settings.routing_max_snap_km
+        delta_lat = max_km / KM_PER_DEGREE
+        delta_lon = max_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        columns = self._snap_columns()
+        first_column, last_column = int(self._snap_column(lon - delta_lon)), int(self._snap_column(lon + delta_lon))
+
+        # Road extracts are regional, so the column range never needs to wrap
+        slices = []
+        for row in range(int(self._snap_row(lat - delta_lat)), int(self._snap_row(lat + delta_lat)) + 1):
+            start = np.searchsorted(self.snap_keys, row * columns + first_column, side="left")
+            end = np.searchsorted(self.snap_keys, row * columns + last_column, side="right")
+            if end > start:
+                slices.append(self.snap_nodes[start:end])
+        if not slices:
+            return None
+        nodes = np.concatenate(slices)
+        distances = haversine_km(lat, lon, self.coords[nodes, 0], self.coords[nodes, 1])
+        best = int(np.argmin(distances))
+        return int(nodes[best]) if distances[best] <= max_km else None
+
+    # Building
+
+    def build(self, ways: Iterable[RoadWay], source: str, landmark_count: int = None):
+        """Write the graph from (coordinates, tags) ways, replacing any existing one"""
+        landmark_count = landmark_count or settings.routing_landmarks
+        node_ids: Dict[Tuple[float, float], int] = {}
+        lats, lons = [], []
+        sources, destinations, seconds = [], [], []
+
+        for coordinates, tags in ways:
+            speed = way_speed_kmh(tags)
+            if speed is None or len(coordinates) < 2:
+                continue
+            forward, backward = way_directions(tags)
+            ids = []
+            for lat, lon in coordinates:
+                # Ways share a node where they share a coordinate
+                key = (round(lat, 7), round(lon, 7))
+                node = node_ids.get(key)
+                if node is None:
+                    node = node_ids[key] = len(lats)
+                    lats.append(lat)
+                    lons.append(lon)
+                ids.append(node)
+
+            lengths = segment_lengths_km(np.array([point[0] for point in coordinates]),
+                                         np.array([point[1] for point in coordinates]))
+            travel = (lengths / speed * 3600.0).tolist()
+            for i in range(len(ids) - 1):
+                if ids[i] == ids[i + 1]:
+                    continue
+                if forward:
+                    sources.append(ids[i])
+                    destinations.append(ids[i + 1])
+                    seconds.append(travel[i])
+                if backward:
+                    sources.append(ids[i + 1])
+                    destinations.append(ids[i])
+                    seconds.append(travel[i])
+
+        node_count = len(lats)
+        if node_count == 0:
+            raise ValueError("No drivable roads in the extract")
+        sources = np.asarray(sources, dtype=np.int64)
+        destinations = np.asarray(destinations, dtype=np.int64)
+        seconds = np.asarray(seconds, dtype=np.float64)
+        offsets, targets, weights = to_csr(node_count, sources, destinations, seconds)
+        reverse_offsets, reverse_targets, reverse_weights = to_csr(node_count, destinations, sources, seconds)
+
+        # Landmarks by farthest-point selection: each new one is the node worst
+        # served by the landmarks so far, which spreads them around the edge of the map
+        print(f"Road graph: {node_count} nodes, {len(targets)} edges; choosing {landmark_count} landmarks")
+        landmarks: List[int] = []
+        from_columns, to_columns = [], []
+        reach = dijkstra_all(offsets, targets, weights, 0)
+        coverage = np.where(np.isfinite(reach), reach, -1.0)
+        for _ in range(min(landmark_count, node_count)):
+            landmark = int(np.argmax(coverage))
+            if landmark in landmarks:
+                break
+            landmarks.append(landmark)
+            from_landmark = dijkstra_all(offsets, targets, weights, landmark)
+            to_landmark = dijkstra_all(reverse_offsets, reverse_targets, reverse_weights, landmark)
+            from_columns.append(np.minimum(from_landmark, UNREACHABLE_SECONDS))
+            to_columns.append(np.minimum(to_landmark, UNREACHABLE_SECONDS))
+            distance = np.where(np.isfinite(from_landmark), from_landmark, -1.0)
+            coverage = distance if len(landmarks) == 1 else np.minimum(coverage, distance)
+
+        coords = np.stack([np.asarray(lats), np.asarray(lons)], axis=1)
+        snap_keys = self._snap_keys(coords[:, 0], coords[:, 1])
+        snap_nodes = np.argsort(snap_keys, kind="stable").astype(np.int32)
+
+        manifest = {
+            "version": GRAPH_VERSION,
+            "nodes": node_count,
+            "edges": int(len(targets)),
+            "landmarks": landmarks,
+            "snap_cell_degrees": self.snap_cell_degrees,
+            "source": source,
+            "built_at": int(time.time()),
+            "bbox": [float(coords[:, 0].min()), float(coords[:, 1].min()),
+                     float(coords[:, 0].max()), float(coords[:, 1].max())]
+        }
+
+        # Write into a temporary directory and swap it in, so readers never see a partial graph
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp_path, "targets.npy"), targets)
+        np.save(os.path.join(tmp_path, "weights.npy"), weights)
+        np.save(os.path.join(tmp_path, "coords.npy"), coords)
+        np.save(os.path.join(tmp_path, "landmarks_from.npy"), np.stack(from_columns, axis=1).astype(np.float32))
+        np.save(os.path.join(tmp_path, "landmarks_to.npy"), np.stack(to_columns, axis=1).astype(np.float32))
+        np.save(os.path.join(tmp_path, "snap_keys.npy"), snap_keys[snap_nodes])
+        np.save(os.path.join(tmp_path, "snap_nodes.npy"), snap_nodes)
+        with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        if os.path.isdir(self.path):
+            old_path = f"{self.path}.old"
+            os.replace(self.path, old_path)
+            os.replace(tmp_path, self.path)
+            for name in os.listdir(old_path):
+                os.remove(os.path.join(old_path, name))
+            os.rmdir(old_path)
+        else:
+            os.replace(tmp_path, self.path)
+
+        print(f"Road graph written to {self.path}")
+        self.load()
+
+    # Loading and querying
+
+    def load(self) -> bool:
+        try:
+            with open(os.path.join(self.path, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        if manifest.get("version") != GRAPH_VERSION:
+            print(f"Road graph at {self.path} has an old format; re-import it")
+            return False
+
+        self.manifest = manifest
+        self.snap_cell_degrees = manifest["snap_cell_degrees"]
+        for name in ("offsets", "targets", "weights", "coords", "landmarks_from", "landmarks_to", "snap_keys", "snap_nodes"):
+            # Plain ndarray views of the mapping: still zero-copy, without np.memmap's per-index overhead
+            setattr(self, name, np.asarray(np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")))
+        with self._lock:
+            self._cache.clear()
+        return True
+
+    def covers(self, lat: float, lon: float) -> bool:
+        bbox = self.manifest.get("bbox")
+        if not self.loaded or not bbox:
+            return False
+        south, west, north, east = bbox
+        return south <= lat <= north and west <= lon <= east
+
+    def search(self, origin: int, goals: List[int], budget_seconds: float) -> Dict[int, float]:
+        """Multi-target A*: seconds to each goal (inf if unreachable within the travel limit).
+
+        The heuristic is the ALT lower bound to the nearest goal, which is
+        consistent, so every goal is exact when it is settled. Goals still
+        open when the time budget runs out are left out of the result.
+        """
+        started = time.perf_counter()
+        goal_from = np.asarray(self.landmarks_from[goals], dtype=np.float64)
+        goal_to = np.asarray(self.landmarks_to[goals], dtype=np.float64)
+        landmarks_from, landmarks_to = self.landmarks_from, self.landmarks_to
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        max_seconds = settings.routing_max_travel_seconds
+
+        def heuristics(nodes: List[int]) -> List[float]:
+            # Best landmark bound per goal, then the nearest goal; one array op per expansion
+            node_from = landmarks_from[nodes][:, None, :]
+            node_to = landmarks_to[nodes][:, None, :]
+            bounds = np.maximum(goal_from[None] - node_from, node_to - goal_to[None])
+            return np.maximum(bounds.max(axis=2).min(axis=1), 0.0).tolist()
+
+        open_goals = set(goals)
+        result: Dict[int, float] = {}
+        dist = {origin: 0.0}
+        estimates: Dict[int, float] = {origin: heuristics([origin])[0]}
+        settled = set()
+        heap = [(estimates[origin], 0.0, origin)]
+        pops = 0
+        exhausted = False
+
+        while heap and open_goals:
+            estimate, d, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if estimate > max_seconds:
+                break
+            settled.add(node)
+            if node in open_goals:
+                open_goals.discard(node)
+                result[node] = d
+
+            pops += 1
+            if pops % 128 == 0 and time.perf_counter() - started > budget_seconds:
+                exhausted = True
+                break
+
+            start, end = int(offsets[node]), int(offsets[node + 1])
+            improved = []
+            for neighbour, weight in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                candidate = d + weight
+                if neighbour not in settled and candidate < dist.get(neighbour, math.inf):
+                    dist[neighbour] = candidate
+                    improved.append(neighbour)
+            unseen = [neighbour for neighbour in improved if neighbour not in estimates]
+            if unseen:
+                estimates.update(zip(unseen, heuristics(unseen)))
+            for neighbour in improved:
+                heapq.heappush(heap, (dist[neighbour] + estimates[neighbour], dist[neighbour], neighbour))
+
+        if not exhausted:
+            # The search ran dry or passed the travel limit: the rest are out of reach
+            for goal in open_goals:
+                result[goal] = math.inf
+
+        with self._lock:
+            if exhausted:
+                self.budget_exhausted += 1
+            self.searches += 1
+            self.total_settled += len(settled)
+            self.total_search_ms += (time.perf_counter() - started) * 1000
+        return result
+
+    def travel_times(self, lat: float, lon: float, destinations: List[Tuple[float, float]],
+                     budget_ms: float = None) -> List[Optional[float]]:
+        """Driving seconds from a point to each destination; None where unknown or unreachable.
+
+        Results are cached per origin tile (geohash at routing_tile_precision),
+        so SOS reports from the same street share one search. Safe to call
+        from several threads at once.
+        """
+        with self._lock:
+            self.queries += 1
+        budget_seconds = (settings.routing_budget_ms if budget_ms is None else budget_ms) / 1000
+        if not self.loaded or not destinations:
+            return [None] * len(destinations)
+        origin = self.snap(lat, lon)
+        if origin is None:
+            return [None] * len(destinations)
+
+        goal_nodes = [self.snap(dest_lat, dest_lon) for dest_lat, dest_lon in destinations]
+        tile = geohash_encode(lat, lon, settings.routing_tile_precision)
+        with self._lock:
+            cached = self._cache.get(tile)
+            if cached is not None:
+                self._cache.move_to_end(tile)
+            known = dict(cached or {})
+            missing = sorted({node for node in goal_nodes if node is not None and node not in known})
+            if not missing:
+                self.cache_hits += 1
+
+        if missing:
+            found = self.search(origin, missing, budget_seconds)
+            known.update(found)
+            with self._lock:
+                # Another thread may have replaced or evicted the tile meanwhile; merge into whatever is there now
+                self._cache.setdefault(tile, {}).update(found)
+                self._cache.move_to_end(tile)
+                while len(self._cache) > settings.routing_cache_tiles:
+                    self._cache.popitem(last=False)
+
+        times = []
+        for node in goal_nodes:
+            seconds = known.get(node) if node is not None else None
+            times.append(seconds if seconds is not None and math.isfinite(seconds) else None)
+        return times
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "nodes": len(self),
+            "queries": self.queries,
+            "cache_hits": self.cache_hits,
+            "cached_tiles": len(self._cache),
+            "searches": self.searches,
+            "budget_exhausted": self.budget_exhausted,
+            "avg_search_ms": round(self.total_search_ms / self.searches, 2) if self.searches else 0.0,
+            "avg_settled": round(self.total_settled / self.searches, 1) if self.searches else 0.0
+        }
+
+# Importers
+
+def read_geojson_roads(path: str) -> Iterable[RoadWay]:
+    """Drivable ways from a GeoJSON export (LineString and MultiLineString features)"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for feature in data.get("features", []):
+        properties = feature.get("properties") or {}
+        tags = properties.get("tags") if isinstance(properties.get("tags"), dict) else properties
+        tags = {str(k): str(v) for k, v in tags.items() if v is not None}
+        if tags.get("highway") not in SPEEDS_KMH:
+            continue
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "LineString":
+            lines = [geometry.get("coordinates") or []]
+        elif geometry.get("type") == "MultiLineString":
+            lines = geometry.get("coordinates") or []
+        else:
+            continue
+        for line in lines:
+            yield [(point[1], point[0]) for point in line], tags
+
+def read_pbf_roads(path: str) -> Iterable[RoadWay]:
+    """Drivable ways from an .osm.pbf extract; needs the optional pyosmium package"""
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Reading .pbf extracts requires pyosmium (pip install osmium); or convert to GeoJSON first")
+
+    ways = []
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, way):
+            tags = {tag.k: tag.v for tag in way.tags}
+            if tags.get("highway") not in SPEEDS_KMH:
+                return
+            coordinates = [(n.location.lat, n.location.lon) for n in way.nodes if n.location.valid()]
+            if len(coordinates) >= 2:
+                ways.append((coordinates, tags))
+
+    Handler().apply_file(path, locations=True)
+    return ways
+
+# Singleton instance (loaded on first use if the graph exists)
+road_graph = RoadGraph(settings.routing_graph_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Road graph for travel-time ranking")
+    parser.add_argument("--path", default=settings.routing_graph_path)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_file = commands.add_parser("import", help="Build the graph from a .geojson or .osm.pbf extract")
+    import_file.add_argument("extract")
+    import_file.add_argument("--landmarks", type=int, default=settings.routing_landmarks)
+
+    query = commands.add_parser("query", help="Travel time between two points")
+    query.add_argument("lat", type=float)
+    query.add_argument("lon", type=float)
+    query.add_argument("to_lat", type=float)
+    query.add_argument("to_lon", type=float)
+
+    args = parser.parse_args()
+    graph = RoadGraph(args.path)
+
+    if args.command == "import":
+        reader = read_pbf_roads if args.extract.endswith(".pbf") else read_geojson_roads
+        graph.build(reader(args.extract), source=os.path.basename(args.extract), landmark_count=args.landmarks)
+    else:
+        if not graph.load():
+            sys.exit(f"No road graph at {args.path}")
+        started = time.perf_counter()
+        seconds = graph.travel_times(args.lat, args.lon, [(args.to_lat, args.to_lon)])[0]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if seconds is None:
+            print(f"No route found ({elapsed_ms:.2f} ms)")
+        else:
+            print(f"{seconds / 60:.1f} min by road ({elapsed_ms:.2f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -1,96 +1,211 @@
-import requests
-import aiohttp
-from typing import List, Optional, Dict
+import asyncio
+import uuid
+from typing import List, Optional, Dict, Tuple, Callable, AsyncIterator, TypeVar
 from models import SOSRequest, SOSResponse, RescueCenter, Severity
 from config import settings
-from geopy.geocoders import Nominatim
+from deadline import Deadline
 from geopy.distance import geodesic
+from rescue_index import rescue_index, poi_from_tags, haversine_km, haversine_matrix_km, ADDRESS_PLACEHOLDER
+from overpass_client import overpass_client
+from geo_cache import GeoTileCache, POI, geohash_encode
+from notification_outbox import notification_outbox
+from road_routing import road_graph
+from geocoder import reverse_geocoder
 import json
+import numpy as np
+
+# Haversine (sphere) vs geodesic (ellipsoid) distances differ by at most ~0.5%
+HAVERSINE_ERROR = 0.005
+# Extra candidates refined with geodesic in case the two orders disagree near the cut-off
+RANKING_SLACK = 5
+
+# Builds a RescueCenter from (candidate index, geodesic km, minutes by road)
+CenterFactory = Callable[[int, float, Optional[float]], RescueCenter]
+
+T = TypeVar("T")
 
 class SOSRescueAgent:
     def __init__(self):
-        self.nominatim_base_url = settings.nominatim_base_url
-        self.nominatim_email = settings.nominatim_email
-        self.geolocator = Nominatim(user_agent=self.nominatim_email)
-        
         # Search radius in kilometers
         self.search_radius = 10  # 10km
         self.max_results = 10
+        
+        # Offline index of vets and shelters; Overpass is only used where it has no coverage
+        self.rescue_index = rescue_index
+        if self.rescue_index.load():
+            print(f"Rescue index loaded: {len(self.rescue_index)} POIs ({self.rescue_index.manifest.get('source')})")
+        self.tile_cache = GeoTileCache()
+        
+        # Optional road graph: ranks the nearest centers by driving time instead of distance
+        self.road_graph = road_graph
+        if self.road_graph.load():
+            print(f"Road graph loaded: {len(self.road_graph)} nodes ({self.road_graph.manifest.get('source')})")
+        
+        # Reverse geocoding (cached, rate limited) for the SOS location and centers without an address
+        self.geocoder = reverse_geocoder if settings.geocoder_enabled else None
+        
+        # Notifications are written to the outbox and delivered in the background
+        self.outbox = notification_outbox
+        self.outbox.register_channel("whatsapp", self.send_notification)
+        self.outbox.register_channel("email", self.send_email)
     
-    async def find_rescue_centers(self, latitude: float, longitude: float) -> List[RescueCenter]:
-        """Find nearby veterinary clinics using OpenStreetMap/Nominatim (FREE)"""
+    def find_indexed_centers(self, latitude: float, longitude: float) -> List[RescueCenter]:
+        """Nearest rescue centers from the offline index (empty if the area is not covered)"""
+        if not self.rescue_index.covers(latitude, longitude):
+            return []
+        
+        found = self.rescue_index.nearest(latitude, longitude, self.candidate_count() + RANKING_SLACK,
+                                          self.search_radius * (1 + HAVERSINE_ERROR))
+        lats, lons, make_center = self.index_candidates([position for position, _ in found])
+        return [make_center(*ranked) for ranked in self.order_candidates(latitude, longitude, lats, lons)]
+    
+    def index_candidates(self, positions: List[int]) -> Tuple[np.ndarray, np.ndarray, CenterFactory]:
+        """Coordinates of indexed POIs and a factory for their RescueCenter models"""
+        positions = np.array(positions, dtype=np.int64)
+        lats = self.rescue_index.coords[positions, 0]
+        lons = self.rescue_index.coords[positions, 1]
+        
+        def make_center(i: int, distance: float, minutes: Optional[float]) -> RescueCenter:
+            record = self.rescue_index.record(int(positions[i]))
+            return RescueCenter(
+                name=record["name"],
+                address=record["address"],
+                phone=record["phone"],
+                distance_km=round(distance, 2),
+                latitude=float(lats[i]),
+                longitude=float(lons[i]),
+                place_id=record["id"],
+                rating=None,
+                type=record["type"],
+                travel_time_minutes=minutes
+            )
+        return lats, lons, make_center
+    
+    def poi_candidates(self, pois: List[POI]) -> Tuple[np.ndarray, np.ndarray, CenterFactory]:
+        """Coordinates of Overpass POIs and a factory for their RescueCenter models"""
+        lats = np.fromiter((poi[0] for poi in pois), dtype=np.float64, count=len(pois))
+        lons = np.fromiter((poi[1] for poi in pois), dtype=np.float64, count=len(pois))
+        
+        def make_center(i: int, distance: float, minutes: Optional[float]) -> RescueCenter:
+            elem_lat, elem_lon, osm_id, tags = pois[i]
+            poi = poi_from_tags(tags)
+            return RescueCenter(
+                name=poi["name"],
+                address=poi["address"],
+                phone=poi["phone"],
+                distance_km=round(distance, 2),
+                latitude=elem_lat,
+                longitude=elem_lon,
+                place_id=osm_id,
+                rating=None,
+                type=poi["type"],
+                travel_time_minutes=minutes
+            )
+        return lats, lons, make_center
+    
+    async def fetch_overpass_pois(self, south: float, west: float, north: float, east: float) -> List[POI]:
+        """Vets and shelters in a bounding box from Overpass (hedged across the configured mirrors)"""
+        return await overpass_client.fetch_pois(south, west, north, east)
+    
+    def candidate_count(self) -> int:
+        """How many nearest centers to shortlist: more when travel time may reorder them"""
+        if self.road_graph.loaded:
+            return max(settings.routing_candidates, self.max_results)
+        return self.max_results
+    
+    def select_nearest(self, latitude: float, longitude: float, lats: np.ndarray, lons: np.ndarray,
+                       count: Optional[int] = None, distances: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """(candidate index, geodesic km) of the nearest candidates within the search radius.
+        
+        Haversine distances for all candidates are one array operation and a
+        partial sort picks a shortlist; only the shortlist gets the exact (and
+        much slower) geodesic distance. The shortlist has some slack because
+        the spherical and ellipsoidal orders can differ by a fraction of a percent.
+        ``distances`` may pass in this point's precomputed row of a distance matrix.
+        """
+        if len(lats) == 0:
+            return []
+        
+        if distances is None:
+            distances = haversine_km(latitude, longitude, lats, lons)
+        inside = np.flatnonzero(distances <= self.search_radius * (1 + HAVERSINE_ERROR))
+        count = count or self.max_results
+        shortlist_size = min(count + RANKING_SLACK, len(inside))
+        if shortlist_size < len(inside):
+            inside = inside[np.argpartition(distances[inside], shortlist_size - 1)[:shortlist_size]]
+        
+        user_location = (latitude, longitude)
+        refined = []
+        for i in inside:
+            distance = geodesic(user_location, (float(lats[i]), float(lons[i]))).kilometers
+            if distance <= self.search_radius:
+                refined.append((int(i), distance))
+        
+        # Sort by distance
+        refined.sort(key=lambda item: item[1])
+        return refined[:count]
+    
+    def order_candidates(self, latitude: float, longitude: float, lats: np.ndarray, lons: np.ndarray,
+                         distances: Optional[np.ndarray] = None,
+                         routing_deadline: Optional[Deadline] = None) -> List[Tuple[int, float, Optional[float]]]:
+        """(candidate index, geodesic km, minutes by road) of the best centers, best first.
+        
+        Without road coverage this is the distance order. With it, the nearest
+        ``candidate_count`` centers get travel times from one multi-target
+        search and are ordered by them; any the search could not reach within
+        its budget follow in distance order. ``routing_deadline`` caps the
+        search budget when several reports share one (bulk SOS); once it has
+        run out, reports keep the distance order.
         
-        rescue_centers = []
+        The search is CPU-bound, so async callers run this through
+        ``rank_off_loop`` rather than on the event loop.
+        """
+        budget_ms = settings.routing_budget_ms
+        if routing_deadline is not None:
+            budget_ms = min(budget_ms, routing_deadline.remaining() * 1000)
+        if budget_ms <= 0 or not self.road_graph.covers(latitude, longitude):
+            return [(i, distance, None) for i, distance in self.select_nearest(latitude, longitude, lats, lons, distances=distances)]
         
-        # Search queries for OpenStreetMap
-        search_queries = [
-            "veterinary clinic",
-            "animal hospital",
-            "vet clinic",
-            "animal shelter",
-            "animal rescue"
+        nearest = self.select_nearest(latitude, longitude, lats, lons, self.candidate_count(), distances)
+        seconds = self.road_graph.travel_times(
+            latitude, longitude, [(float(lats[i]), float(lons[i])) for i, _ in nearest], budget_ms
+        )
+        ranked = sorted(zip(nearest, seconds), key=lambda item: (item[1] is None, item[1] if item[1] is not None else item[0][1]))
+        return [
+            (i, distance, round(travel / 60, 1) if travel is not None else None)
+            for (i, distance), travel in ranked[:self.max_results]
         ]
+    
+    async def rank_off_loop(self, rank: Callable[..., T], *args) -> T:
+        """Run a ranking function in a worker thread when it may route, so road searches
+        do not hold up other requests; plain distance ranking is quick enough to run inline"""
+        if self.road_graph.loaded:
+            return await asyncio.to_thread(rank, *args)
+        return rank(*args)
+    
+    def rank_centers(self, latitude: float, longitude: float, pois: List[POI]) -> List[RescueCenter]:
+        """Best POIs within the search radius; models are only built for the winners"""
+        if not pois:
+            return []
+        
+        lats, lons, make_center = self.poi_candidates(pois)
+        return [make_center(*ranked) for ranked in self.order_candidates(latitude, longitude, lats, lons)]
+    
+    async def find_rescue_centers(self, latitude: float, longitude: float) -> List[RescueCenter]:
+        """Find nearby veterinary clinics and shelters using OpenStreetMap (FREE)"""
+        
+        # Local index first: answers in milliseconds without touching the network
+        rescue_centers = await self.rank_off_loop(self.find_indexed_centers, latitude, longitude)
+        if rescue_centers:
+            return rescue_centers
         
         try:
-            user_location = (latitude, longitude)
-            
-            # Use Overpass API (OpenStreetMap) to find nearby veterinary services
-            overpass_url = "http://overpass-api.de/api/interpreter"
-            
-            # Build Overpass query
-            radius_meters = self.search_radius * 1000
-            query = f"""
-            [out:json];
-            (
-              node["amenity"="veterinary"](around:{radius_meters},{latitude},{longitude});
-              node["healthcare"="veterinary"](around:{radius_meters},{latitude},{longitude});
-              way["amenity"="veterinary"](around:{radius_meters},{latitude},{longitude});
-              way["healthcare"="veterinary"](around:{radius_meters},{latitude},{longitude});
-            );
-            out center;
-            """
-            
-            response = requests.post(overpass_url, data={"data": query}, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                for element in data.get("elements", [])[:self.max_results]:
-                    tags = element.get("tags", {})
-                    
-                    # Get coordinates
-                    if element["type"] == "node":
-                        elem_lat = element["lat"]
-                        elem_lon = element["lon"]
-                    elif "center" in element:
-                        elem_lat = element["center"]["lat"]
-                        elem_lon = element["center"]["lon"]
-                    else:
-                        continue
-                    
-                    # Calculate distance
-                    place_location = (elem_lat, elem_lon)
-                    distance = geodesic(user_location, place_location).kilometers
-                    
-                    center = RescueCenter(
-                        name=tags.get("name", "Veterinary Clinic"),
-                        address=tags.get("addr:street", "Address available on contact"),
-                        phone=tags.get("phone", tags.get("contact:phone", "Call for details")),
-                        distance_km=round(distance, 2),
-                        latitude=elem_lat,
-                        longitude=elem_lon,
-                        place_id=str(element.get("id", "")),
-                        rating=None,
-                        type="vet"
-                    )
-                    
-                    rescue_centers.append(center)
-            
-            # Sort by distance
-            rescue_centers.sort(key=lambda x: x.distance_km)
+            # Overpass results are cached per geohash tile, so nearby SOS requests reuse them
+            pois = await self.tile_cache.get_pois(latitude, longitude, self.search_radius, self.fetch_overpass_pois)
+            rescue_centers = await self.rank_off_loop(self.rank_centers, latitude, longitude, pois)
             
             if len(rescue_centers) > 0:
-                return rescue_centers[:self.max_results]
+                return rescue_centers
             else:
                 return self.get_fallback_centers()
         
@@ -98,6 +213,69 @@ class SOSRescueAgent:
             print(f"Error finding rescue centers: {e}")
             return self.get_fallback_centers()
     
+    def group_reports(self, requests: List[SOSRequest]) -> List[List[int]]:
+        """Report indices grouped by region (geohash cell) and by whether the offline index covers them"""
+        groups: Dict[Tuple[bool, str], List[int]] = {}
+        for i, request in enumerate(requests):
+            lat, lng = request.location['lat'], request.location['lng']
+            key = (self.rescue_index.covers(lat, lng), geohash_encode(lat, lng, settings.sos_batch_region_precision))
+            groups.setdefault(key, []).append(i)
+        return list(groups.values())
+    
+    def group_circle(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[float, float, float]:
+        """(lat, lon, radius km) of a circle holding every report's search radius"""
+        center_lat, center_lon = float(lats.mean()), float(lons.mean())
+        spread = float(haversine_km(center_lat, center_lon, lats, lons).max())
+        return center_lat, center_lon, spread + self.search_radius * (1 + HAVERSINE_ERROR)
+    
+    def assign_centers(self, lats: np.ndarray, lons: np.ndarray, candidate_lats: np.ndarray,
+                       candidate_lons: np.ndarray, make_center: CenterFactory,
+                       routing_deadline: Optional[Deadline] = None) -> List[List[RescueCenter]]:
+        """Best centers for each report, from one reports x candidates distance matrix"""
+        if len(candidate_lats) == 0:
+            return [[] for _ in range(len(lats))]
+        matrix = haversine_matrix_km(lats, lons, candidate_lats, candidate_lons)
+        return [
+            [make_center(*ranked) for ranked in self.order_candidates(
+                float(lats[r]), float(lons[r]), candidate_lats, candidate_lons, matrix[r], routing_deadline
+            )]
+            for r in range(len(lats))
+        ]
+    
+    async def find_group_centers(self, lats: np.ndarray, lons: np.ndarray,
+                                 routing_deadline: Optional[Deadline] = None) -> List[List[RescueCenter]]:
+        """Rescue centers for a group of nearby reports with one spatial query for the whole group.
+        
+        Like find_rescue_centers, the offline index is used where it covers
+        the area and Overpass (through the tile cache, as one bounding box)
+        for the reports it has nothing for. Ranking runs off the event loop
+        and stops routing once ``routing_deadline`` (shared by the batch) passes.
+        """
+        results: List[List[RescueCenter]] = [[] for _ in range(len(lats))]
+        if all(self.rescue_index.covers(float(lat), float(lon)) for lat, lon in zip(lats, lons)):
+            center_lat, center_lon, radius = self.group_circle(lats, lons)
+            found = self.rescue_index.radius(center_lat, center_lon, radius)
+            candidate_lats, candidate_lons, make_center = self.index_candidates([position for position, _ in found])
+            results = await self.rank_off_loop(
+                self.assign_centers, lats, lons, candidate_lats, candidate_lons, make_center, routing_deadline
+            )
+        
+        missing = [r for r, centers in enumerate(results) if not centers]
+        if missing:
+            try:
+                center_lat, center_lon, radius = self.group_circle(lats[missing], lons[missing])
+                pois = await self.tile_cache.get_pois(center_lat, center_lon, radius, self.fetch_overpass_pois)
+                candidate_lats, candidate_lons, make_center = self.poi_candidates(pois)
+                assigned = await self.rank_off_loop(
+                    self.assign_centers, lats[missing], lons[missing], candidate_lats, candidate_lons,
+                    make_center, routing_deadline
+                )
+                for r, centers in zip(missing, assigned):
+                    results[r] = centers
+            except Exception as e:
+                print(f"Error finding rescue centers for batch group: {e}")
+        
+        return [centers or self.get_fallback_centers() for centers in results]
     
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two coordinates using Haversine formula (in km)"""
@@ -142,14 +320,40 @@ class SOSRescueAgent:
             )
         ]
     
-    def create_sos_message(self, request: SOSRequest, rescue_centers: List[RescueCenter]) -> str:
+    def start_location_lookup(self, request: SOSRequest) -> Optional[asyncio.Future]:
+        """Begin reverse-geocoding the SOS location (None when geocoding is disabled)"""
+        if self.geocoder is None:
+            return None
+        return self.geocoder.lookup(request.location['lat'], request.location['lng'])
+    
+    async def resolve_addresses(self, rescue_centers: List[RescueCenter],
+                                location_lookup: Optional[asyncio.Future]) -> Optional[str]:
+        """Address of the SOS location, filling in listed centers that have only the placeholder.
+        
+        Waits at most geocoder_sos_budget_seconds; what is not known by then
+        is left as is (and cached for the next SOS from the area).
+        """
+        if self.geocoder is None:
+            return None
+        missing = [center for center in rescue_centers[:settings.geocoder_max_centers]
+                   if center.address == ADDRESS_PLACEHOLDER]
+        lookups = [self.geocoder.lookup(center.latitude, center.longitude) for center in missing]
+        addresses = await self.geocoder.resolve([location_lookup] + lookups, settings.geocoder_sos_budget_seconds)
+        for center, address in zip(missing, addresses[1:]):
+            if address:
+                center.address = address
+        return addresses[0]
+    
+    def create_sos_message(self, request: SOSRequest, rescue_centers: List[RescueCenter],
+                           location_address: Optional[str] = None) -> str:
         """Create formatted SOS message"""
         
+        address_line = f"\nAddress: {location_address}" if location_address else ""
         message = f"""🚨 ANIMAL EMERGENCY ALERT 🚨
 
 CONDITION: {request.condition_summary}
 
-LOCATION:
+LOCATION:{address_line}
 Latitude: {request.location['lat']}
 Longitude: {request.location['lng']}
 📍 Google Maps: https://www.google.com/maps?q={request.location['lat']},{request.location['lng']}
@@ -165,6 +369,8 @@ NEAREST RESCUE CENTERS:
             if center.phone:
                 message += f"\n   ☎️  {center.phone}"
             message += f"\n   📏 {center.distance_km} km away"
+            if center.travel_time_minutes is not None:
+                message += f"\n   🚗 ~{center.travel_time_minutes:.0f} min by road"
             if center.rating:
                 message += f"\n   ⭐ {center.rating}/5"
             message += "\n"
@@ -174,14 +380,13 @@ NEAREST RESCUE CENTERS:
         
         return message
     
-    async def send_notification(self, phone_number: str, email: str, message: str) -> bool:
+    async def send_notification(self, phone_number: str, subject: Optional[str], message: str) -> bool:
         """Log SOS notification (WhatsApp requires paid API, so we log locally)"""
         try:
             print("\n" + "="*60)
             print("🚨 SOS NOTIFICATION 🚨")
             print("="*60)
             print(f"Contact Phone: {phone_number}")
-            print(f"Contact Email: {email}")
             print(f"\nMessage:\n{message}")
             print("="*60 + "\n")
             return True
@@ -189,7 +394,7 @@ NEAREST RESCUE CENTERS:
             print(f"Notification error: {e}")
             return False
     
-    async def send_email(self, to_email: str, subject: str, message: str) -> bool:
+    async def send_email(self, to_email: str, subject: Optional[str], message: str) -> bool:
         """Send email notification (requires SMTP configuration)"""
         # Note: This requires additional SMTP configuration
         # For production, use services like SendGrid, AWS SES, etc.
@@ -202,58 +407,126 @@ NEAREST RESCUE CENTERS:
             print(f"Email error: {e}")
             return False
     
+    def queue_notifications(self, sos_id: str, request: SOSRequest, sos_message: str) -> List[str]:
+        """Record one outbox entry per contact channel; returns the recipients queued"""
+        queued = []
+        if request.contact_whatsapp:
+            self.outbox.enqueue(sos_id, "whatsapp", request.contact_whatsapp, sos_message)
+            queued.append(f"Phone: {request.contact_whatsapp}")
+        if request.contact_email:
+            self.outbox.enqueue(sos_id, "email", request.contact_email, sos_message,
+                                subject="🚨 Animal emergency alert")
+            queued.append(f"Email: {request.contact_email}")
+        return queued
+    
+    async def dispatch(self, request: SOSRequest, rescue_centers: List[RescueCenter],
+                       location_lookup: Optional[asyncio.Future] = None) -> SOSResponse:
+        """Build the SOS message for found rescue centers and queue its notifications.
+        
+        ``location_lookup`` is the SOS location's address lookup when the
+        caller started it earlier (alongside the rescue-center search);
+        center addresses are looked up at the same time.
+        """
+        if location_lookup is None:
+            location_lookup = self.start_location_lookup(request)
+        location_address = await self.resolve_addresses(rescue_centers, location_lookup)
+        
+        # Create SOS message
+        sos_message = self.create_sos_message(request, rescue_centers, location_address)
+        sos_id = uuid.uuid4().hex
+        
+        # Queue notifications; delivery happens in the background and is
+        # reported by /sos/{sos_id}/status, so no channel delays this response
+        recipients_contacted = []
+        message_sent = False
+        try:
+            recipients_contacted = self.queue_notifications(sos_id, request, sos_message)
+            message_sent = len(recipients_contacted) > 0
+        except Exception as e:
+            print(f"Notification outbox error: {e}")
+        
+        # Try to contact rescue centers directly
+        for center in rescue_centers[:3]:
+            if center.phone:
+                recipients_contacted.append(f"Rescue Center: {center.name} - {center.phone}")
+        
+        return SOSResponse(
+            message_sent=message_sent or len(recipients_contacted) > 0,
+            rescue_centers=rescue_centers,
+            sos_message=sos_message,
+            recipients_contacted=recipients_contacted,
+            error=None if message_sent else "Unable to send automated messages. Please contact rescue centers manually.",
+            # Nothing to poll for when no notification was queued
+            sos_id=sos_id if message_sent else None,
+            location_address=location_address
+        )
+    
+    def failed_response(self, request: SOSRequest, error: Exception) -> SOSResponse:
+        print(f"SOS activation error: {error}")
+        return SOSResponse(
+            message_sent=False,
+            rescue_centers=self.get_fallback_centers(),
+            sos_message=f"Emergency: {request.condition_summary}",
+            recipients_contacted=[],
+            error=str(error)
+        )
+    
     async def activate_sos(self, request: SOSRequest) -> SOSResponse:
         """Activate SOS rescue protocol"""
         try:
+            # The user's address is looked up while rescue centers are searched
+            location_lookup = self.start_location_lookup(request)
+            
             # Find nearby rescue centers
             rescue_centers = await self.find_rescue_centers(
                 request.location['lat'],
                 request.location['lng']
             )
-            
-            # Create SOS message
-            sos_message = self.create_sos_message(request, rescue_centers)
-            
-            # Track contacted recipients
-            recipients_contacted = []
-            message_sent = False
-            
-            # Send notification (logged to console)
-            if request.contact_whatsapp or request.contact_email:
-                notified = await self.send_notification(
-                    request.contact_whatsapp or "N/A",
-                    request.contact_email or "N/A",
-                    sos_message
-                )
-                if notified:
-                    if request.contact_whatsapp:
-                        recipients_contacted.append(f"Phone: {request.contact_whatsapp}")
-                    if request.contact_email:
-                        recipients_contacted.append(f"Email: {request.contact_email}")
-                    message_sent = True
-            
-            # Try to contact rescue centers directly
-            for center in rescue_centers[:3]:
-                if center.phone:
-                    recipients_contacted.append(f"Rescue Center: {center.name} - {center.phone}")
-            
-            return SOSResponse(
-                message_sent=message_sent or len(recipients_contacted) > 0,
-                rescue_centers=rescue_centers,
-                sos_message=sos_message,
-                recipients_contacted=recipients_contacted,
-                error=None if message_sent else "Unable to send automated messages. Please contact rescue centers manually."
-            )
+            return await self.dispatch(request, rescue_centers, location_lookup)
         
         except Exception as e:
-            print(f"SOS activation error: {e}")
-            return SOSResponse(
-                message_sent=False,
-                rescue_centers=self.get_fallback_centers(),
-                sos_message=f"Emergency: {request.condition_summary}",
-                recipients_contacted=[],
-                error=str(e)
-            )
+            return self.failed_response(request, e)
+    
+    async def activate_sos_batch(self, requests: List[SOSRequest]) -> AsyncIterator[Tuple[int, SOSResponse]]:
+        """(report index, response) for many SOS reports, yielded as each region's lookup completes.
+        
+        Reports are grouped by region so a mass incident costs one spatial
+        query per region instead of one per report. Road routing for the whole
+        batch shares one sos_batch_routing_budget_ms; reports ranked after it
+        runs out keep the distance order.
+        """
+        routing_deadline = Deadline(settings.sos_batch_routing_budget_ms / 1000)
+        
+        async def dispatch_report(i: int, rescue_centers: List[RescueCenter],
+                                  location_lookup: Optional[asyncio.Future]) -> Tuple[int, SOSResponse]:
+            try:
+                return i, await self.dispatch(requests[i], rescue_centers, location_lookup)
+            except Exception as e:
+                return i, self.failed_response(requests[i], e)
+        
+        async def run_group(indices: List[int]) -> List[Tuple[int, SOSResponse]]:
+            lookups = [self.start_location_lookup(requests[i]) for i in indices]
+            lats = np.array([requests[i].location['lat'] for i in indices], dtype=np.float64)
+            lons = np.array([requests[i].location['lng'] for i in indices], dtype=np.float64)
+            try:
+                group_centers = await self.find_group_centers(lats, lons, routing_deadline)
+            except Exception as e:
+                return [(i, self.failed_response(requests[i], e)) for i in indices]
+            
+            return await asyncio.gather(*(
+                dispatch_report(i, rescue_centers, lookup)
+                for i, rescue_centers, lookup in zip(indices, group_centers, lookups)
+            ))
+        
+        tasks = [asyncio.ensure_future(run_group(indices)) for indices in self.group_reports(requests)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for item in await finished:
+                    yield item
+        finally:
+            # The client went away: stop groups that have not finished
+            for task in tasks:
+                task.cancel()
 
 # Singleton instance
 sos_agent = SOSRescueAgent()
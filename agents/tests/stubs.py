@@ -0,0 +1,26 @@
+"""Local aiohttp stub servers for client tests"""
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import AsyncIterator, Callable, Awaitable, List
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+@asynccontextmanager
+async def stub_server(routes: dict) -> AsyncIterator[str]:
+    """Serve {(method, path): handler} on a free local port; yields the base URL"""
+    app = web.Application()
+    for (method, path), handler in routes.items():
+        app.router.add_route(method, path, handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        yield str(server.make_url("")).rstrip("/")
+    finally:
+        await server.close()
+
+@asynccontextmanager
+async def stub_servers(route_sets: List[dict]) -> AsyncIterator[List[str]]:
+    """Several stub servers at once; yields their base URLs in order"""
+    async with AsyncExitStack() as exits:
+        yield [await exits.enter_async_context(stub_server(routes)) for routes in route_sets]
@@ -0,0 +1,122 @@
+import time
+import pytest
+from models import (
+    VisionAnalysisResult, MedicalAssessment, NutritionPlan, HealthIssue,
+    Species, EmotionalState, Severity
+)
+from analysis_store import AnalysisStore, AnalysisNotFound
+
+VISION = VisionAnalysisResult(
+    species=Species.DOG,
+    species_confidence=0.9,
+    emotional_state=EmotionalState.NEUTRAL,
+    emotion_confidence=0.8,
+    health_issues=[HealthIssue(issue="Wound", confidence=0.8, description="Cut on the left leg.")],
+    raw_detections=[]
+)
+
+def assessment(severity: Severity, summary: str) -> MedicalAssessment:
+    return MedicalAssessment(
+        severity=severity,
+        condition_summary=summary,
+        immediate_actions=[],
+        care_instructions=[],
+        warning_signs=[],
+        estimated_urgency_hours=12 if severity == Severity.URGENT else None
+    )
+
+MEDICAL = assessment(Severity.LOW, "Minor cut.")
+NEWER_MEDICAL = assessment(Severity.URGENT, "Deep cut, bleeding.")
+PLAN = NutritionPlan(
+    recommended_foods=["Boiled chicken"],
+    dangerous_foods=["Chocolate"],
+    hydration_plan="Fresh water at all times",
+    feeding_schedule="Twice a day",
+    special_considerations=[]
+)
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    path = str(tmp_path / "analysis_store.db") if request.param == "sqlite" else None
+    store = AnalysisStore(max_entries=2, ttl_seconds=60, path=path)
+    yield store
+    store.close()
+
+def test_round_trip(store):
+    analysis_id = store.create(VISION, MEDICAL, "limping", PLAN)
+    stored = store.get(analysis_id)
+    assert (stored.vision, stored.medical, stored.user_notes, stored.nutrition) == (VISION, MEDICAL, "limping", PLAN)
+
+def test_unknown_id(store):
+    with pytest.raises(AnalysisNotFound):
+        store.get("missing")
+
+def test_ttl_expiry(store):
+    analysis_id = store.create(VISION)
+    store.ttl_seconds = 0.01
+    time.sleep(0.02)
+    with pytest.raises(AnalysisNotFound):
+        store.get(analysis_id)
+    assert store.get_metrics()["entries"] == 0
+
+def test_lru_eviction(store):
+    first = store.create(VISION)
+    second = store.create(VISION)
+    third = store.create(VISION)
+    with pytest.raises(AnalysisNotFound):
+        store.get(first)
+    assert store.get(second) and store.get(third)
+    assert store.get_metrics()["evictions"] == 1
+
+def test_new_assessment_clears_plan(store):
+    analysis_id = store.create(VISION, MEDICAL, None, PLAN)
+    store.update(store.get(analysis_id), medical=NEWER_MEDICAL, user_notes="bleeding")
+    stored = store.get(analysis_id)
+    assert stored.medical == NEWER_MEDICAL and stored.nutrition is None
+
+def test_same_assessment_keeps_plan(store):
+    analysis_id = store.create(VISION, MEDICAL, None, PLAN)
+    store.update(store.get(analysis_id), medical=MEDICAL, user_notes=None)
+    assert store.get(analysis_id).nutrition == PLAN
+
+def test_medical_for_matches_notes(store):
+    stored = store.get(store.create(VISION, MEDICAL, "limping"))
+    assert stored.medical_for(None) == MEDICAL
+    assert stored.medical_for("limping") == MEDICAL
+    assert stored.medical_for("not eating") is None
+    assert store.get(store.create(VISION)).medical_for(None) is None
+
+def test_reload_from_disk(tmp_path):
+    path = str(tmp_path / "analysis_store.db")
+    writer = AnalysisStore(path=path)
+    analysis_id = writer.create(VISION, MEDICAL, "limping")
+    writer.update(writer.get(analysis_id), nutrition=PLAN)
+    writer.close()
+
+    stored = AnalysisStore(path=path).get(analysis_id)
+    assert (stored.vision, stored.medical, stored.user_notes, stored.nutrition) == (VISION, MEDICAL, "limping", PLAN)
+
+def test_workers_see_each_others_updates(tmp_path):
+    path = str(tmp_path / "analysis_store.db")
+    worker_a, worker_b = AnalysisStore(path=path), AnalysisStore(path=path)
+    analysis_id = worker_a.create(VISION, MEDICAL)
+    stale = worker_a.get(analysis_id)
+
+    # Worker B reassesses and plans; worker A must read that, not its earlier copy
+    worker_b.update(worker_b.get(analysis_id), medical=NEWER_MEDICAL, user_notes="bleeding")
+    worker_b.update(worker_b.get(analysis_id), nutrition=PLAN)
+    stored = worker_a.get(analysis_id)
+    assert (stored.medical, stored.nutrition) == (NEWER_MEDICAL, PLAN)
+
+    # A plan made from the superseded assessment must not overwrite B's
+    worker_a.update(stale, nutrition=NutritionPlan(**{**PLAN.model_dump(), "feeding_schedule": "Once a day"}))
+    stored = worker_b.get(analysis_id)
+    assert (stored.medical, stored.nutrition) == (NEWER_MEDICAL, PLAN)
+
+def test_expired_rows_count_as_evictions(tmp_path):
+    store = AnalysisStore(ttl_seconds=60, path=str(tmp_path / "analysis_store.db"))
+    store.create(VISION)
+    store.ttl_seconds = 0.01
+    time.sleep(0.02)
+    store.create(VISION)
+    assert store.get_metrics()["entries"] == 1 and store.get_metrics()["evictions"] == 1
@@ -0,0 +1,57 @@
+import asyncio
+import aiohttp
+from aiohttp import web
+from llm_backends import LLMBackendPool
+from stubs import stub_server
+
+def tags_handler(models):
+    async def handler(request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": name, "model": name} for name in models]})
+    return handler
+
+def check(models, prepare) -> LLMBackendPool:
+    """Run one health check against a stub listing ``models`` after ``prepare(pool)``"""
+    async def run():
+        async with stub_server({("GET", "/api/tags"): tags_handler(models)}) as url:
+            pool = LLMBackendPool([url], eject_after_failures=3, eject_seconds=30, model="llama2")
+            prepare(pool)
+            async with aiohttp.ClientSession() as session:
+                await pool.check_health(session)
+            return pool
+    return asyncio.run(run())
+
+def test_serves_model_matches_default_tag():
+    pool = LLMBackendPool(["http://localhost:1"], model="llama2")
+    assert pool.serves_model({"models": [{"name": "llama2:latest"}]})
+    assert pool.serves_model({"models": [{"name": "llama2"}]})
+    assert not pool.serves_model({"models": [{"name": "llama2:13b"}, {"name": "mistral:latest"}]})
+    assert not pool.serves_model({})
+
+def test_missing_model_ejects():
+    pool = check(["mistral:latest"], lambda pool: None)
+    assert not pool.backends[0].available
+
+def test_passing_probe_keeps_request_failures():
+    def fail_twice(pool):
+        for _ in range(2):
+            pool.record_failure(pool.backends[0])
+    pool = check(["llama2:latest"], fail_twice)
+    backend = pool.backends[0]
+    assert backend.consecutive_failures == 2
+    # The third failed generation still ejects it
+    pool.record_failure(backend)
+    assert not backend.available
+
+def test_passing_probe_does_not_cut_ejection_short():
+    pool = check(["llama2:latest"], lambda pool: pool.eject(pool.backends[0]))
+    assert not pool.backends[0].available
+
+def test_passing_probe_readmits_after_cooldown():
+    def expired_ejection(pool):
+        backend = pool.backends[0]
+        for _ in range(3):
+            pool.record_failure(backend)
+        backend.ejected_until -= pool.eject_seconds
+    pool = check(["llama2:latest"], expired_ejection)
+    backend = pool.backends[0]
+    assert backend.available and backend.ejected_until == 0.0 and backend.consecutive_failures == 0
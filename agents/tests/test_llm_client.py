@@ -0,0 +1,46 @@
+import pytest
+from circuit_breaker import CLOSED, OPEN, HALF_OPEN
+from llm_client import OllamaClient
+
+@pytest.fixture
+def client():
+    client = OllamaClient()
+    client.breaker.failure_threshold = 3
+    client.pool.eject_after_failures = 100  # Keep the single backend in rotation
+    return client
+
+def record(client: OllamaClient, status: int, times: int = 1):
+    backend = client.pool.choose()
+    for _ in range(times):
+        client.record_status(backend, status, 0.1)
+
+@pytest.mark.parametrize("status", [404, 429, 500, 503])
+def test_persistent_errors_open_the_breaker(client, status):
+    record(client, status, 3)
+    assert client.breaker.state == OPEN
+
+@pytest.mark.parametrize("status", [400, 413, 422])
+def test_other_client_errors_neither_fail_nor_succeed(client, status):
+    record(client, 500, 2)
+    record(client, status, 5)
+    assert client.breaker.state == CLOSED
+    # Not a success either: the earlier failures still count
+    record(client, 500)
+    assert client.breaker.state == OPEN
+
+def test_success_resets_failures(client):
+    record(client, 500, 2)
+    record(client, 200)
+    record(client, 500, 2)
+    assert client.breaker.state == CLOSED
+
+@pytest.mark.parametrize("status,state", [(200, CLOSED), (404, OPEN), (429, OPEN), (400, HALF_OPEN)])
+def test_half_open_probe_outcome(client, status, state):
+    record(client, 500, 3)
+    client.breaker.opened_at -= client.breaker.open_seconds
+    assert client.breaker.allow_request()
+    record(client, status)
+    assert client.breaker.state == state
+    if state == HALF_OPEN:
+        # The probe slot was given back, so the next call may probe
+        assert client.breaker.allow_request()
@@ -0,0 +1,54 @@
+import pytest
+from models import VisionAnalysisResult, HealthIssue, Species, EmotionalState, Severity
+from medical_rules import RULES, medical_rule_engine
+
+LOW, URGENT = Severity.LOW, Severity.URGENT
+
+# Issue text per category and the severity expected at each band edge; None means
+# the case is left to the LLM. Significant issues need confidence above 0.55.
+BAND_EDGES = {
+    "mange": ("Mange", [(0.56, LOW), (0.699, LOW), (0.70, None), (0.799, None), (0.80, URGENT), (1.0, URGENT)]),
+    "skin_infection": ("Ringworm", [(0.56, LOW), (0.699, LOW), (0.70, None), (0.799, None), (0.80, URGENT), (1.0, URGENT)]),
+    "dermatitis": ("Allergic dermatitis", [(0.56, LOW), (0.799, LOW), (0.80, None), (0.849, None), (0.85, URGENT), (1.0, URGENT)]),
+    "eye_infection": ("Conjunctivitis", [(0.56, LOW), (0.699, LOW), (0.70, None), (0.799, None), (0.80, URGENT), (1.0, URGENT)]),
+    "eye_inflammation": ("Eye inflammation", [(0.56, LOW), (0.799, LOW), (0.80, None), (0.849, None), (0.85, URGENT), (1.0, URGENT)]),
+    "cataracts": ("Cataracts", [(0.56, LOW), (0.85, LOW), (1.0, LOW)]),
+    "dehydration": ("Dehydration", [(0.56, LOW), (0.699, LOW), (0.70, None), (0.799, None), (0.80, URGENT), (1.0, URGENT)]),
+    "wound": ("Wound", [(0.56, LOW), (0.649, LOW), (0.65, None), (0.70, None), (0.709, None), (0.71, URGENT), (1.0, URGENT)]),
+    "malnutrition": ("Malnutrition", [(0.56, LOW), (0.699, LOW), (0.70, None), (0.799, None), (0.80, URGENT), (1.0, URGENT)]),
+    "infection": ("Infection", [(0.56, LOW), (0.649, LOW), (0.65, None), (0.70, None), (0.709, None), (0.71, URGENT), (1.0, URGENT)])
+}
+
+def vision(issue: str, confidence: float) -> VisionAnalysisResult:
+    return VisionAnalysisResult(
+        species=Species.DOG,
+        species_confidence=0.9,
+        emotional_state=EmotionalState.NEUTRAL,
+        emotion_confidence=0.8,
+        health_issues=[HealthIssue(issue=issue, confidence=confidence, description="Detected in image.")],
+        raw_detections=[]
+    )
+
+def test_table_covers_every_category():
+    assert set(BAND_EDGES) == {rule.category for rule in RULES}
+
+@pytest.mark.parametrize(
+    "category,issue,confidence,expected",
+    [(category, issue, confidence, expected)
+     for category, (issue, edges) in BAND_EDGES.items()
+     for confidence, expected in edges]
+)
+def test_band_edges(category, issue, confidence, expected):
+    assert medical_rule_engine.categorize(HealthIssue(issue=issue, confidence=confidence, description="")) == category
+    assessment = medical_rule_engine.assess(vision(issue, confidence))
+    if expected is None:
+        assert assessment is None
+    else:
+        assert assessment is not None and assessment.severity == expected
+
+@pytest.mark.parametrize("rule", RULES, ids=lambda rule: rule.category)
+def test_urgent_bands_start_above_fallback_threshold(rule):
+    # generate_fallback_response needs confidence above 0.70 for URGENT
+    for band in rule.bands:
+        if band.severity == URGENT:
+            assert band.min_confidence > 0.70
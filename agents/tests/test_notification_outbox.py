@@ -0,0 +1,120 @@
+import asyncio
+import time
+import pytest
+from config import settings
+from models import SOSRequest
+from notification_outbox import NotificationOutbox
+from sos_agent import sos_agent
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "notification_retry_base_seconds", 0.02)
+    monkeypatch.setattr(settings, "notification_retry_max_seconds", 0.05)
+    monkeypatch.setattr(settings, "notification_poll_seconds", 0.05)
+    monkeypatch.setattr(settings, "notification_send_timeout_seconds", 0.2)
+
+@pytest.fixture
+def outbox(tmp_path):
+    return NotificationOutbox(str(tmp_path / "outbox.db"), workers=2, max_attempts=3)
+
+def sender(outcomes, calls):
+    """Sender that plays back ``outcomes`` (True, False, an exception or "hang") in order"""
+    async def send(recipient, subject, message):
+        outcome = outcomes[min(len(calls), len(outcomes) - 1)]
+        calls.append(recipient)
+        if outcome == "hang":
+            await asyncio.sleep(10)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return send
+
+async def run_until_settled(outbox, sos_id, seconds=3.0):
+    outbox.start()
+    try:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            rows = outbox.status(sos_id)
+            if rows and all(row["status"] in ("delivered", "failed") for row in rows):
+                return rows
+            await asyncio.sleep(0.01)
+        return outbox.status(sos_id)
+    finally:
+        await outbox.stop()
+
+def test_flaky_channel_is_retried_until_delivered(outbox):
+    calls = []
+    outbox.register_channel("whatsapp", sender([False, ConnectionError("reset"), True], calls))
+
+    async def run():
+        outbox.enqueue("sos-1", "whatsapp", "+911234567890", "help")
+        return await run_until_settled(outbox, "sos-1")
+    [row] = asyncio.run(run())
+
+    assert row["status"] == "delivered" and row["attempts"] == 3 and row["last_error"] is None
+    assert len(calls) == 3
+    assert outbox.retries == 2 and outbox.delivered == 1
+
+def test_gives_up_after_max_attempts(outbox):
+    calls = []
+    outbox.register_channel("email", sender(["hang"], calls))
+
+    async def run():
+        outbox.enqueue("sos-2", "email", "vet@example.com", "help", subject="SOS")
+        return await run_until_settled(outbox, "sos-2")
+    [row] = asyncio.run(run())
+
+    assert row["status"] == "failed" and row["attempts"] == 3 and row["last_error"] == "timed out"
+    assert len(calls) == 3 and outbox.failed == 1
+
+def test_backoff_is_jittered_and_capped(outbox):
+    for attempts in range(1, 6):
+        ceiling = min(0.02 * 2 ** (attempts - 1), 0.05)
+        for _ in range(20):
+            assert ceiling / 2 <= outbox.backoff(attempts) <= ceiling
+
+def test_rows_interrupted_mid_send_are_requeued_on_start(outbox, tmp_path):
+    calls = []
+    outbox.register_channel("whatsapp", sender([True], calls))
+    outbox.enqueue("sos-3", "whatsapp", "+911234567890", "help")
+    # A crash after claiming leaves the row 'sending'
+    assert outbox._claim() is not None
+    outbox._conn.close()
+    outbox._conn = None
+
+    restarted = NotificationOutbox(str(tmp_path / "outbox.db"), workers=1, max_attempts=3)
+    restarted.register_channel("whatsapp", sender([True], calls))
+    [row] = asyncio.run(run_until_settled(restarted, "sos-3"))
+    assert row["status"] == "delivered" and calls == ["+911234567890"]
+
+def test_stop_mid_send_returns_the_row(outbox, monkeypatch):
+    calls = []
+    outbox.register_channel("whatsapp", sender(["hang"], calls))
+    monkeypatch.setattr(settings, "notification_send_timeout_seconds", 10.0)
+
+    async def run():
+        outbox.enqueue("sos-4", "whatsapp", "+911234567890", "help")
+        outbox.start()
+        while not calls:
+            await asyncio.sleep(0.01)
+        await outbox.stop()
+    asyncio.run(run())
+
+    [row] = outbox.status("sos-4")
+    assert row["status"] == "pending" and row["attempts"] == 0
+
+def test_sos_without_contacts_has_no_status_id(outbox, monkeypatch):
+    outbox.register_channel("whatsapp", sender([True], []))
+    outbox.register_channel("email", sender([True], []))
+    monkeypatch.setattr(sos_agent, "outbox", outbox)
+    monkeypatch.setattr(sos_agent, "geocoder", None)
+    request = SOSRequest(image_url="http://example.com/dog.jpg", condition_summary="Injured dog",
+                         location={"lat": 12.97, "lng": 77.59})
+
+    response = asyncio.run(sos_agent.dispatch(request, []))
+    assert response.sos_id is None and not response.message_sent
+
+    request.contact_email = "rescuer@example.com"
+    response = asyncio.run(sos_agent.dispatch(request, []))
+    assert response.sos_id is not None
+    assert [row["channel"] for row in outbox.status(response.sos_id)] == ["email"]
@@ -0,0 +1,80 @@
+import asyncio
+import time
+import pytest
+from aiohttp import web
+from overpass_client import OverpassClient, OverpassError
+from rate_limiter import TokenBucket
+from stubs import stub_servers
+
+ELEMENTS = {"elements": [{"type": "node", "id": 1, "lat": 12.97, "lon": 77.59, "tags": {"amenity": "veterinary"}}]}
+
+def mirror(delay: float = 0.0, status: int = 200, body=ELEMENTS, calls: list = None, name: str = ""):
+    async def handler(request: web.Request) -> web.Response:
+        if calls is not None:
+            calls.append(name)
+        await asyncio.sleep(delay)
+        if status != 200:
+            return web.Response(status=status, text="busy")
+        return web.json_response(body)
+    return {("POST", "/api/interpreter"): handler}
+
+def client(urls, hedge_delay=0.1, rate=100.0, burst=10) -> OverpassClient:
+    return OverpassClient(urls, timeout=5, hedge_delay=hedge_delay, rate_limiter=TokenBucket("test", rate, burst))
+
+async def run_query(mirrors, timeout=None, **options):
+    """Start the stub mirrors, query through them in the given order and close up"""
+    async with stub_servers(mirrors) as urls:
+        overpass = client([f"{url}/api/interpreter" for url in urls], **options)
+        try:
+            started = time.perf_counter()
+            result = await overpass.query("[out:json];node(1);out;", timeout)
+            return result, time.perf_counter() - started, overpass
+        finally:
+            await overpass.close()
+
+def test_slow_mirror_is_hedged():
+    calls = []
+    result, elapsed, overpass = asyncio.run(run_query(
+        [mirror(delay=2.0, calls=calls, name="slow"), mirror(calls=calls, name="fast")],
+        hedge_delay=0.1
+    ))
+    assert result == ELEMENTS
+    assert calls == ["slow", "fast"]
+    assert elapsed < 1.0
+    metrics = overpass.get_metrics()
+    assert metrics["hedged"] == 1
+    assert [endpoint["wins"] for endpoint in metrics["endpoints"]] == [0, 1]
+
+def test_rate_limited_mirror_fails_over_at_once():
+    calls = []
+    result, elapsed, overpass = asyncio.run(run_query(
+        [mirror(status=429, calls=calls, name="limited"), mirror(calls=calls, name="ok")],
+        hedge_delay=5.0
+    ))
+    assert result == ELEMENTS
+    assert calls == ["limited", "ok"]
+    # Handed over on the failure, not after the hedge delay
+    assert elapsed < 1.0
+    endpoints = overpass.get_metrics()["endpoints"]
+    assert endpoints[0]["failures"] == 1 and endpoints[1]["wins"] == 1
+
+def test_deadline_raises():
+    with pytest.raises(OverpassError):
+        asyncio.run(run_query([mirror(delay=2.0), mirror(delay=2.0)], timeout=0.3, hedge_delay=0.1))
+
+def test_all_mirrors_failing_raises():
+    with pytest.raises(OverpassError, match="504"):
+        asyncio.run(run_query([mirror(status=504), mirror(status=429)]))
+
+def test_token_bucket_refuses_wait_beyond_timeout():
+    async def run():
+        bucket = TokenBucket("test", rate_per_second=2.0, burst=1)
+        assert await bucket.acquire(timeout=0)
+        # The next token accrues in 0.5 s
+        assert not await bucket.acquire(timeout=0.1)
+        started = time.perf_counter()
+        assert await bucket.acquire(timeout=1.0)
+        return time.perf_counter() - started, bucket.get_metrics()
+    waited, metrics = asyncio.run(run())
+    assert 0.4 < waited < 0.8
+    assert metrics["acquired"] == 2 and metrics["rejected"] == 1
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from deadline import Deadline
+from request_coalescer import SingleFlight
+
+def test_identical_calls_share_one_run():
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        flights = SingleFlight("test")
+        return await asyncio.gather(*(flights.run("key", work) for _ in range(3))), flights
+    results, flights = asyncio.run(run())
+    assert results == ["result"] * 3 and len(runs) == 1
+    assert flights.get_metrics()["coalesced"] == 2
+
+def test_flight_runs_to_the_longest_waiters_deadline():
+    async def pipeline(deadline: Deadline) -> str:
+        # A stage that needs 0.2 s degrades when the budget left is shorter
+        await asyncio.sleep(0.05)
+        if not deadline.allows(0.2):
+            return "fallback"
+        await asyncio.sleep(0.2)
+        return "full"
+
+    async def caller(flights: SingleFlight, deadline: Deadline):
+        try:
+            return await asyncio.wait_for(flights.run("key", lambda: pipeline(deadline), deadline), deadline.remaining())
+        except asyncio.TimeoutError:
+            return "timed out"
+
+    async def run():
+        flights = SingleFlight("test")
+        leader = asyncio.ensure_future(caller(flights, Deadline(0.1)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(caller(flights, Deadline(2.0)))
+        return await leader, await follower
+    assert asyncio.run(run()) == ("timed out", "full")
+
+def test_extend_to_never_shortens():
+    deadline = Deadline(5.0)
+    deadline.extend_to(Deadline(1.0))
+    assert deadline.remaining() > 4.0
+    deadline.extend_to(Deadline(10.0))
+    assert deadline.remaining() == pytest.approx(10.0, abs=0.1)
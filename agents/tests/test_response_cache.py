@@ -0,0 +1,37 @@
+import asyncio
+import json
+from response_cache import ResponseCache
+
+def test_writes_are_batched_inside_the_event_loop(tmp_path):
+    path = str(tmp_path / "cache.json")
+
+    async def run():
+        cache = ResponseCache("v1", persist_path=path, save_delay_seconds=0.05)
+        for i in range(50):
+            cache.set(f"key-{i}", {"severity": "low", "i": i})
+        assert cache.saves == 0
+        await asyncio.sleep(0.15)
+        assert cache.saves == 1
+        cache.set("late", {"severity": "urgent"})
+        await cache.flush()
+        return cache
+    cache = asyncio.run(run())
+
+    assert cache.saves == 2
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)["entries"]) == 51
+    reloaded = ResponseCache("v1", persist_path=path)
+    assert reloaded.get("late") == {"severity": "urgent"} and reloaded.get("key-0") == {"severity": "low", "i": 0}
+
+def test_saves_at_once_outside_an_event_loop(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = ResponseCache("v1", persist_path=path)
+    cache.set("key", "value")
+    assert cache.saves == 1
+    assert ResponseCache("v1", persist_path=path).get("key") == "value"
+    assert ResponseCache("v2", persist_path=path).get("key") is None
+
+def test_flush_without_changes_writes_nothing(tmp_path):
+    cache = ResponseCache("v1", persist_path=str(tmp_path / "cache.json"))
+    asyncio.run(cache.flush())
+    assert cache.saves == 0
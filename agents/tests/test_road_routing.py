@@ -0,0 +1,190 @@
+import asyncio
+import math
+import time
+import numpy as np
+import pytest
+from config import settings
+from geo_cache import GeoTileCache
+from models import SOSRequest
+from road_routing import RoadGraph, dijkstra_all, UNREACHABLE_SECONDS
+from sos_agent import sos_agent
+
+SIZE = 20
+STEP = 0.002  # ~220 m between grid nodes
+SOUTH, WEST = 12.95, 77.58
+# A separate stretch of road east of the grid, with no connection to it
+ISLAND = [(SOUTH + 10 * STEP, WEST + (SIZE - 1) * STEP + 0.01 + i * STEP) for i in range(3)]
+
+def grid_ways():
+    """Grid with mixed road classes and one-way columns, plus the disconnected island"""
+    ways = []
+    for row in range(SIZE):
+        tags = {"highway": "primary" if row % 4 == 0 else "residential"}
+        ways.append(([(SOUTH + row * STEP, WEST + column * STEP) for column in range(SIZE)], tags))
+    for column in range(SIZE):
+        tags = {"highway": "secondary" if column % 5 == 0 else "residential"}
+        if column % 3 == 1:
+            tags["oneway"] = "yes"  # Northbound only
+        ways.append(([(SOUTH + row * STEP, WEST + column * STEP) for row in range(SIZE)], tags))
+    ways.append((ISLAND, {"highway": "residential"}))
+    return ways
+
+# Grid (row, column) of the clinics the stub Overpass returns
+CLINICS = [(2, 3), (5, 16), (9, 9), (14, 4), (17, 15), (12, 18)]
+
+def node_at(graph: RoadGraph, lat: float, lon: float) -> int:
+    node = graph.snap(lat, lon)
+    assert node is not None
+    return node
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "routing_budget_ms", 10_000.0)
+    road_graph = RoadGraph(str(tmp_path / "road_graph"))
+    road_graph.build(grid_ways(), "test grid", landmark_count=4)
+    return road_graph
+
+@pytest.fixture
+def sos_area(graph, monkeypatch):
+    """The SOS agent routing on the grid, with Overpass answering with CLINICS"""
+    async def fetch_clinics(south, west, north, east):
+        return [(SOUTH + row * STEP, WEST + column * STEP, f"node/{i}", {"amenity": "veterinary", "name": f"Clinic {i}"})
+                for i, (row, column) in enumerate(CLINICS)]
+
+    monkeypatch.setattr(sos_agent, "road_graph", graph)
+    monkeypatch.setattr(sos_agent, "geocoder", None)
+    monkeypatch.setattr(sos_agent, "tile_cache", GeoTileCache())
+    monkeypatch.setattr(sos_agent, "fetch_overpass_pois", fetch_clinics)
+    monkeypatch.setattr(sos_agent.rescue_index, "covers", lambda lat, lon: False)
+    return graph
+
+def slow_searches(graph: RoadGraph, monkeypatch, seconds: float):
+    """Make every search hold its thread for a while, like a large graph would"""
+    search = graph.search
+
+    def slow_search(*args):
+        time.sleep(seconds)
+        return search(*args)
+    monkeypatch.setattr(graph, "search", slow_search)
+
+async def longest_stall(work):
+    """Result of work and the longest the event loop went without running a 5 ms ticker meanwhile"""
+    gaps = []
+    done = False
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    task = asyncio.ensure_future(ticker())
+    result = await work
+    done = True
+    await task
+    return result, max(gaps)
+
+def test_search_matches_dijkstra(graph):
+    origin = node_at(graph, SOUTH + 3 * STEP, WEST + 7 * STEP)
+    expected = dijkstra_all(graph.offsets, graph.targets, graph.weights, origin)
+    goals = [node for node in range(len(graph)) if node != origin]
+
+    result = graph.search(origin, goals, budget_seconds=10.0)
+
+    assert set(result) == set(goals)
+    for goal in goals:
+        if math.isfinite(expected[goal]):
+            assert result[goal] == pytest.approx(expected[goal], rel=1e-6)
+        else:
+            assert result[goal] == math.inf
+
+def test_unreachable_landmark_pairs_use_finite_sentinel(graph):
+    island = node_at(graph, *ISLAND[0])
+    # No landmark on the grid reaches the island or is reached from it
+    assert (graph.landmarks_from[island] == UNREACHABLE_SECONDS).all()
+    assert (graph.landmarks_to[island] == UNREACHABLE_SECONDS).all()
+    assert graph.search(node_at(graph, SOUTH, WEST), [island], budget_seconds=10.0) == {island: math.inf}
+
+def test_unreachable_centers_rank_last(graph, monkeypatch):
+    monkeypatch.setattr(sos_agent, "road_graph", graph)
+    user = (SOUTH + 10 * STEP, WEST + (SIZE - 1) * STEP)
+    # The island center is the closest of all, but no road leads there
+    centers = [ISLAND[0], (SOUTH + 10 * STEP, WEST + 2 * STEP), (SOUTH + 12 * STEP, WEST + 15 * STEP)]
+    lats = [lat for lat, _ in centers]
+    lons = [lon for _, lon in centers]
+
+    ranked = sos_agent.order_candidates(*user, np.array(lats), np.array(lons))
+
+    assert [i for i, _, _ in ranked] == [2, 1, 0]
+    assert ranked[-1][2] is None
+    assert all(minutes is not None for _, _, minutes in ranked[:-1])
+
+def test_exhausted_budget_keeps_candidates_in_distance_order(graph, monkeypatch):
+    monkeypatch.setattr(sos_agent, "road_graph", graph)
+    # Too small to finish: the search stops at its first budget check (every 128 settled nodes)
+    monkeypatch.setattr(settings, "routing_budget_ms", 1e-6)
+    user = (SOUTH, WEST)
+    centers = [(SOUTH + row * STEP, WEST + column * STEP)
+               for row, column in [(1, 1), (19, 19), (0, 18), (18, 0), (10, 10), (15, 5), (5, 15)]]
+    lats = np.array([lat for lat, _ in centers])
+    lons = np.array([lon for _, lon in centers])
+
+    ranked = sos_agent.order_candidates(*user, lats, lons)
+
+    assert graph.budget_exhausted == 1
+    assert sorted(i for i, _, _ in ranked) == list(range(len(centers)))
+    timed = [entry for entry in ranked if entry[2] is not None]
+    untimed = [entry for entry in ranked if entry[2] is None]
+    assert untimed, "budget should run out before every center is settled"
+    assert ranked == timed + untimed
+    assert [minutes for _, _, minutes in timed] == sorted(minutes for _, _, minutes in timed)
+    assert [distance for _, distance, _ in untimed] == sorted(distance for _, distance, _ in untimed)
+
+def test_sos_routing_runs_off_the_event_loop(sos_area, monkeypatch):
+    slow_searches(sos_area, monkeypatch, 0.2)
+
+    centers, stall = asyncio.run(longest_stall(sos_agent.find_rescue_centers(SOUTH + 10 * STEP, WEST + 10 * STEP)))
+
+    assert sos_area.searches == 1
+    assert centers and all(center.travel_time_minutes is not None for center in centers)
+    assert stall < 0.1
+
+def batch_reports(cells):
+    return [SOSRequest(image_url="http://example.com/dog.jpg", condition_summary="Injured dog",
+                       location={"lat": SOUTH + row * STEP, "lng": WEST + column * STEP})
+            for row, column in cells]
+
+async def run_batch(requests):
+    return dict([item async for item in sos_agent.activate_sos_batch(requests)])
+
+def test_batch_routes_off_the_event_loop(sos_area, monkeypatch):
+    requests = batch_reports([(1, 1), (6, 12), (10, 10), (15, 2), (18, 17)])
+    expected = [asyncio.run(sos_agent.find_rescue_centers(request.location["lat"], request.location["lng"]))
+                for request in requests]
+    sos_area._cache.clear()
+    slow_searches(sos_area, monkeypatch, 0.05)
+
+    responses, stall = asyncio.run(longest_stall(run_batch(requests)))
+
+    assert [responses[i].rescue_centers for i in range(len(requests))] == expected
+    assert all(center.travel_time_minutes is not None for centers in expected for center in centers)
+    # Five searches back to back take 250 ms; the loop keeps ticking through them
+    assert stall < 0.05
+
+def test_batch_shares_one_routing_budget(sos_area, monkeypatch):
+    monkeypatch.setattr(settings, "sos_batch_routing_budget_ms", 50.0)
+    slow_searches(sos_area, monkeypatch, 0.1)
+    requests = batch_reports([(1, 1), (6, 12), (10, 10), (15, 2), (18, 17)])
+
+    responses = asyncio.run(run_batch(requests))
+
+    # The first search outlasts the batch budget, so the other reports are ranked by distance
+    assert sos_area.searches == 1
+    routed = [i for i, response in responses.items()
+              if any(center.travel_time_minutes is not None for center in response.rescue_centers)]
+    assert routed == [0]
+    for response in responses.values():
+        assert response.rescue_centers
+        assert all(center.place_id.startswith("node/") for center in response.rescue_centers)
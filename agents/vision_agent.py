@@ -11,6 +11,7 @@ from transformers import ViTImageProcessor, ViTForImageClassification
 from skimage.feature import graycomatrix, graycoprops, local_binary_pattern
 from models import VisionAnalysisResult, EmotionalState, HealthIssue, Species
 from config import settings
+from deadline import Deadline, DeadlineExceeded
 
 class VisionAgent:
     def __init__(self):
@@ -55,10 +56,10 @@ class VisionAgent:
             'wounds': ['scratch', 'bite', 'laceration', 'trauma']
         }
     
-    def download_image(self, image_url: str) -> Image.Image:
+    def download_image(self, image_url: str, timeout: float = 10) -> Image.Image:
         """Download image from URL"""
         try:
-            response = requests.get(image_url, timeout=10)
+            response = requests.get(image_url, timeout=timeout)
             response.raise_for_status()
             image = Image.open(BytesIO(response.content))
             return image.convert('RGB')
@@ -664,19 +665,25 @@ class VisionAgent:
         
         return issues
     
-    async def analyze(self, image_url: str) -> VisionAnalysisResult:
-        """Complete vision analysis pipeline"""
+    async def analyze(self, image_url: str, deadline: Optional[Deadline] = None) -> VisionAnalysisResult:
+        """Complete vision analysis pipeline (stops between stages once the deadline passes)"""
         try:
             # Download image
-            image = self.download_image(image_url)
+            image = self.download_image(image_url, deadline.timeout(10) if deadline else 10)
             
             # Detect species
+            if deadline:
+                deadline.check("species detection")
             species, species_conf = self.detect_species(image)
             
             # Analyze emotion
+            if deadline:
+                deadline.check("emotion analysis")
             emotion, emotion_conf = self.analyze_emotion(image)
             
             # Detect health issues
+            if deadline:
+                deadline.check("health issue detection")
             health_issues = self.detect_health_issues(image)
             
             # Get raw detections for reference
@@ -702,6 +709,8 @@ class VisionAgent:
                 raw_detections=raw_detections
             )
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Vision analysis failed: {str(e)}")
 
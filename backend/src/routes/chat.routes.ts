@@ -82,6 +82,7 @@ router.post('/chat', authenticate, async (req: AuthRequest, res: Response): Prom
       message,
       history,
       context: analysisContext,
+      session_id: chatSession ? String(chatSession._id) : undefined,
     });
     
     // Save chat messages if it's an analysis-specific chat
@@ -1,6 +1,9 @@
 import axios from 'axios';
 
 const AGENTS_BASE_URL = process.env.AGENTS_SERVICE_URL || 'http://localhost:8000';
+const AGENTS_TIMEOUT_MS = 60000; // 60 seconds timeout for AI operations
+// Budget the agents service may spend, leaving headroom for the network round trip
+const AGENTS_DEADLINE_MS = AGENTS_TIMEOUT_MS - 3000;
 
 export interface AnalyzeRequestData {
   image_url: string;
@@ -18,6 +21,7 @@ export interface ChatRequestData {
     content: string;
   }>;
   context?: any;
+  session_id?: string;
 }
 
 export interface SOSRequestData {
@@ -37,9 +41,10 @@ class AgentsService {
   constructor() {
     this.axiosInstance = axios.create({
       baseURL: AGENTS_BASE_URL,
-      timeout: 60000, // 60 seconds timeout for AI operations
+      timeout: AGENTS_TIMEOUT_MS,
       headers: {
         'Content-Type': 'application/json',
+        'X-Request-Deadline-Ms': String(AGENTS_DEADLINE_MS),
       },
     });
   }
@@ -68,6 +73,23 @@ class AgentsService {
   
   async chatWithWhisperer(data: ChatRequestData): Promise<any> {
     try {
+      if (data.session_id && data.history.length > 0) {
+        // The agents service keeps the conversation state; only send the new turn
+        try {
+          const response = await this.axiosInstance.post('/chat', {
+            ...data,
+            history: [],
+            history_omitted: true,
+          });
+          return response.data;
+        } catch (error: any) {
+          // Session expired or evicted: resend with the full history to rebuild it
+          if (error.response?.status !== 409) {
+            throw error;
+          }
+        }
+      }
+      
       const response = await this.axiosInstance.post('/chat', data);
       return response.data;
     } catch (error: any) {